@@ -1,76 +1,1273 @@
-import glob
+import argparse
 import os
-import zipfile
 import json
-import transposer
-from tqdm import tqdm
-from score_to_midi import score_to_midi
+import time
+import itertools
+import multiprocessing
+import multiprocessing.connection
+import queue
+import threading
+from functools import partial
+
+try:
+    import resource
+except ImportError: # not available on Windows
+    resource = None
+
+from manifest import Manifest, Quarantine, get_manifest_path, file_hash
+from shards import ShardWriter, ShardReader, merge_datasets
+from discovery import iter_files, parse_shard, shard_path
+from metrics import MetricsLog, get_summary_path, failure_category, peak_rss, output_size, summarize, print_summary
+from corpus_index import CorpusIndex, song_metadata
+from prescan import scan_score, summarize_scans
+from dedup import LSHIndex, fingerprint, get_report_path, write_report
+from score_to_midi import score_to_midi, parse_score, read_score, write_file, UnknownChordError, get_converter_version
 
 input_raw_folder = '../dataset/wikifonia/input/'
 input_xml_folder = '../dataset/wikifonia/input_xml/'
 
-input_folder = input_xml_folder
+# .mxl archives are converted directly, there is no need to extract them first
+input_folder = input_raw_folder
 output_folder = '../dataset/wikifonia/output/'
 
 output_transposed_folder = '../dataset/wikifonia/output_transposed/'
+output_augmented_folder = '../dataset/wikifonia/output_augmented/'
+output_shards_folder = '../dataset/wikifonia/output_shards/'
+output_piano_roll_folder = '../dataset/wikifonia/output_piano_roll/'
+
+# 'midi': one .mid per song in output_folder
+# 'shards': the notes of all the songs in the binary shards of output_shards_folder (see shards.py)
+output_mode = 'midi'
 
 convert_to_xml = False
+# write the C major / A minor version in the same pass as the conversion
 convert_to_transposed = True
 
+# data augmentation: write transposed variants of every song from a single parsing
+convert_to_augmented = False
+augment_steps = list(range(-5, 7)) # half steps, all the 12 keys
+augment_pitch_range = (21, 108) # variants with notes out of this midi range are skipped (piano range)
+
+# skip the files which did not change since the last run (see manifest.py)
+incremental = True
+
+# melody and harmony piano rolls (.npz, see piano_roll.py) written in the same pass as the conversion
+convert_to_piano_roll = False
+piano_roll_resolution = 4 # frames per quarter note
+
+# isolated conversion: every file runs in its own process, killed after file_timeout seconds,
+# with an address space limit of file_memory_limit bytes (None disables the limit)
+# it starts one process per file, use it for corpora with scores which hang or crash the conversion
+isolated = False
+file_timeout = 120
+file_memory_limit = 4 << 30
+# pipelined conversion (when not isolated): the files are read ahead and the out files written
+# by separate threads while the workers parse, at most prefetch files are in the pipeline
+# the documents and the encoded outputs are sent between the processes, it only pays off
+# when reading and writing are slow (e.g. network storage), on a local disk the pool is faster
+pipelined = False
+prefetch = 64
+
+# files that timed out, crashed or ran out of memory, skipped by the next runs while they are unchanged
+quarantine_path = '../dataset/wikifonia/quarantine.json'
+
+# melody part of multi-part scores: 'first', 'harmony' (first part with chords) or 'highest' (highest mean pitch)
+# the harmony comes from the melody part or, if it has no chords, from the first part with chords
+melody_part = 'harmony'
+
+# duplicates, found from the parsed notes before the conversion (see dedup.py):
+# None, 'skip' (only the first file of every group is converted) or 'group' (all are converted and grouped)
+# the groups are written to <output folder>.duplicates.json
+dedup = None
+dedup_threshold = 0.8 # estimated similarity from which two songs are duplicates
+
+# reject the scores using unknown chord kinds with a byte-level scan, before their conversion (see prescan.py),
+# only worth it on corpora with many unknown chords, the other scores are read twice
+prescan = False
+
+# SQLite index of the metadata of the converted songs (see corpus_index.py), None to disable
+index_path = '../dataset/wikifonia/index.sqlite'
+
+# parallel conversion, 1 worker converts the files in the main process
+num_workers = os.cpu_count()
+chunk_size = 16 # number of files sent at once to a worker
+
+# per-file metrics (.jsonl) and run report (.summary.json next to it), see metrics.py
+metrics_path = '../dataset/wikifonia/metrics.jsonl'
+metrics_slowest = 10 # number of slowest files in the report
+
+def progress(iterable, **kwargs):
+    # tqdm is imported on first use, the conversion processes do not need it
+    from tqdm import tqdm
+
+    return tqdm(iterable, **kwargs)
+
 def mxl_to_xml(in_file_path, out_folder_path, out_file_name):
-    with zipfile.ZipFile(in_file_path, 'r') as zip_ref:
-        zip_ref.extract('musicXML.xml', out_folder_path)
-    
-    os.replace(os.path.join(out_folder_path, 'musicXML.xml'), os.path.join(out_folder_path, out_file_name))
+    # the root file is written directly to its target name, its folders in the archive (e.g. sub/score.xml) are not created
+    write_file(os.path.join(out_folder_path, out_file_name), read_score(in_file_path))
 
-def convert_folder_to_xml(input_raw_folder):
-    mxl_files = glob.glob(os.path.join(input_raw_folder, '*.mxl'))
+def convert_folder_to_xml(input_raw_folder, input_xml_folder=input_xml_folder, recursive=False, shard=None):
+    mxl_files = iter_files(input_raw_folder, ('.mxl',), recursive, shard)
 
-    for f in tqdm(mxl_files, desc='Converting .mxl to .xml'):
-        file_name = os.path.basename(f)
-        file_name_xml = file_name.replace('.mxl', '.xml')
+    for f in progress(mxl_files, desc='Converting .mxl to .xml'):
+        file_name_xml = get_output_path(f, '', extension='.xml', input_folder=input_raw_folder if recursive else None)
+        os.makedirs(os.path.join(input_xml_folder, os.path.dirname(file_name_xml)), exist_ok=True)
 
         mxl_to_xml(f, input_xml_folder, file_name_xml)
 
-def convert_xml_to_mid(input_folder, output_folder):
+def get_output_path(in_file_path, output_folder, suffix='', extension='.mid', input_folder=None):
+    """
+    Returns the path of an out file
+
+    Parameters
+    ----------
+    in_file_path : str
+        The path to the input file
+    output_folder : str
+        The folder of the out files
+    suffix : str (default: '')
+        The suffix added to the name of the input file
+    extension : str (default: '.mid')
+        The extension of the out file
+    input_folder : str (default: None)
+        if set, the sub-folders of the input file in this folder are kept in the output folder,
+        otherwise the out file is directly in the output folder
+
+    Returns
+    -------
+    str
+        The path to the out file
+    """
+    file_name = os.path.relpath(in_file_path, input_folder) if input_folder is not None else os.path.basename(in_file_path)
+    file_name_mid = os.path.splitext(file_name)[0] + suffix + extension
+
+    return os.path.join(output_folder, file_name_mid)
+
+def get_output_paths(in_file_path, output_folder=None, transposed_folder=None, augmented_folder=None, augment_steps=(),
+        piano_roll_folder=None, input_folder=None, **options):
+    """
+    Returns the paths of the out files of a conversion (see convert_file)
+
+    Parameters
+    ----------
+    in_file_path : str
+        The path to the input file
+    output_folder, transposed_folder, augmented_folder, piano_roll_folder : str (default: None)
+        The folders of the out files, None for the files which are not written
+    augment_steps : list (default: ())
+        The transpositions in half steps of the augmented variants
+    input_folder : str (default: None)
+        if set, the sub-folders of the input file in this folder are kept in the output folders
+    options
+        The other options of the conversion, ignored
+
+    Returns
+    -------
+    tuple
+        The paths of the midi file, of the transposed midi file, of the augmented variants by half steps
+        (dict) and of the piano rolls, None for the files which are not written
+    """
+    file_path_out = None
+    file_path_transposed = None
+    file_paths_augmented = None
+    file_path_piano_roll = None
+
+    if output_folder is not None:
+        file_path_out = get_output_path(in_file_path, output_folder, input_folder=input_folder)
+
+    if transposed_folder is not None:
+        file_path_transposed = get_output_path(in_file_path, transposed_folder, input_folder=input_folder)
+
+    if augmented_folder is not None:
+        file_paths_augmented = {steps: get_output_path(in_file_path, augmented_folder, f'_{steps:+d}', input_folder=input_folder)
+            for steps in augment_steps}
+
+    if piano_roll_folder is not None:
+        file_path_piano_roll = get_output_path(in_file_path, piano_roll_folder, extension='.npz', input_folder=input_folder)
+
+    return file_path_out, file_path_transposed, file_paths_augmented, file_path_piano_roll
+
+def convert_file(in_file_path, output_folder, transposed_folder=None, augmented_folder=None, augment_steps=(), pitch_range=(0, 127),
+        piano_roll_folder=None, piano_roll_resolution=4, melody_part='harmony', return_tracks=False, data=None, write=True,
+        input_folder=None, return_signature=False):
+    """
+    Converts a single score, errors are returned instead of raised
+    so that the function can run inside a worker process
+
+    Parameters
+    ----------
+    in_file_path : str
+        The path to the .xml or .mxl file
+    output_folder : str
+        The folder of the out midi file, if None the midi file is not written
+    transposed_folder : str (default: None)
+        if set, the folder of the out midi file transposed to C major / A minor
+    augmented_folder : str (default: None)
+        if set, the folder of the transposed variants (name_+2.mid, name_-3.mid, ...)
+    augment_steps : list (default: ())
+        The transpositions in half steps of the variants
+    pitch_range : tuple (default: (0, 127))
+        The lowest and highest midi pitches allowed in the variants
+    piano_roll_folder : str (default: None)
+        if set, the folder of the .npz melody and harmony piano rolls
+    piano_roll_resolution : int (default: 4)
+        The resolution of the piano rolls in frames per quarter note
+    melody_part : str (default: 'harmony')
+        The rule to choose the melody part of multi-part scores (see score_to_midi.melody_part_rules)
+    return_tracks : boolean (default: False)
+        if true, the melody and harmony tracks are added to the outcome
+    data : bytes (default: None)
+        if set, the MusicXML document already read (see score_to_midi.read_score)
+    write : boolean (default: True)
+        if false, the out files are not written, their (path, content) are added to the outcome as 'files'
+    input_folder : str (default: None)
+        if set, the sub-folders of the input file in this folder are kept in the output folders
+    return_signature : boolean (default: False)
+        if true, the duplicate detection signature of the song (see dedup.fingerprint) is added to the outcome
+
+    Returns
+    -------
+    dict
+        The outcome of the conversion: file, written outputs, success, error, failure category,
+        unknown chord name, cached (always False here, True when the conversion was skipped)
+        metrics (wall and parsing times, notes, chords, output size, peak memory of the process and its growth
+        during this conversion, see metrics.py)
+        and metadata of the song (see corpus_index.song_metadata)
+    """
+    file_path_out, file_path_transposed, file_paths_augmented, file_path_piano_roll = get_output_paths(in_file_path,
+        output_folder, transposed_folder, augmented_folder, augment_steps, piano_roll_folder, input_folder)
+
+    if input_folder is not None:
+        for folder in [output_folder, transposed_folder, augmented_folder, piano_roll_folder]:
+            if folder is not None:
+                os.makedirs(os.path.dirname(get_output_path(in_file_path, folder, input_folder=input_folder)), exist_ok=True)
+
+    outcome = {'file': in_file_path, 'outputs': [], 'success': True, 'error': None, 'category': None, 'chord': None, 'cached': False}
+    metrics = {'parse_time': None, 'n_notes': 0, 'n_chords': 0}
+    start = time.perf_counter()
+    start_rss = peak_rss()
+
+    try:
+        result = score_to_midi(in_file_path, file_path_out, verbose=False, transposed_out_path=file_path_transposed,
+            augmented_out_paths=file_paths_augmented, pitch_range=pitch_range,
+            piano_roll_path=file_path_piano_roll, piano_roll_resolution=piano_roll_resolution, melody_part=melody_part,
+            data=data, write=write)
+        outcome['outputs'] = result['outputs']
+        if not write:
+            outcome['files'] = result['files']
+        metrics.update(parse_time=result['parse_time'], n_notes=sum(len(notes) for notes in result['tracks']),
+            n_chords=result['n_chords'])
+        outcome['metadata'] = song_metadata(result)
+        if return_tracks:
+            outcome['tracks'] = result['tracks']
+        if return_signature:
+            outcome['signature'] = fingerprint(*result['tracks'])
+    except UnknownChordError as e:
+        outcome.update(success=False, error=str(e), category=failure_category(e), chord=e.kind)
+    except Exception as e:
+        outcome.update(success=False, error=str(e) or type(e).__name__, category=failure_category(e))
+
+    # the peak of the process includes the previous files it converted, the growth is the part of this file
+    metrics.update(wall_time=time.perf_counter() - start, peak_rss=peak_rss())
+    metrics['peak_rss_growth'] = metrics['peak_rss'] - start_rss if start_rss is not None else None
+    if write:
+        metrics['output_size'] = output_size(outcome['outputs'])
+    else:
+        metrics['output_size'] = sum(len(content) for _, content in outcome.get('files', []))
+    outcome['metrics'] = metrics
+
+    return outcome
+
+def convert_files(files, workers=1, chunksize=1, **options):
+    """
+    Converts a list of scores, in parallel if more than one worker is used
+
+    Parameters
+    ----------
+    files : list
+        The paths to the .xml or .mxl files
+    workers : int (default: 1)
+        The number of worker processes
+    chunksize : int (default: 1)
+        The number of files sent at once to a worker
+    options
+        The output folders and options passed to convert_file
+
+    Yields
+    ------
+    dict
+        The outcome of every conversion (see convert_file), in the order of files
+    """
+    convert = partial(convert_file, **options)
+
+    if workers <= 1:
+        yield from map(convert, files)
+    else:
+        with multiprocessing.Pool(workers) as pool:
+            yield from pool.imap(convert, files, chunksize)
+
+def convert_read_file(item, **options):
+    in_file_path, data = item
+    return convert_file(in_file_path, data=data, write=False, **options)
+
+def convert_files_pipelined(files, workers=1, chunksize=1, prefetch=64, **options):
+    """
+    Converts a list of scores in a pipeline: a reader thread reads the files ahead, the workers
+    parse and encode them and a writer thread writes the out files, one at a time, so that reading
+    and writing overlap with the parsing. At most prefetch files are between the reader and the writer.
+
+    Every document is sent to a worker and every encoded output sent back, this costs more than
+    the I/O it hides on a local disk (convert_files is faster there), the pipeline is meant for
+    storage with a high latency such as network file systems.
+
+    Parameters
+    ----------
+    files : list
+        The paths to the .xml or .mxl files
+    workers : int (default: 1)
+        The number of worker processes
+    chunksize : int (default: 1)
+        The number of files sent at once to a worker
+    prefetch : int (default: 64)
+        The maximum number of files read and not yet written, raised to chunksize * workers:
+        the pool only sends a chunk to a worker once all its files are read
+    options
+        The output folders and options passed to convert_file
+
+    Yields
+    ------
+    dict
+        The outcome of every conversion (see convert_file), in the order of files
+    """
+    # with less files in flight than a chunk per worker, the reader would wait for written files
+    # while the pool waits for the rest of a chunk
+    in_flight = threading.BoundedSemaphore(max(prefetch, chunksize * max(workers, 1), 1))
+    read_queue = queue.Queue()
+    write_queue = queue.Queue()
+    done_queue = queue.Queue()
+    stop = threading.Event()
+
+    def reader():
+        for in_file_path in files:
+            in_flight.acquire()
+            if stop.is_set():
+                break
+
+            try:
+                data = read_score(in_file_path)
+            except Exception:
+                data = None # read again by convert_file, which reports the error
+
+            read_queue.put((in_file_path, data))
+
+        read_queue.put(None)
+
+    def writer():
+        for outcome in iter(write_queue.get, None):
+            try:
+                for out_path, content in outcome.pop('files', []):
+                    write_file(out_path, content)
+            except Exception as e:
+                outcome.update(success=False, error=str(e), category=failure_category(e))
+
+            done_queue.put(outcome)
+            in_flight.release()
+
+        done_queue.put(None)
+
+    threads = [threading.Thread(target=reader, daemon=True), threading.Thread(target=writer, daemon=True)]
+    for thread in threads:
+        thread.start()
+
+    convert = partial(convert_read_file, **options)
+    read_items = iter(read_queue.get, None)
+    pool = None
+
+    try:
+        if workers <= 1:
+            converted = map(convert, read_items)
+        else:
+            pool = multiprocessing.Pool(workers)
+            converted = pool.imap(convert, read_items, chunksize)
+
+        for outcome in converted:
+            write_queue.put(outcome)
+
+            while not done_queue.empty():
+                yield done_queue.get()
+
+        write_queue.put(None)
+        yield from iter(done_queue.get, None)
+    finally:
+        # unblock the reader if the conversion is interrupted
+        stop.set()
+        try:
+            in_flight.release()
+        except ValueError:
+            pass
+
+        if pool is not None:
+            pool.terminate()
+
+def isolated_worker(connection, in_file_path, memory_limit, options):
+    if memory_limit is not None and resource is not None:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+
+    connection.send(convert_file(in_file_path, **options))
+    connection.close()
+
+def remove_partial_outputs(in_file_path, options):
+    """
+    Removes the temporary files left by an interrupted conversion, only the ones of its own out files:
+    the other conversions still running may write files with the same prefix (e.g. a_b.mid for a.xml)
+
+    Parameters
+    ----------
+    in_file_path : str
+        The path to the .xml or .mxl file
+    options
+        The output folders and options of the conversion (see convert_file)
+    """
+    file_path_out, file_path_transposed, file_paths_augmented, file_path_piano_roll = get_output_paths(in_file_path, **options)
+    out_paths = [file_path_out, file_path_transposed, file_path_piano_roll] + list((file_paths_augmented or {}).values())
+
+    for out_path in out_paths:
+        if out_path is not None and os.path.exists(out_path + '.tmp'):
+            os.remove(out_path + '.tmp')
+
+def convert_files_isolated(files, workers=1, timeout=None, memory_limit=None, **options):
+    """
+    Converts a list of scores, each one in its own process so that a hang or a crash
+    only loses its file: a process still running after the timeout is killed
+
+    Parameters
+    ----------
+    files : list
+        The paths to the .xml or .mxl files
+    workers : int (default: 1)
+        The number of processes running at the same time
+    timeout : float (default: None)
+        The wall-clock time in seconds allowed for every file, None for no limit
+    memory_limit : int (default: None)
+        The address space limit in bytes of every process, None for no limit
+    options
+        The output folders and options passed to convert_file
+
+    Yields
+    ------
+    dict
+        The outcome of every conversion (see convert_file), in the order they end,
+        files killed or crashed get the category 'timeout' or 'crashed'
+    """
+    pending = list(reversed(files))
+    running = {} # connection -> (process, file, start time)
+
+    while pending or running:
+        while pending and len(running) < max(workers, 1):
+            in_file_path = pending.pop()
+            receiver, sender = multiprocessing.Pipe(duplex=False)
+            process = multiprocessing.Process(target=isolated_worker, args=(sender, in_file_path, memory_limit, options), daemon=True)
+            process.start()
+            sender.close()
+            running[receiver] = (process, in_file_path, time.perf_counter())
+
+        wait_time = None
+        if timeout is not None:
+            wait_time = max(0, min(start + timeout for _, _, start in running.values()) - time.perf_counter())
+
+        ready = multiprocessing.connection.wait(list(running), wait_time)
+
+        for connection in list(running):
+            process, in_file_path, start = running[connection]
+            elapsed = time.perf_counter() - start
+            outcome = None
+
+            if connection in ready:
+                try:
+                    outcome = connection.recv()
+                except EOFError: # the process died without sending its outcome
+                    process.join()
+                    error, category = f'Conversion process crashed (exit code {process.exitcode})', 'crashed'
+            elif timeout is not None and elapsed >= timeout:
+                process.kill()
+                process.join()
+                error, category = f'Conversion timed out after {timeout} s', 'timeout'
+            else:
+                continue
+
+            if outcome is None:
+                remove_partial_outputs(in_file_path, options)
+                outcome = {'file': in_file_path, 'outputs': [], 'success': False, 'error': error, 'category': category,
+                    'chord': None, 'cached': False, 'metrics': {'wall_time': elapsed}}
+
+            process.join()
+            connection.close()
+            del running[connection]
+
+            yield outcome
+
+def fingerprint_file(in_file_path, melody_part='harmony'):
+    try:
+        song = parse_score(in_file_path, melody_part=melody_part)
+    except Exception:
+        return in_file_path, None # the file is converted, and fails, as any other
+
+    return in_file_path, fingerprint(song['melody'], song['harmony'])
+
+def fingerprint_files(files, workers=1, chunksize=1, melody_part='harmony'):
+    """
+    Computes the duplicate detection signatures of scores from their parsed notes (see dedup.py),
+    in parallel if more than one worker is used
+
+    Parameters
+    ----------
+    files : list
+        The paths to the .xml or .mxl files
+    workers : int (default: 1)
+        The number of worker processes
+    chunksize : int (default: 1)
+        The number of files sent at once to a worker
+    melody_part : str (default: 'harmony')
+        The rule to choose the melody part of multi-part scores
+
+    Yields
+    ------
+    tuple
+        The (file, signature) of every score, in the order of files, the signature is None
+        if the score can not be parsed or is too short
+    """
+    fingerprint_part = partial(fingerprint_file, melody_part=melody_part)
+
+    if workers <= 1:
+        yield from map(fingerprint_part, files)
+    else:
+        with multiprocessing.Pool(workers) as pool:
+            yield from pool.imap(fingerprint_part, files, chunksize)
+
+def find_duplicates(signatures, threshold=0.8):
+    """
+    Groups the duplicate and near-duplicate scores from their signatures (see dedup.py)
+
+    Parameters
+    ----------
+    signatures : iterable
+        The (file, signature) of the scores, scores without signature are never duplicates
+    threshold : float (default: 0.8)
+        The estimated similarity from which two songs are duplicates
+
+    Returns
+    -------
+    list
+        The groups of duplicates, each one as a sorted list of files
+    """
+    index = LSHIndex(threshold)
+
+    for in_file_path, signature in signatures:
+        if signature is not None:
+            index.add(in_file_path, signature)
+
+    return index.clusters()
+
+def scan_files(files, workers=1, chunksize=1):
+    """
+    Scans the chord kinds of a list of scores (see prescan.py), in parallel if more than one worker is used
+
+    Parameters
+    ----------
+    files : iterable
+        The paths to the .xml or .mxl files
+    workers : int (default: 1)
+        The number of worker processes
+    chunksize : int (default: 1)
+        The number of files sent at once to a worker
+
+    Yields
+    ------
+    dict
+        The scan of every score (see prescan.scan_score), in the order of files
+    """
+    if workers <= 1:
+        yield from map(scan_score, files)
+    else:
+        with multiprocessing.Pool(workers) as pool:
+            yield from pool.imap(scan_score, files, chunksize)
+
+def scan_corpus(input_folder, workers=1, chunksize=1, recursive=False, shard=None, report_path=None):
+    """
+    Scans the chord kinds of all the scores of a folder, without converting them, and prints
+    the number of scores by status and the unknown chord kinds
+
+    Parameters
+    ----------
+    input_folder : str
+        The folder of the .xml and .mxl files
+    workers : int (default: 1)
+        The number of worker processes
+    chunksize : int (default: 1)
+        The number of files sent at once to a worker
+    recursive : boolean (default: False)
+        if true, the scores of the sub-folders are also scanned
+    shard : tuple (default: None)
+        if set, the (index, count) of the shard of the corpus scanned (see discovery.py)
+    report_path : str (default: None)
+        if set, the report is written to this json file
+
+    Returns
+    -------
+    dict
+        The report (see prescan.summarize_scans)
+    """
+    start = time.perf_counter()
+    files = iter_files(input_folder, ('.xml', '.mxl'), recursive, shard)
+    scans = list(progress(scan_files(files, workers, chunksize), desc='Scanning chord kinds'))
+    report = summarize_scans(scans)
+    report['elapsed'] = time.perf_counter() - start
+
+    if report_path is not None:
+        with open(report_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=4)
+
+    print(f'\nScanned: {report["files"]} files in {report["elapsed"]:.2f} s')
+    print(json.dumps(report['statuses'], indent=4, sort_keys=True))
+    print('\nUnknown chords (files, chords):')
+    for kind, entry in report['unknown_kinds'].items():
+        print(f'{entry["files"]:8d} {entry["chords"]:8d}  {kind} ({os.path.basename(entry["example"])})')
+
+    return report
+
+def convert_xml_to_mid(input_folder, output_folder, workers=1, chunksize=1, incremental=False, shards_folder=None,
+        metrics_path=None, metrics_slowest=10, isolated=False, timeout=None, memory_limit=None, quarantine_path=None,
+        pipelined=False, prefetch=64, dedup=None, dedup_threshold=0.8, index_path=None, recursive=False, shard=None,
+        prescan=False, **options):
+    """
+    Converts all the scores of a folder and prints a report
+
+    Parameters
+    ----------
+    input_folder : str
+        The folder of the .xml and .mxl files
+    output_folder : str
+        The folder of the out midi files, if None the midi files are not written
+    workers : int (default: 1)
+        The number of worker processes
+    chunksize : int (default: 1)
+        The number of files sent at once to a worker
+    incremental : boolean (default: False)
+        if true, skip the files whose content, converter version and options did not change
+        since the last run, the failures caused by the content of a file are not retried (see Manifest.cached_categories)
+    shards_folder : str (default: None)
+        if set, the notes of the songs are written to a sharded dataset in this folder (see shards.py),
+        songs are identified by the name of their file
+    metrics_path : str (default: None)
+        if set, the per-file metrics are written to this .jsonl file and the run report next to it
+        (see metrics.py)
+    metrics_slowest : int (default: 10)
+        The number of slowest files listed in the run report
+    isolated : boolean (default: False)
+        if true, every file is converted in its own process (see convert_files_isolated)
+    timeout : float (default: None)
+        with isolated, the wall-clock time in seconds after which a conversion is killed
+    memory_limit : int (default: None)
+        with isolated, the address space limit in bytes of the conversion processes
+    quarantine_path : str (default: None)
+        if set, the files which timed out, crashed or ran out of memory are recorded in this json file
+        and skipped by the next runs while they are unchanged
+    pipelined : boolean (default: False)
+        if true, the files are read ahead and the out files written by separate threads
+        (see convert_files_pipelined), it can not be combined with isolated
+    prefetch : int (default: 64)
+        with pipelined, the maximum number of files read and not yet written
+    dedup : str (default: None)
+        if set, the duplicate scores are grouped before the conversion and the groups are written to
+        <output folder>.duplicates.json: 'skip' converts only the first file of every group,
+        'group' converts all the files and sets the group of every outcome. With 'group' the converted files are
+        fingerprinted from their conversion, and with incremental the signatures are kept in the manifest
+        so only the files which changed are parsed again
+    dedup_threshold : float (default: 0.8)
+        The estimated similarity from which two songs are duplicates
+    index_path : str (default: None)
+        if set, the metadata of the converted songs are stored in this SQLite index (see corpus_index.py),
+        the songs which failed or are no longer in the input folder are removed from it
+    recursive : boolean (default: False)
+        if true, the scores of the sub-folders are also converted, their sub-folders are kept in the output folders
+    shard : tuple (default: None)
+        if set, the (index, count) of the shard of the corpus converted by this run (see discovery.py),
+        the manifest, metrics, quarantine, index, duplicates report and shards folder get the suffix of the shard
+        and are combined by merge_shards once all the shards are converted
+    prescan : boolean (default: False)
+        if true, the chord kinds of the scores are scanned before their conversion (see prescan.py),
+        the scores using an unknown kind are not converted and get the outcome of a failed conversion
+    options
+        The other output folders and options passed to convert_file
+
+    Returns
+    -------
+    list
+        The outcome of every file (see convert_file)
+    """
     out_of_chords = {}
     c_right = 0
     c_wrong = 0
+    c_cached = 0
+    c_duplicates = 0
+    c_prescanned = 0
+    results = []
+    quarantined = []
     
-    xml_files = glob.glob(os.path.join(input_folder, '*.xml'))
+    # the list is kept on purpose: it is read again by the manifest hashes, the deduplication,
+    # the pruning of the index and the progress bar, and only holds the paths
+    xml_files = list(iter_files(input_folder, ('.xml', '.mxl'), recursive, shard))
+    files_to_convert = xml_files
+    cached_outcomes = []
+    shard_writer = None
+    metrics_log = None
+    corpus_index = None
+    start = time.perf_counter()
 
-    for f in tqdm(xml_files, desc='Converting .xml to .mid'):
-        file_name = os.path.basename(f)
-        file_name_mid = file_name.replace('.xml', '.mid')
-        file_path_out = os.path.join(output_folder, file_name_mid)
-            
-        try:
-            score_to_midi(f, file_path_out, verbose=False)
-            c_right += 1
-        except Exception as e:
-            if 'Chord' in str(e):
-                chord_name = str(e).split(':')[1].strip()
-                if chord_name not in out_of_chords:
-                    out_of_chords[chord_name] = file_name
-            
-            c_wrong += 1
+    if isolated and pipelined:
+        raise NameError('The isolated and pipelined conversions can not be combined')
+
+    def run_path(path):
+        # every shard has its own run files
+        return shard_path(path, shard) if shard is not None and path is not None else path
+
+    metrics_path, quarantine_path, index_path = map(run_path, [metrics_path, quarantine_path, index_path])
+
+    if recursive:
+        options['input_folder'] = input_folder
+
+    if shards_folder is not None:
+        if incremental:
+            raise NameError('The incremental conversion is not available with shards, they are rewritten at every run')
+
+        shard_writer = ShardWriter(run_path(shards_folder))
+        options['return_tracks'] = True
+
+    if incremental:
+        manifest = Manifest(run_path(get_manifest_path(output_folder)), get_converter_version())
+        settings = dict(options, output_folder=output_folder)
+        hashes = {f: file_hash(f) for f in progress(xml_files, desc='Hashing input files')}
+        manifest.prune_signatures(hashes.values())
+
+    # an .mxl score next to an .xml score of the same name would write the same out files: the .xml score is
+    # converted and the .mxl one is reported (checked on disk, the .xml score may belong to another shard)
+    same_name = {f: f[:-len('.mxl')] + '.xml' for f in xml_files if f.endswith('.mxl') and os.path.isfile(f[:-len('.mxl')] + '.xml')}
+
+    if same_name:
+        files_to_convert = [f for f in xml_files if f not in same_name]
+
+        for f, other in same_name.items():
+            cached_outcomes.append({'file': f, 'outputs': [], 'success': False, 'error': f'Same out files as {other}',
+                'category': 'name_collision', 'chord': None, 'cached': True, 'same_name_as': other})
+
+    melody_part = options.get('melody_part', 'harmony')
+    signatures = {}
+    duplicate_of = {}
+    group_of = {}
+
+    def record_signature(f, signature):
+        signatures[f] = signature
+        if incremental:
+            manifest.record_signature(hashes[f], melody_part, signature)
+
+    def add_signatures(files):
+        # the signatures of the unchanged files are read from the manifest, the other files are parsed,
+        # once for all the files with the same content
+        missing = {}
+        for f in files:
+            entry = manifest.lookup_signature(hashes[f], melody_part) if incremental else None
+            if entry is None:
+                missing.setdefault(hashes[f] if incremental else f, []).append(f)
+            else:
+                signatures[f] = entry['signature']
+
+        parsed = fingerprint_files([same[0] for same in missing.values()], workers, chunksize, melody_part)
+        for f, signature in progress(parsed, total=len(missing), desc='Fingerprinting'):
+            for same in missing[hashes[f] if incremental else f]:
+                record_signature(same, signature)
+
+    def group_duplicates():
+        clusters = find_duplicates(signatures.items(), dedup_threshold)
+        write_report(run_path(get_report_path(output_folder if output_folder is not None else shards_folder)), clusters)
+
+        for group, cluster in enumerate(clusters):
+            for f in cluster:
+                group_of[f] = group
+                if f != cluster[0]:
+                    duplicate_of[f] = cluster[0]
+
+        return clusters
+
+    if dedup == 'skip':
+        candidates = files_to_convert
+        add_signatures(candidates)
+        clusters = group_duplicates()
+        files_to_convert = [f for f in candidates if f not in duplicate_of]
+
+        for f in candidates:
+            if f in duplicate_of:
+                cached_outcomes.append({'file': f, 'outputs': [], 'success': False, 'error': f'Duplicate of {duplicate_of[f]}',
+                    'category': 'duplicate', 'chord': None, 'cached': True, 'duplicate_of': duplicate_of[f]})
+    elif dedup == 'group':
+        # all the files are converted, the signatures are computed from the converted tracks
+        options['return_signature'] = True
+
+    if incremental:
+        candidates = files_to_convert
+        files_to_convert = []
+
+        for f in candidates:
+            entry = manifest.lookup(f, hashes[f], settings)
+            if entry is None:
+                files_to_convert.append(f)
+            else:
+                cached_outcomes.append({'file': f, 'outputs': entry['outputs'], 'success': entry['success'],
+                    'error': entry['error'], 'category': entry.get('category'), 'chord': entry['chord'], 'cached': True,
+                    'metadata': entry.get('metadata')})
+
+    if quarantine_path is not None:
+        quarantine = Quarantine(quarantine_path)
+        entries = {f: quarantine.lookup(f) for f in files_to_convert if f in quarantine.entries}
+        files_to_convert = [f for f in files_to_convert if entries.get(f) is None]
+
+        for f, entry in entries.items():
+            if entry is not None:
+                cached_outcomes.append({'file': f, 'outputs': [], 'success': False, 'error': entry['error'],
+                    'category': entry['category'], 'chord': None, 'cached': True})
+                quarantined.append(f)
+
+    if metrics_path is not None:
+        metrics_log = MetricsLog(metrics_path)
+
+    if index_path is not None:
+        corpus_index = CorpusIndex(index_path)
+        corpus_index.prune(xml_files)
+
+    prescanned = []
+
+    if prescan:
+        candidates = files_to_convert
+        files_to_convert = []
+
+        for scan in progress(scan_files(candidates, workers, chunksize), total=len(candidates), desc='Scanning chord kinds'):
+            if scan['status'] == 'unknown_chord':
+                prescanned.append({'file': scan['file'], 'outputs': [], 'success': False, 'error': scan['error'],
+                    'category': 'unknown_chord', 'chord': scan['chord'], 'cached': False, 'prescanned': True,
+                    'metrics': {'parse_time': None, 'n_notes': 0, 'n_chords': scan['n_chords'], 'wall_time': scan['scan_time']}})
+            else:
+                files_to_convert.append(scan['file'])
+
+    if isolated:
+        converted = convert_files_isolated(files_to_convert, workers, timeout, memory_limit, output_folder=output_folder, **options)
+    elif pipelined:
+        converted = convert_files_pipelined(files_to_convert, workers, chunksize, prefetch, output_folder=output_folder, **options)
+    else:
+        converted = convert_files(files_to_convert, workers, chunksize, output_folder=output_folder, **options)
+
+    outcomes = itertools.chain(cached_outcomes, prescanned, converted)
+
+    try:
+        for outcome in progress(outcomes, total=len(xml_files), desc='Converting .xml/.mxl to .mid'):
+            results.append(outcome)
+
+            if 'signature' in outcome:
+                record_signature(outcome['file'], outcome.pop('signature'))
+
+            # the song id is stored in the index
+            if shard_writer is not None and outcome['success']:
+                song_name = get_output_path(outcome['file'], '', extension='', input_folder=options.get('input_folder'))
+                outcome['song_id'] = shard_writer.append(song_name, *outcome.pop('tracks'))
+
+            if corpus_index is not None:
+                if outcome['success'] and outcome.get('metadata') is not None:
+                    corpus_index.add(outcome['file'], outcome['outputs'], outcome['metadata'], outcome.get('song_id'))
+                else:
+                    corpus_index.remove(outcome['file'])
+
+            if 'duplicate_of' in outcome or 'same_name_as' in outcome:
+                if 'duplicate_of' in outcome:
+                    c_duplicates += 1
+                if metrics_log is not None:
+                    metrics_log.record(outcome)
+                continue
+
+            if outcome.get('prescanned'):
+                c_prescanned += 1
+
+            if outcome['cached']:
+                c_cached += 1
+            else:
+                if incremental:
+                    manifest.record(outcome['file'], hashes[outcome['file']], settings, outcome)
+
+                if quarantine_path is not None and quarantine.add(outcome['file'], outcome):
+                    quarantined.append(outcome['file'])
+
+            if metrics_log is not None:
+                metrics_log.record(outcome)
+
+            if outcome['success']:
+                c_right += 1
+            else:
+                chord_name = outcome['chord']
+                if chord_name is not None and chord_name not in out_of_chords:
+                    out_of_chords[chord_name] = os.path.basename(outcome['file'])
+                
+                c_wrong += 1
+
+        if dedup == 'group':
+            # the unchanged files skipped by this run get their signature from the manifest, or are parsed if it has none
+            add_signatures([outcome['file'] for outcome in results if outcome['success'] and outcome['file'] not in signatures])
+            clusters = group_duplicates()
+
+        if dedup is not None:
+            for outcome in results:
+                outcome['group'] = group_of.get(outcome['file'])
+    finally:
+        # keep the progress of interrupted runs
+        if incremental:
+            manifest.save()
+
+        if shard_writer is not None:
+            shard_writer.close()
+
+        if metrics_log is not None:
+            metrics_log.close()
+
+        if quarantine_path is not None:
+            quarantine.save()
+
+        if corpus_index is not None:
+            corpus_index.close()
     
     c_total = c_right + c_wrong
-    percentage_right = round(c_right / c_total * 100, 2)
-    percentage_wrong = round(c_wrong / c_total * 100, 2)
+    # a shard (or a folder) may have no file
+    percentage_right = round(c_right / c_total * 100, 2) if c_total else 0
+    percentage_wrong = round(c_wrong / c_total * 100, 2) if c_total else 0
 
-    print(f'\nTotal: {c_total}\nRight: {c_right} ({percentage_right}%)\nWrong: {c_wrong} ({percentage_wrong}%)')
+    print(f'\nTotal: {c_total}\nRight: {c_right} ({percentage_right}%)\nWrong: {c_wrong} ({percentage_wrong}%)\nUnchanged (skipped): {c_cached}')
+    if prescan:
+        print(f'Unknown chords (not converted): {c_prescanned}')
+    if dedup is not None:
+        print(f'Duplicate groups: {len(clusters)}\nDuplicates (skipped): {c_duplicates}')
+    if same_name:
+        print(f'Same name as an .xml score (skipped): {len(same_name)}')
+        for f, other in sorted(same_name.items()):
+            print(f'{os.path.basename(f)}: same out files as {os.path.basename(other)}')
     print('\nWrong chords:')
     print(json.dumps(out_of_chords, indent=4, sort_keys=True))
+
+    if quarantined:
+        print(f'\nQuarantined: {len(quarantined)}')
+        for f in sorted(quarantined):
+            print(f'{os.path.basename(f)}: {quarantine.entries[f]["error"]}')
+
+    if metrics_log is not None:
+        summary = summarize(metrics_log.records, time.perf_counter() - start, metrics_slowest)
+        with open(get_summary_path(metrics_path), 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=4)
+        print_summary(summary)
+
     print('')
 
-def main():
-    if convert_to_xml:
-        convert_folder_to_xml(input_raw_folder)
+    return results
+
+def merge_shards(count, output_folder=None, shards_folder=None, metrics_path=None, metrics_slowest=10,
+        quarantine_path=None, index_path=None):
+    """
+    Combines the run files of the shards 0/N to N-1/N of a corpus (see convert_xml_to_mid) into the files
+    of a single run: manifest, duplicates report, metrics and run report, quarantine, index and shards dataset.
+    Duplicates in different shards are not detected
+
+    Parameters
+    ----------
+    count : int
+        The number of shards
+    output_folder : str (default: None)
+        The folder of the out midi files, its manifest and duplicates report are merged
+    shards_folder : str (default: None)
+        The folder of the merged sharded dataset, the datasets of the shards are moved to it
+    metrics_path : str (default: None)
+        The path to the merged metrics, the run report is written next to it
+    metrics_slowest : int (default: 10)
+        The number of slowest files listed in the run report
+    quarantine_path : str (default: None)
+        The path to the merged quarantine
+    index_path : str (default: None)
+        The path to the merged SQLite index
+
+    Returns
+    -------
+    list
+        The missing run files of the shards
+    """
+    shards = [(i, count) for i in range(count)]
+    missing = []
+
+    def shard_files(path):
+        # the run files of the shards, if at least one shard has one (e.g. the quarantine is optional)
+        if path is None:
+            return []
+
+        paths = [shard_path(path, shard) for shard in shards]
+        found = [p for p in paths if os.path.exists(p)]
+        if found:
+            missing.extend(p for p in paths if p not in found)
+
+        return found
+
+    manifest_paths = shard_files(get_manifest_path(output_folder) if output_folder is not None else None)
+    if manifest_paths:
+        manifest = Manifest(get_manifest_path(output_folder), get_converter_version())
+        for path in manifest_paths:
+            shard_manifest = Manifest(path, get_converter_version())
+            manifest.entries.update(shard_manifest.entries)
+            manifest.signatures.update(shard_manifest.signatures)
+        manifest.save()
+
+    report_folder = output_folder if output_folder is not None else shards_folder
+    report_path = get_report_path(report_folder) if report_folder is not None else None
+    report_paths = shard_files(report_path)
+    if report_paths:
+        clusters = []
+        for path in report_paths:
+            with open(path, 'r', encoding='utf-8') as f:
+                clusters.extend(group['files'] for group in json.load(f)['groups'])
+        write_report(report_path, sorted(clusters))
+
+    metrics_paths = shard_files(metrics_path)
+    if metrics_paths:
+        records = []
+        elapsed = 0
+        with open(metrics_path, 'w', encoding='utf-8') as out_file:
+            for path in metrics_paths:
+                with open(path, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        records.append(json.loads(line))
+                        out_file.write(line)
+
+                # the shards run at the same time, the corpus took as long as the slowest one
+                if os.path.isfile(get_summary_path(path)):
+                    with open(get_summary_path(path), 'r', encoding='utf-8') as f:
+                        elapsed = max(elapsed, json.load(f)['elapsed'])
+
+        summary = summarize(records, elapsed, metrics_slowest)
+        with open(get_summary_path(metrics_path), 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=4)
+        print_summary(summary)
+
+    quarantine_paths = shard_files(quarantine_path)
+    if quarantine_paths:
+        quarantine = Quarantine(quarantine_path)
+        for path in quarantine_paths:
+            quarantine.entries.update(Quarantine(path).entries)
+        quarantine.save()
+
+    dataset_folders = shard_files(shards_folder)
+
+    # in the merged dataset, the song ids of a shard follow the songs of the previous shards
+    song_id_offsets = {}
+    n_songs = 0
+    for folder in dataset_folders:
+        song_id_offsets[folder] = n_songs
+        n_songs += len(ShardReader(folder))
+
+    index_paths = shard_files(index_path)
+    if index_paths:
+        with CorpusIndex(index_path) as corpus_index:
+            for shard in shards:
+                if shard_path(index_path, shard) in index_paths:
+                    offset = song_id_offsets.get(shard_path(shards_folder, shard), 0) if shards_folder is not None else 0
+                    corpus_index.merge(shard_path(index_path, shard), offset)
+
+    if dataset_folders:
+        merge_datasets(dataset_folders, shards_folder)
+
+    if missing:
+        print('\nMissing shard files:')
+        for path in missing:
+            print(path)
+
+    return missing
+
+def shard_argument(text):
+    try:
+        return parse_shard(text)
+    except NameError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+def get_parser():
+    """
+    Builds the command line parser, the defaults are the settings at the top of this file
+
+    Returns
+    -------
+    argparse.ArgumentParser
+        The parser of the extract, convert, transpose, all, scan and merge commands
+    """
+    parser = argparse.ArgumentParser(description='Convert MusicXML scores to midi files with separated melody and chords')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    extract = commands.add_parser('extract', help='extract the .xml score of every .mxl archive')
+    extract.add_argument('--input', default=input_raw_folder, help='folder containing the .mxl archives')
+    extract.add_argument('--output', default=input_xml_folder, help='folder of the extracted .xml scores')
+    extract.add_argument('--recursive', action='store_true', help='also extract the archives of the sub-folders')
+    extract.add_argument('--shard', type=shard_argument, help='only extract the shard i/N of the archives')
+
+    transpose = commands.add_parser('transpose', help='transpose converted midi files to C major / A minor')
+    transpose.add_argument('--input', default=output_folder, help='folder containing the .mid files')
+    transpose.add_argument('--output', default=output_transposed_folder, help='folder of the transposed .mid files')
+    transpose.add_argument('--recursive', action='store_true', help='also transpose the files of the sub-folders')
+    transpose.add_argument('--tracks', type=int, nargs='+', help='indexes of the tracks to transpose (1: melody, 2: harmony), all by default')
+    transpose.add_argument('--shifts', type=int, nargs='+',
+        help='write every file transposed by these half steps (e.g. -5 ... 6) instead of transposing it to C major / A minor')
+    transpose.add_argument('--shard', type=shard_argument, help='only transpose the shard i/N of the files')
+
+    convert = commands.add_parser('convert', help='convert .xml/.mxl scores to midi')
+    run_all = commands.add_parser('all', help='extract (with --extract), then convert with the transposed versions')
+
+    for command in [convert, run_all]:
+        command.add_argument('--input', default=input_folder, help='folder containing the .xml/.mxl scores')
+        command.add_argument('--output', default=output_folder, help='folder of the .mid files')
+        command.add_argument('--mode', default=output_mode, choices=['midi', 'shards'], help='one .mid per song or binary shards')
+        command.add_argument('--shards-folder', default=output_shards_folder, help='folder of the shards (--mode shards)')
+        command.add_argument('--workers', type=int, default=num_workers, help='number of conversion processes')
+        command.add_argument('--chunk-size', type=int, default=chunk_size, help='number of files sent at once to a worker')
+        command.add_argument('--incremental', action=argparse.BooleanOptionalAction, default=incremental,
+            help='skip the files that did not change since the last run')
+        command.add_argument('--isolated', action=argparse.BooleanOptionalAction, default=isolated,
+            help='convert every file in its own process, with a timeout and a memory limit')
+        command.add_argument('--timeout', type=float, default=file_timeout, help='seconds allowed for every file (--isolated)')
+        command.add_argument('--memory-limit', type=int, default=file_memory_limit, help='memory limit in bytes of every file (--isolated)')
+        command.add_argument('--pipelined', action=argparse.BooleanOptionalAction, default=pipelined,
+            help='read and write the files in threads, without isolation (for high latency storage only)')
+        command.add_argument('--prefetch', type=int, default=prefetch, help='maximum number of files in the pipeline (--pipelined)')
+        command.add_argument('--melody-part', default=melody_part, choices=['first', 'harmony', 'highest'],
+            help='rule choosing the melody part')
+        command.add_argument('--transposed-folder', default=output_transposed_folder,
+            help='folder of the versions transposed to C major / A minor')
+        command.add_argument('--augmented', action=argparse.BooleanOptionalAction, default=convert_to_augmented,
+            help='also write the song in all the augment steps (not with --mode shards)')
+        command.add_argument('--augmented-folder', default=output_augmented_folder, help='folder of the augmented versions')
+        command.add_argument('--piano-roll', action=argparse.BooleanOptionalAction, default=convert_to_piano_roll,
+            help='also write the piano rolls')
+        command.add_argument('--piano-roll-folder', default=output_piano_roll_folder, help='folder of the piano rolls')
+        command.add_argument('--dedup', default=dedup, choices=['skip', 'group'], help='find duplicate songs before the conversion')
+        command.add_argument('--dedup-threshold', type=float, default=dedup_threshold, help='similarity of the duplicates')
+        command.add_argument('--metrics', default=metrics_path, help='path to the per-file metrics (.jsonl)')
+        command.add_argument('--quarantine', default=quarantine_path, help='path to the quarantine (.json)')
+        command.add_argument('--index', default=index_path, help='path to the SQLite index of the converted songs')
+        command.add_argument('--prescan', action=argparse.BooleanOptionalAction, default=prescan,
+            help='reject the scores using unknown chord kinds before their conversion')
+        command.add_argument('--recursive', action='store_true', help='also convert the scores of the sub-folders')
+        command.add_argument('--shard', type=shard_argument,
+            help='only convert the shard i/N of the corpus, the shards are combined afterwards with merge')
+
+    convert.add_argument('--transposed', action=argparse.BooleanOptionalAction, default=convert_to_transposed,
+        help='also write the version transposed to C major / A minor (not with --mode shards)')
+    run_all.add_argument('--extract', action=argparse.BooleanOptionalAction, default=convert_to_xml,
+        help='extract the .mxl archives of --raw-input first, then convert the extracted scores of --xml-output instead of --input')
+    run_all.add_argument('--raw-input', default=input_raw_folder, help='folder containing the .mxl archives')
+    run_all.add_argument('--xml-output', default=input_xml_folder, help='folder of the extracted .xml scores')
+
+    scan = commands.add_parser('scan', help='count the scores using unknown chord kinds, without converting them')
+    scan.add_argument('--input', default=input_folder, help='folder containing the .xml/.mxl scores')
+    scan.add_argument('--workers', type=int, default=num_workers, help='number of scanning processes')
+    scan.add_argument('--chunk-size', type=int, default=chunk_size, help='number of files sent at once to a worker')
+    scan.add_argument('--recursive', action='store_true', help='also scan the scores of the sub-folders')
+    scan.add_argument('--shard', type=shard_argument, help='only scan the shard i/N of the corpus')
+    scan.add_argument('--report', help='path to the json report')
+
+    merge = commands.add_parser('merge', help='combine the run files of the shards of a corpus')
+    merge.add_argument('--shards', type=int, required=True, help='number of shards N')
+    merge.add_argument('--output', default=output_folder, help='folder of the .mid files (manifest, duplicates report)')
+    merge.add_argument('--mode', default=output_mode, choices=['midi', 'shards'], help='one .mid per song or binary shards')
+    merge.add_argument('--shards-folder', default=output_shards_folder, help='folder of the shards (--mode shards)')
+    merge.add_argument('--metrics', default=metrics_path, help='path to the per-file metrics (.jsonl)')
+    merge.add_argument('--quarantine', default=quarantine_path, help='path to the quarantine (.json)')
+    merge.add_argument('--index', default=index_path, help='path to the SQLite index of the converted songs')
+
+    return parser
+
+def convert(args, transposed):
+    """
+    Runs the conversion of the convert and all commands
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        The parsed command line (see get_parser)
+    transposed : boolean
+        if true, the versions transposed to C major / A minor are also written
+        (not in shards mode, the shards replace the per-song midi files)
+    """
+    options = {'metrics_path': args.metrics, 'metrics_slowest': metrics_slowest, 'melody_part': args.melody_part,
+        'quarantine_path': args.quarantine, 'dedup': args.dedup, 'dedup_threshold': args.dedup_threshold, 'index_path': args.index,
+        'recursive': args.recursive, 'shard': args.shard, 'prescan': args.prescan}
+
+    if args.isolated:
+        options.update(isolated=True, timeout=args.timeout, memory_limit=args.memory_limit)
+    elif args.pipelined:
+        options.update(pipelined=True, prefetch=args.prefetch)
+
+    # in shards mode no midi file is written per song, a failed write would also drop the song from the shards
+    per_song_midi = args.mode != 'shards'
+
+    if transposed and per_song_midi:
+        options['transposed_folder'] = args.transposed_folder
+
+    if args.augmented and per_song_midi:
+        options.update(augmented_folder=args.augmented_folder, augment_steps=augment_steps, pitch_range=augment_pitch_range)
+
+    if args.piano_roll:
+        options.update(piano_roll_folder=args.piano_roll_folder, piano_roll_resolution=piano_roll_resolution)
+
+    if args.mode == 'shards':
+        convert_xml_to_mid(args.input, None, args.workers, args.chunk_size, shards_folder=args.shards_folder, **options)
+    else:
+        convert_xml_to_mid(args.input, args.output, args.workers, args.chunk_size, args.incremental, **options)
+
+def main(argv=None):
+    """
+    Runs a command of the pipeline, every command imports only the modules it needs
+
+    Parameters
+    ----------
+    argv : list (default: None)
+        The command line arguments, sys.argv[1:] if None
+    """
+    args = get_parser().parse_args(argv)
+
+    if args.command == 'extract':
+        convert_folder_to_xml(args.input, args.output, args.recursive, args.shard)
+    elif args.command == 'transpose':
+        # pretty_midi is only needed to read the midi files of this command
+        import transposer
+
+        if args.shifts:
+            files = iter_files(args.input, ('.mid',), args.recursive, args.shard)
+            out_of_range = transposer.transpose_files(files, args.output, args.shifts, args.tracks)
 
-    convert_xml_to_mid(input_folder, output_folder)
+            print(f'\nOut of the midi range (not written): {len(out_of_range)} files')
+            for f, shifts in sorted(out_of_range.items()):
+                print(f'{os.path.basename(f)}: {", ".join(f"{steps:+d}" for steps in shifts)}')
+        else:
+            transposer.convert_folder(args.input, args.output, recursive=args.recursive, shard=args.shard, tracks=args.tracks)
+    elif args.command == 'scan':
+        scan_corpus(args.input, args.workers, args.chunk_size, args.recursive, args.shard, args.report)
+    elif args.command == 'merge':
+        if args.mode == 'shards':
+            merge_shards(args.shards, None, args.shards_folder, args.metrics, metrics_slowest, args.quarantine, args.index)
+        else:
+            merge_shards(args.shards, args.output, None, args.metrics, metrics_slowest, args.quarantine, args.index)
+    elif args.command == 'convert':
+        convert(args, args.transposed)
+    else:
+        if args.extract:
+            convert_folder_to_xml(args.raw_input, args.xml_output, args.recursive, args.shard)
+            args.input = args.xml_output
 
-    if convert_to_transposed:
-        transposer.convert_folder(output_folder, output_transposed_folder)
+        convert(args, True)
 
-main()
\ No newline at end of file
+if __name__ == '__main__':
+    main()
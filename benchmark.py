@@ -0,0 +1,417 @@
+"""
+Benchmarks the MusicXML to midi conversion, stage by stage.
+
+The scores are the examples plus synthetic scores of thousands of measures.
+Every stage of score_to_midi is timed separately (read, chord kinds pre-scan, parse with each engine,
+tracks, key estimation, midi encoding and write, and the former pretty_midi
+writer for reference), as well as transposer.transpose_file, the transposition
+of a midi file to the 12 keys and, optionally, the music21 key analysis.
+
+The startup benchmark times the imports of every command in a fresh interpreter,
+as paid by every isolated conversion process, and checks that a conversion does
+not load music21 or pretty_midi.
+
+Results can be saved as a json baseline and later compared to it,
+stages slower than the baseline by more than a threshold are flagged.
+"""
+
+import argparse
+import glob
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from score_to_midi import score_to_midi, scoreToMidiHandler, open_score, build_midi, engines
+from key_detection import pitch_class_histogram, estimate_key
+from midi_writer import encode_midi
+from prescan import scan_score
+from midi_transpose import transpose_variants
+import transposer
+
+repo_folder = os.path.dirname(os.path.abspath(__file__))
+examples_folder = os.path.join(repo_folder, 'examples')
+
+# code run by every command before its work, timed in a fresh interpreter
+startup_stages = {
+    'import_score_to_midi': 'import score_to_midi',
+    'import_batch_convert': 'import batch_convert', # extract, convert and every spawned conversion process
+    'import_transposer': 'import batch_convert, transposer', # transpose
+    'cli': 'import batch_convert; batch_convert.get_parser().parse_args(["convert"])',
+}
+
+# modules that the conversion must not import, they are slow to load
+heavy_modules = ['music21', 'pretty_midi']
+
+# synthetic scores, in number of measures
+synthetic_sizes = [1000, 5000]
+
+def time_best(function, repeat):
+    """
+    Times a function
+
+    Parameters
+    ----------
+    function : callable
+        The function to time, called without arguments
+    repeat : int
+        The number of calls
+
+    Returns
+    -------
+    float
+        The best time in seconds
+    object
+        The value returned by the last call
+    """
+    best = None
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        value = function()
+        elapsed = time.perf_counter() - start
+
+        if best is None or elapsed < best:
+            best = elapsed
+
+    return best, value
+
+def time_conversion(score_path, out_path, repeat, engine):
+    """
+    Times the conversion of a single score
+
+    Parameters
+    ----------
+    score_path : str
+        The path to the MusicXML file
+    out_path : str
+        The path to the out midi file
+    repeat : int
+        The number of conversions to run
+    engine : str
+        The parsing engine
+
+    Returns
+    -------
+    float
+        The best conversion time in seconds
+    bool
+        True if the conversion raised an error
+    """
+    best = None
+    failed = False
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        try:
+            score_to_midi(score_path, out_path, verbose=False, engine=engine)
+        except Exception:
+            failed = True
+        elapsed = time.perf_counter() - start
+
+        if best is None or elapsed < best:
+            best = elapsed
+
+    return best, failed
+
+def synthetic_score(n_measures):
+    """
+    Builds a MusicXML score with a melody of quarter notes and one chord per measure
+
+    Parameters
+    ----------
+    n_measures : int
+        The number of measures
+
+    Returns
+    -------
+    str
+        The MusicXML document
+    """
+    steps = ['C', 'D', 'E', 'F', 'G', 'A', 'B']
+    chords = [('C', 'major'), ('A', 'minor'), ('F', 'major'), ('G', 'dominant')]
+    measures = []
+
+    for m in range(n_measures):
+        root_step, kind = chords[m % len(chords)]
+        attributes = ''
+        if m == 0:
+            attributes = ('<attributes><divisions>1</divisions><key><fifths>0</fifths></key>'
+                '<time><beats>4</beats><beat-type>4</beat-type></time></attributes>')
+
+        notes = ''.join(
+            f'<note><pitch><step>{steps[(m + n) % 7]}</step><octave>4</octave></pitch>'
+            '<duration>1</duration><voice>1</voice><type>quarter</type></note>'
+            for n in range(4))
+
+        measures.append(f'<measure number="{m + 1}">{attributes}'
+            f'<harmony><root><root-step>{root_step}</root-step></root><kind>{kind}</kind></harmony>'
+            f'{notes}</measure>')
+
+    return ('<?xml version="1.0" encoding="UTF-8"?>'
+        '<!DOCTYPE score-partwise PUBLIC "-//Recordare//DTD MusicXML 2.0 Partwise//EN" '
+        '"http://www.musicxml.org/dtds/partwise.dtd">'
+        '<score-partwise><part-list><score-part id="P1"><part-name>Melody</part-name></score-part></part-list>'
+        f'<part id="P1">{"".join(measures)}</part></score-partwise>')
+
+def benchmark_stages(score_path, out_folder, repeat, with_music21=False):
+    """
+    Times every stage of the conversion of a score
+
+    Parameters
+    ----------
+    score_path : str
+        The path to the MusicXML file
+    out_folder : str
+        The folder of the temporary midi files
+    repeat : int
+        The number of runs per stage (best is kept)
+    with_music21 : boolean (default: False)
+        if true, also time the music21 key analysis of the midi file
+
+    Returns
+    -------
+    dict
+        The best time in seconds of every stage, the stages after a failure are missing
+        and 'failed' is set to the error
+    """
+    timings = {}
+    out_path = os.path.join(out_folder, 'benchmark.mid')
+    transposed_out_path = os.path.join(out_folder, 'benchmark_transposed.mid')
+
+    def read():
+        with open_score(score_path) as f:
+            return f.read()
+
+    timings['read'], data = time_best(read, repeat)
+    timings['prescan'], _ = time_best(lambda: scan_score(score_path), repeat)
+
+    try:
+        for engine, parse in engines.items():
+            def run_parse():
+                handler = scoreToMidiHandler()
+                parse(handler, io.BytesIO(data))
+                return handler
+
+            timings[f'parse_{engine}'], handler = time_best(run_parse, repeat)
+
+        timings['tracks'], tracks = time_best(handler.get_tracks, repeat)
+        timings['key'], _ = time_best(lambda: estimate_key(pitch_class_histogram(tracks[0].tolist() + tracks[1].tolist())), repeat)
+        timings['midi_build'], midi_data = time_best(lambda: encode_midi(tracks), repeat)
+
+        def write():
+            with open(out_path, 'wb') as f:
+                f.write(midi_data)
+
+        timings['midi_write'], _ = time_best(write, repeat)
+        timings['pretty_midi'], _ = time_best(lambda: build_midi(tracks).write(out_path), repeat)
+        timings['convert'], _ = time_best(lambda: score_to_midi(score_path, out_path, verbose=False), repeat)
+
+        timings['transpose_file'], _ = time_best(lambda: transposer.transpose_file(out_path, transposed_out_path, 2), repeat)
+        timings['transpose_12'], _ = time_best(lambda: transpose_variants(midi_data, range(-5, 7)), repeat)
+
+        if with_music21:
+            import music21
+            timings['music21_key'], _ = time_best(lambda: music21.converter.parse(out_path).analyze('key'), 1)
+    except Exception as e:
+        timings['failed'] = f'{type(e).__name__}: {e}'
+
+    return timings
+
+def run_suite(files, repeat, with_music21=False):
+    """
+    Runs the stage benchmark over scores and synthetic scores
+
+    Parameters
+    ----------
+    files : list
+        The paths to the MusicXML files
+    repeat : int
+        The number of runs per stage (best is kept)
+    with_music21 : boolean (default: False)
+        if true, also time the music21 key analysis
+
+    Returns
+    -------
+    dict
+        The stage timings of every score, by score name
+    """
+    results = {}
+
+    with tempfile.TemporaryDirectory() as out_folder:
+        scores = [(os.path.basename(f), f) for f in files]
+
+        for n_measures in synthetic_sizes:
+            synthetic_path = os.path.join(out_folder, f'synthetic_{n_measures}.xml')
+            with open(synthetic_path, 'w', encoding='utf-8') as f:
+                f.write(synthetic_score(n_measures))
+            scores.append((os.path.basename(synthetic_path), synthetic_path))
+
+        for name, score_path in scores:
+            results[name] = benchmark_stages(score_path, out_folder, repeat, with_music21)
+            print_timings(name, results[name])
+
+    return results
+
+def time_startup(code, repeat):
+    """
+    Times code in a fresh interpreter
+
+    Parameters
+    ----------
+    code : str
+        The python code to time
+    repeat : int
+        The number of interpreters to start
+
+    Returns
+    -------
+    float
+        The best time in seconds
+    list
+        The heavy modules loaded by the code
+    """
+    script = ('import sys, time\n'
+        'start = time.perf_counter()\n'
+        f'{code}\n'
+        'elapsed = time.perf_counter() - start\n'
+        f'print(elapsed, *[m for m in {heavy_modules!r} if m in sys.modules])')
+    best = None
+
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', script], cwd=repo_folder, capture_output=True, text=True, check=True)
+        elapsed, *loaded = output.stdout.split()
+
+        if best is None or float(elapsed) < best:
+            best = float(elapsed)
+
+    return best, loaded
+
+def benchmark_startup(repeat):
+    """
+    Times the startup of every command
+
+    Parameters
+    ----------
+    repeat : int
+        The number of runs per stage (best is kept)
+
+    Returns
+    -------
+    dict
+        The best time in seconds of every startup stage, 'failed' is set if a stage loads a heavy module
+    """
+    timings = {}
+    failed = []
+
+    for stage, code in startup_stages.items():
+        timings[stage], loaded = time_startup(code, repeat)
+        if loaded and stage != 'import_transposer':
+            failed.append(f'{stage} loads {", ".join(loaded)}')
+
+    if failed:
+        timings['failed'] = '; '.join(failed)
+
+    return timings
+
+def print_timings(name, timings):
+    stages = ', '.join(f'{stage} {value * 1000:.2f}' for stage, value in timings.items() if stage != 'failed')
+    failed = f' (failed: {timings["failed"]})' if 'failed' in timings else ''
+    print(f'{name:<30} [ms] {stages}{failed}')
+
+def compare(results, baseline, threshold, min_delta=1e-4):
+    """
+    Compares stage timings to a baseline
+
+    Parameters
+    ----------
+    results : dict
+        The current stage timings, by score name
+    baseline : dict
+        The baseline stage timings, by score name
+    threshold : float
+        The relative slowdown above which a stage is flagged (e.g. 0.2 for 20%)
+    min_delta : float (default: 0.1 ms)
+        The absolute slowdown in seconds under which a stage is never flagged (timer noise)
+
+    Returns
+    -------
+    list
+        The regressions as (score name, stage, baseline time, current time)
+    """
+    regressions = []
+
+    for name, timings in results.items():
+        for stage, value in timings.items():
+            old_value = baseline.get(name, {}).get(stage)
+            if stage == 'failed' or old_value is None:
+                continue
+
+            if value > old_value * (1 + threshold) and value - old_value > min_delta:
+                regressions.append((name, stage, old_value, value))
+
+    return regressions
+
+def benchmark_examples(folder, repeat, engine):
+    files = sorted(glob.glob(os.path.join(folder, '*.xml')))
+    total = 0
+
+    with tempfile.TemporaryDirectory() as out_folder:
+        for f in files:
+            file_name = os.path.basename(f)
+            out_path = os.path.join(out_folder, os.path.splitext(file_name)[0] + '.mid')
+            elapsed, failed = time_conversion(f, out_path, repeat, engine)
+            total += elapsed
+
+            print(f'{file_name:<30} {elapsed * 1000:8.2f} ms' + (' (failed)' if failed else ''))
+
+    print(f'{"Total":<30} {total * 1000:8.2f} ms')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the MusicXML to midi conversion')
+    parser.add_argument('--folder', default=examples_folder, help='folder containing the .xml scores')
+    parser.add_argument('--repeat', type=int, default=20, help='number of runs per score (best is kept)')
+    parser.add_argument('--engine', default='sax', choices=list(engines), help='parsing engine')
+    parser.add_argument('--stages', action='store_true', help='time every stage, on the scores and synthetic scores')
+    parser.add_argument('--startup', action='store_true', help='time the imports of every command in a fresh interpreter')
+    parser.add_argument('--music21', action='store_true', help='with --stages, also time the music21 key analysis (slow)')
+    parser.add_argument('--save', metavar='JSON', help='with --stages or --startup, save the timings as a baseline')
+    parser.add_argument('--compare', metavar='JSON', help='with --stages or --startup, compare the timings to a baseline')
+    parser.add_argument('--threshold', type=float, default=0.2, help='relative slowdown flagged as a regression')
+    args = parser.parse_args()
+
+    if not args.stages and not args.startup:
+        benchmark_examples(args.folder, args.repeat, args.engine)
+        sys.exit(0)
+
+    results = {}
+    if args.stages:
+        files = sorted(glob.glob(os.path.join(args.folder, '*.xml')))
+        results.update(run_suite(files, args.repeat, args.music21))
+
+    if args.startup:
+        results['startup'] = benchmark_startup(args.repeat)
+        print_timings('startup', results['startup'])
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump({'python': platform.python_version(), 'machine': platform.machine(), 'repeat': args.repeat,
+                'results': results}, f, indent=4)
+
+    if args.startup and 'failed' in results['startup']:
+        sys.exit(1)
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+
+        regressions = compare(results, baseline, args.threshold)
+        for name, stage, old_value, value in regressions:
+            print(f'[REGRESSION] {name} {stage}: {old_value * 1000:.2f} ms -> {value * 1000:.2f} ms')
+
+        if regressions:
+            sys.exit(1)
+        print('No regression')
@@ -0,0 +1,273 @@
+"""
+Queryable SQLite index of the metadata of the converted songs.
+
+The conversion records, for every song, its out files (or its id in the sharded
+dataset, see shards.py), key, time signature, length, note counts, pitch range,
+note density and the chord kinds it uses.
+Subsets of the corpus are then selected with a query instead of parsing the
+files again, e.g.:
+
+    with CorpusIndex('index.sqlite') as index:
+        paths = index.query(mode='major', time_signature=(4, 4), chord_vocabulary=['major', 'minor', 'dominant'])
+"""
+
+import json
+import sqlite3
+import numpy as np
+
+schema = '''
+CREATE TABLE IF NOT EXISTS songs (
+    file TEXT PRIMARY KEY,
+    output TEXT,
+    outputs TEXT,
+    song_id INTEGER,
+    tonic TEXT,
+    mode TEXT,
+    beats INTEGER,
+    beat_type INTEGER,
+    length REAL,
+    duration REAL,
+    n_melody INTEGER,
+    n_harmony INTEGER,
+    n_chords INTEGER,
+    pitch_min INTEGER,
+    pitch_max INTEGER,
+    note_density REAL
+);
+CREATE TABLE IF NOT EXISTS chord_kinds (
+    file TEXT,
+    kind TEXT,
+    PRIMARY KEY (file, kind)
+);
+CREATE INDEX IF NOT EXISTS chord_kinds_kind ON chord_kinds (kind);
+'''
+
+# columns of songs filled from the metadata
+metadata_columns = ['tonic', 'mode', 'beats', 'beat_type', 'length', 'duration', 'n_melody', 'n_harmony',
+    'n_chords', 'pitch_min', 'pitch_max', 'note_density']
+
+song_columns = ['file', 'output', 'outputs', 'song_id'] + metadata_columns
+
+def song_metadata(result):
+    """
+    Builds the metadata of a song from its conversion
+
+    Parameters
+    ----------
+    result : dict
+        The result of score_to_midi.score_to_midi
+
+    Returns
+    -------
+    dict
+        The metadata: key, time signature, length (quarter notes) and duration (seconds), note counts,
+        pitch range of the melody, note density (melody notes per quarter note) and chord kinds
+    """
+    melody, harmony = result['tracks']
+    beats, beat_type = result['time_signature']
+    pitches = melody[:, 2] if len(melody) else harmony[:, 2]
+    duration = max(float(track[:, 1].max()) for track in [melody, harmony] if len(track))
+
+    return {
+        'tonic': result['key'][0],
+        'mode': result['key'][1],
+        'beats': beats,
+        'beat_type': beat_type,
+        'length': result['length'],
+        'duration': duration,
+        'n_melody': len(melody),
+        'n_harmony': len(harmony),
+        'n_chords': result['n_chords'],
+        'pitch_min': int(np.min(pitches)),
+        'pitch_max': int(np.max(pitches)),
+        'note_density': len(melody) / result['length'] if result['length'] > 0 else 0.0,
+        'chord_kinds': sorted(set(kind for _, _, _, kind in result['chords']))
+    }
+
+class CorpusIndex:
+    """
+    Defines the index of a converted corpus, stored in a SQLite database
+    """
+    def __init__(self, path):
+        """
+        Initializes the index, creating the database if it does not exist
+
+        Parameters
+        ----------
+        path : str
+            The path to the SQLite database
+        """
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(schema)
+
+        # indexes created before the song ids
+        columns = [row[1] for row in self.connection.execute('PRAGMA table_info(songs)')]
+        if 'song_id' not in columns:
+            self.connection.execute('ALTER TABLE songs ADD COLUMN song_id INTEGER')
+
+    def add(self, in_file_path, outputs, metadata, song_id=None):
+        """
+        Adds or replaces a song
+
+        Parameters
+        ----------
+        in_file_path : str
+            The path to the input score
+        outputs : list
+            The paths to the out files, the first one is returned by query
+        metadata : dict
+            The metadata of the song (see song_metadata)
+        song_id : int (default: None)
+            The id of the song in the sharded dataset, if it was converted to shards
+        """
+        self.remove(in_file_path)
+
+        values = [in_file_path, outputs[0] if outputs else None, json.dumps(outputs), song_id] + [metadata[c] for c in metadata_columns]
+        self.connection.execute(f'INSERT INTO songs ({", ".join(song_columns)}) '
+            f'VALUES ({", ".join("?" * len(values))})', values)
+        self.connection.executemany('INSERT INTO chord_kinds (file, kind) VALUES (?, ?)',
+            [(in_file_path, kind) for kind in metadata['chord_kinds']])
+
+    def remove(self, in_file_path):
+        self.connection.execute('DELETE FROM songs WHERE file = ?', (in_file_path,))
+        self.connection.execute('DELETE FROM chord_kinds WHERE file = ?', (in_file_path,))
+
+    def prune(self, in_file_paths):
+        """
+        Removes the songs whose input score is not in a list (e.g. deleted from the corpus)
+
+        Parameters
+        ----------
+        in_file_paths : list
+            The paths to the input scores to keep
+        """
+        kept = set(in_file_paths)
+        for (in_file_path,) in self.connection.execute('SELECT file FROM songs').fetchall():
+            if in_file_path not in kept:
+                self.remove(in_file_path)
+
+    def merge(self, path, song_id_offset=0):
+        """
+        Adds or replaces the songs of another index (e.g. the index of a shard of the corpus)
+
+        Parameters
+        ----------
+        path : str
+            The path to the SQLite database of the other index
+        song_id_offset : int (default: 0)
+            The number added to the song ids of the other index (e.g. the number of songs of the
+            datasets merged before its own, see shards.merge_datasets)
+        """
+        CorpusIndex(path).close() # adds the song ids to an older index
+        self.connection.commit()
+        self.connection.execute('ATTACH DATABASE ? AS other', (path,))
+
+        columns = ', '.join(song_columns)
+        selected = ', '.join('song_id + ?' if column == 'song_id' else column for column in song_columns)
+        self.connection.execute('DELETE FROM chord_kinds WHERE file IN (SELECT file FROM other.songs)')
+        self.connection.execute(f'INSERT OR REPLACE INTO songs ({columns}) SELECT {selected} FROM other.songs', (song_id_offset,))
+        self.connection.execute('INSERT OR REPLACE INTO chord_kinds SELECT * FROM other.chord_kinds')
+
+        self.connection.commit()
+        self.connection.execute('DETACH DATABASE other')
+
+    def select(self, tonic=None, mode=None, time_signature=None, min_length=None, max_length=None,
+            min_density=None, max_density=None, pitch_range=None, chord_kinds=None, chord_vocabulary=None):
+        """
+        Returns the songs matching all the given criteria
+
+        Parameters
+        ----------
+        tonic : str (default: None)
+            The tonic of the key (e.g. 'C#')
+        mode : str (default: None)
+            The mode of the key, 'major' or 'minor'
+        time_signature : tuple (default: None)
+            The (beats, beat type) of the first measure
+        min_length, max_length : float (default: None)
+            The bounds of the length in quarter notes
+        min_density, max_density : float (default: None)
+            The bounds of the number of melody notes per quarter note
+        pitch_range : tuple (default: None)
+            The (lowest, highest) midi pitches, the melody must stay inside
+        chord_kinds : list (default: None)
+            Chord kinds that the song must all use
+        chord_vocabulary : list (default: None)
+            Chord kinds that the song may use, songs with other kinds are excluded
+
+        Returns
+        -------
+        list
+            The matching songs as dicts of the songs columns, sorted by input path
+        """
+        conditions = []
+        values = []
+
+        for column, operator, value in [('tonic', '=', tonic), ('mode', '=', mode),
+                ('length', '>=', min_length), ('length', '<=', max_length),
+                ('note_density', '>=', min_density), ('note_density', '<=', max_density)]:
+            if value is not None:
+                conditions.append(f'{column} {operator} ?')
+                values.append(value)
+
+        if time_signature is not None:
+            conditions.append('beats = ? AND beat_type = ?')
+            values.extend(time_signature)
+
+        if pitch_range is not None:
+            conditions.append('pitch_min >= ? AND pitch_max <= ?')
+            values.extend(pitch_range)
+
+        for kind in chord_kinds or []:
+            conditions.append('file IN (SELECT file FROM chord_kinds WHERE kind = ?)')
+            values.append(kind)
+
+        if chord_vocabulary is not None:
+            conditions.append(f'file NOT IN (SELECT file FROM chord_kinds WHERE kind NOT IN ({", ".join("?" * len(chord_vocabulary))}))')
+            values.extend(chord_vocabulary)
+
+        where = f' WHERE {" AND ".join(conditions)}' if conditions else ''
+        cursor = self.connection.execute(f'SELECT * FROM songs{where} ORDER BY file', values)
+        columns = [description[0] for description in cursor.description]
+
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def query(self, **criteria):
+        """
+        Returns the out paths of the songs matching all the given criteria (see select)
+
+        Returns
+        -------
+        list
+            The path of the first out file of every matching song, or its id in the sharded
+            dataset (see shards.ShardReader) for the songs converted to shards
+        """
+        return [song['output'] if song['output'] is not None else song['song_id'] for song in self.select(**criteria)]
+
+    def chord_kind_counts(self):
+        """
+        Returns the number of songs using every chord kind
+
+        Returns
+        -------
+        dict
+            The number of songs by chord kind
+        """
+        return dict(self.connection.execute('SELECT kind, COUNT(*) FROM chord_kinds GROUP BY kind ORDER BY kind').fetchall())
+
+    def __len__(self):
+        return self.connection.execute('SELECT COUNT(*) FROM songs').fetchone()[0]
+
+    def commit(self):
+        self.connection.commit()
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,230 @@
+"""
+Detection of duplicate and near-duplicate songs from their parsed notes.
+
+A song is reduced to transposition invariant tokens: the melody intervals with
+the ratios of the successive durations, and the chord root intervals with the
+chord qualities. Shingles (k consecutive tokens) are hashed and summarized by a
+MinHash signature, whose agreement rate estimates the Jaccard similarity of two
+songs. Locality sensitive hashing over bands of the signatures only compares the
+songs likely to be similar, so the detection scales to large corpora.
+"""
+
+import json
+import os
+import numpy as np
+
+# number of consecutive tokens in a shingle
+shingle_size = 4
+
+# MinHash signature of num_perm hashes, split into bands of rows for the LSH
+num_perm = 64
+bands = 16
+
+# multiply-add-shift hash functions of the MinHash (fixed seed, signatures must be comparable between runs)
+_random = np.random.default_rng(0x5eed)
+hash_a = _random.integers(1, 1 << 63, num_perm, dtype=np.uint64) | np.uint64(1)
+hash_b = _random.integers(0, 1 << 63, num_perm, dtype=np.uint64)
+
+def melody_tokens(melody):
+    """
+    Encodes the melody as intervals and duration ratios, the highest note is kept for simultaneous notes
+
+    Parameters
+    ----------
+    melody : np.ndarray
+        The (n, 3) array of [start, end, pitch] notes
+
+    Returns
+    -------
+    np.ndarray
+        The tokens, one per pair of consecutive notes
+    """
+    melody = np.asarray(melody, dtype=np.float64).reshape(-1, 3)
+    melody = melody[np.lexsort((-melody[:, 2], melody[:, 0]))]
+    melody = melody[np.concatenate([[True], np.diff(melody[:, 0]) > 0])] if len(melody) else melody
+
+    intervals = np.clip(np.diff(melody[:, 2]), -24, 24).astype(np.int64)
+    durations = np.maximum(melody[:, 1] - melody[:, 0], 1e-6)
+    ratios = np.clip(np.round(np.log2(durations[1:] / durations[:-1])), -3, 4).astype(np.int64)
+
+    return (intervals + 24) * 8 + ratios + 3
+
+def harmony_tokens(harmony):
+    """
+    Encodes the harmony as root intervals and chord qualities
+
+    Parameters
+    ----------
+    harmony : np.ndarray
+        The (n, 3) array of [start, end, pitch] chord notes
+
+    Returns
+    -------
+    np.ndarray
+        The tokens, one per chord after the first one
+    """
+    harmony = np.asarray(harmony, dtype=np.float64).reshape(-1, 3)
+    if len(harmony) == 0:
+        return np.empty(0, dtype=np.int64)
+
+    starts, chord_index = np.unique(harmony[:, 0], return_inverse=True)
+    pitches = harmony[:, 2].astype(np.int64)
+
+    roots = np.full(len(starts), 1 << 30, dtype=np.int64)
+    np.minimum.at(roots, chord_index, pitches)
+
+    # pitch classes of every chord relative to its root, as a 12 bits mask
+    qualities = np.zeros(len(starts), dtype=np.int64)
+    np.bitwise_or.at(qualities, chord_index, 1 << ((pitches - roots[chord_index]) % 12))
+
+    return (1 << 20) | (np.diff(roots) % 12) << 12 | qualities[1:]
+
+def shingle_hashes(tokens, k=shingle_size):
+    """
+    Hashes the shingles (k consecutive tokens) of a token sequence
+
+    Parameters
+    ----------
+    tokens : np.ndarray
+        The tokens
+    k : int (default: shingle_size)
+        The number of tokens of a shingle
+
+    Returns
+    -------
+    np.ndarray
+        The unique 32 bits hashes of the shingles
+    """
+    if len(tokens) < k:
+        return np.empty(0, dtype=np.uint64)
+
+    windows = np.lib.stride_tricks.sliding_window_view(tokens.astype(np.uint64), k)
+    h = np.zeros(len(windows), dtype=np.uint64)
+    for j in range(k):
+        h = h * np.uint64(0x100000001b3) + windows[:, j]
+
+    return np.unique((h ^ (h >> np.uint64(32))) & np.uint64(0xffffffff))
+
+def fingerprint(melody, harmony):
+    """
+    Computes the MinHash signature of a song
+
+    Parameters
+    ----------
+    melody : np.ndarray
+        The (n, 3) array of [start, end, pitch] melody notes
+    harmony : np.ndarray
+        The (n, 3) array of [start, end, pitch] harmony notes
+
+    Returns
+    -------
+    np.ndarray
+        The signature of num_perm 32 bits hashes, None if the song is too short
+    """
+    # harmony shingles are kept apart from the melody ones by their tokens (bit 20)
+    hashes = np.concatenate([shingle_hashes(melody_tokens(melody)), shingle_hashes(harmony_tokens(harmony))])
+    if len(hashes) == 0:
+        return None
+
+    return ((hash_a[:, None] * hashes[None, :] + hash_b[:, None]) >> np.uint64(32)).min(axis=1).astype(np.uint32)
+
+def similarity(signature_a, signature_b):
+    """
+    Estimates the Jaccard similarity of two songs from their signatures
+
+    Returns
+    -------
+    float
+        The fraction of equal hashes
+    """
+    return float(np.mean(np.asarray(signature_a) == np.asarray(signature_b)))
+
+class LSHIndex:
+    """
+    Defines the locality sensitive hashing index of the song signatures
+    """
+    def __init__(self, threshold=0.8):
+        """
+        Initializes the index
+
+        Parameters
+        ----------
+        threshold : float (default: 0.8)
+            The estimated similarity from which two songs are duplicates
+        """
+        self.threshold = threshold
+        self.keys = []
+        self.signatures = []
+        self.buckets = [{} for _ in range(bands)] # band -> band hashes -> song indexes
+        self.parents = [] # union-find of the duplicates
+
+    def _find(self, i):
+        while self.parents[i] != i:
+            self.parents[i] = self.parents[self.parents[i]]
+            i = self.parents[i]
+
+        return i
+
+    def add(self, key, signature):
+        """
+        Adds a song to the index and links it to its duplicates
+
+        Parameters
+        ----------
+        key : str
+            The identifier of the song (e.g. its file)
+        signature : np.ndarray
+            The signature of the song (see fingerprint)
+        """
+        i = len(self.keys)
+        self.keys.append(key)
+        self.signatures.append(np.asarray(signature, dtype=np.uint32)) # e.g. a list loaded from json
+        self.parents.append(i)
+
+        candidates = set()
+        for band, rows in enumerate(np.split(self.signatures[i], bands)):
+            bucket = self.buckets[band].setdefault(rows.tobytes(), [])
+            candidates.update(bucket)
+            bucket.append(i)
+
+        for j in candidates:
+            if self._find(i) != self._find(j) and similarity(self.signatures[i], self.signatures[j]) >= self.threshold:
+                self.parents[self._find(i)] = self._find(j)
+
+    def clusters(self):
+        """
+        Returns the groups of duplicates
+
+        Returns
+        -------
+        list
+            The clusters of more than one song, each one as a sorted list of keys, sorted by their first key
+        """
+        groups = {}
+        for i, key in enumerate(self.keys):
+            groups.setdefault(self._find(i), []).append(key)
+
+        return sorted((sorted(group) for group in groups.values() if len(group) > 1), key=lambda group: group[0])
+
+def get_report_path(output_folder):
+    return os.path.normpath(output_folder) + '.duplicates.json'
+
+def write_report(path, clusters):
+    """
+    Writes the duplicate clusters, the first file of every cluster is its representative
+
+    Parameters
+    ----------
+    path : str
+        The path to the json report
+    clusters : list
+        The clusters (see LSHIndex.clusters)
+    """
+    report = {
+        'clusters': len(clusters),
+        'duplicates': sum(len(cluster) - 1 for cluster in clusters),
+        'groups': [{'representative': cluster[0], 'files': cluster} for cluster in clusters]
+    }
+
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=4)
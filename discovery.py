@@ -0,0 +1,114 @@
+"""
+Discovery of the input files of a corpus, streamed from its folder tree.
+
+The folders are read with os.scandir, recursively if asked, and every file is
+yielded as soon as its entry is read, the list of the corpus is never built.
+A corpus is split between machines with a shard i/N: a file belongs to the
+shard i if the hash of its path relative to the corpus folder, modulo N, is i.
+Every machine computes its own part without any coordination, and the parts
+do not depend on where the corpus is mounted nor on the other files.
+"""
+
+import hashlib
+import os
+
+def parse_shard(text):
+    """
+    Parses a shard written as i/N
+
+    Parameters
+    ----------
+    text : str
+        The shard, e.g. '0/4' for the first of 4 shards
+
+    Returns
+    -------
+    tuple
+        The (index, count) of the shard
+    """
+    try:
+        index, count = (int(value) for value in text.split('/'))
+    except ValueError:
+        raise NameError(f'Shard misformed, expected i/N: {text}')
+
+    if not 0 <= index < count:
+        raise NameError(f'Shard out of range, expected 0 <= i < N: {text}')
+
+    return index, count
+
+def shard_of(relative_path, count):
+    """
+    Returns the shard of a file
+
+    Parameters
+    ----------
+    relative_path : str
+        The path of the file relative to the corpus folder
+    count : int
+        The number of shards
+
+    Returns
+    -------
+    int
+        The index of the shard of the file
+    """
+    key = relative_path.replace(os.sep, '/').encode('utf-8')
+
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), 'big') % count
+
+def shard_path(path, shard):
+    """
+    Returns the path of the run file (manifest, metrics, index, ...) of a shard
+
+    Parameters
+    ----------
+    path : str
+        The path of the run file of the whole corpus
+    shard : tuple
+        The (index, count) of the shard
+
+    Returns
+    -------
+    str
+        The path of the run file of the shard (e.g. metrics.shard-0-of-4.jsonl for metrics.jsonl)
+    """
+    root, extension = os.path.splitext(os.path.normpath(path))
+
+    return f'{root}.shard-{shard[0]}-of-{shard[1]}{extension}'
+
+def iter_files(folder, extensions, recursive=False, shard=None):
+    """
+    Yields the files of a folder with the given extensions, in the order of the folder entries
+
+    Parameters
+    ----------
+    folder : str
+        The folder of the corpus
+    extensions : tuple
+        The extensions of the files (e.g. ('.xml', '.mxl'))
+    recursive : boolean (default: False)
+        if true, the sub-folders are also read (symbolic links to folders are not followed)
+    shard : tuple (default: None)
+        if set, the (index, count) of the shard, only the files of this shard are yielded
+
+    Yields
+    ------
+    str
+        The path of every file, joined to folder
+    """
+    extensions = tuple(extensions)
+    folders = ['']
+
+    while folders:
+        relative_folder = folders.pop()
+
+        with os.scandir(os.path.join(folder, relative_folder)) as entries:
+            for entry in entries:
+                relative_path = os.path.join(relative_folder, entry.name) if relative_folder else entry.name
+
+                if entry.is_dir(follow_symlinks=False):
+                    if recursive:
+                        folders.append(relative_path)
+                elif entry.name.endswith(extensions) and entry.is_file():
+                    if shard is None or shard_of(relative_path, shard[1]) == shard[0]:
+                        yield os.path.join(folder, relative_path)
@@ -0,0 +1,143 @@
+"""
+Estimates the key of a song from its notes, using the correlation between the
+duration weighted pitch class profile and the key profiles (Krumhansl-Schmuckler
+algorithm with the Aarden-Essen weights, as music21's analyze('key')).
+"""
+
+import numpy as np
+
+# pitch class names, all of them are keys of the conversions dicts
+pitch_class_names = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
+
+# key profiles (Aarden-Essen), index 0 is the tonic
+major_profile = np.array([17.7661, 0.145624, 14.9265, 0.160186, 19.8049, 11.3587,
+    0.291248, 22.062, 0.145624, 8.15494, 0.232998, 4.95122])
+minor_profile = np.array([18.2648, 0.737619, 14.0499, 16.8599, 0.702494, 14.4362,
+    0.702494, 18.6161, 4.56621, 1.93186, 7.37619, 1.75623])
+
+# conversions dict: half steps to transpose a key to C major or A minor
+majors = dict([
+    ("G#", 4),("A", 3),("A#", 2),("B", 1),("C", 0),("C#", -1),("D", -2),("D#", -3),("E", -4),("F", -5),("F#", 6),("G", 5),
+    ("A-", 4),("A", 3),("B-", 2),("B", 1),("C", 0),("D-", -1),("D", -2),("E-", -3),("E", -4),("F", -5),("G-", 6),("G", 5)
+])
+minors = dict([
+    ("G#", 1),("A", 0),("A#", -1),("B", -2),("C", -3),("C#", -4),("D", -5),("D#", 6),("E", 5),("F", 4),("F#", 3),("G", 2),
+    ("A-", 1),("A", 0),("B-", -1),("B", -2),("C", -3),("D-", -4),("D", -5),("E-", 6),("E", 5),("F", 4),("G-", 3),("G", 2)
+])
+
+def _key_profiles():
+    """
+    Builds the centered and normalized matrix of the 24 key profiles
+
+    Returns
+    -------
+    np.ndarray
+        A (12, 24) matrix, columns 0-11 are the major keys and 12-23 the minor keys
+    """
+    profiles = np.stack([np.roll(major_profile, tonic) for tonic in range(12)] +
+        [np.roll(minor_profile, tonic) for tonic in range(12)], axis=1)
+    profiles = profiles - profiles.mean(axis=0)
+
+    return profiles / np.linalg.norm(profiles, axis=0)
+
+key_profiles = _key_profiles()
+
+def pitch_class_histogram(notes):
+    """
+    Computes the pitch class distribution of a list of notes, each pitch class
+    is weighted by the duration of its notes
+
+    Parameters
+    ----------
+    notes : list or np.ndarray
+        The notes as [start, end, pitch] rows
+
+    Returns
+    -------
+    np.ndarray
+        The 12 bins histogram
+    """
+    notes = np.asarray(notes, dtype=np.float64).reshape(-1, 3)
+    pitch_classes = notes[:, 2].astype(np.int64) % 12
+
+    return np.bincount(pitch_classes, weights=notes[:, 1] - notes[:, 0], minlength=12)
+
+def estimate_keys(histograms):
+    """
+    Estimates the keys of many songs at once, with a single product between the
+    histograms and the 24 key profiles
+
+    Parameters
+    ----------
+    histograms : np.ndarray
+        The (n, 12) matrix of pitch class histograms (see pitch_class_histogram)
+
+    Returns
+    -------
+    list
+        The keys as (tonic, mode, correlation coefficient), None for the empty or flat histograms
+    """
+    histograms = np.asarray(histograms, dtype=np.float64).reshape(-1, 12)
+    centered = histograms - histograms.mean(axis=1, keepdims=True)
+    norms = np.linalg.norm(centered, axis=1)
+    valid = norms > 0
+
+    correlations = centered @ key_profiles
+    correlations[valid] /= norms[valid, None]
+    best = np.argmax(correlations, axis=1)
+
+    keys = []
+    for i, key_index in enumerate(best.tolist()):
+        if not valid[i]:
+            keys.append(None)
+            continue
+
+        mode = 'major' if key_index < 12 else 'minor'
+        keys.append((pitch_class_names[key_index % 12], mode, float(correlations[i, key_index])))
+
+    return keys
+
+def estimate_key(histogram):
+    """
+    Estimates the key corresponding to a pitch class histogram
+
+    Parameters
+    ----------
+    histogram : np.ndarray
+        The 12 bins pitch class histogram (see pitch_class_histogram)
+
+    Returns
+    -------
+    str
+        The name of the tonic (e.g. 'C#')
+    str
+        The mode, 'major' or 'minor'
+    float
+        The correlation coefficient of the estimated key
+    """
+    key = estimate_keys(histogram)[0]
+    if key is None:
+        raise NameError('Key can not be estimated from an empty or flat pitch class histogram')
+
+    return key
+
+def get_half_steps(tonic, mode):
+    """
+    Returns the half steps needed to transpose a key to C major or A minor
+
+    Parameters
+    ----------
+    tonic : str
+        The name of the tonic
+    mode : str
+        The mode, 'major' or 'minor'
+
+    Returns
+    -------
+    int
+        The number of half steps
+    """
+    if mode == 'major':
+        return majors[tonic]
+
+    return minors[tonic]
@@ -0,0 +1,303 @@
+"""
+Persistent manifest of a conversion run, used to skip the input files
+that did not change since the last run, and quarantine of the input files
+that could not be converted in time or memory.
+
+For each input file the manifest records its content hash, the converter
+version, the conversion settings, the written out paths and the outcome of
+the conversion. It also keeps the duplicate detection signatures (see dedup.py)
+by content hash, so only the files which changed are fingerprinted again.
+"""
+
+import hashlib
+import json
+import os
+
+def get_manifest_path(output_folder):
+    """
+    Returns the path of the manifest stored next to an output folder
+
+    Parameters
+    ----------
+    output_folder : str
+        The folder of the out midi files
+
+    Returns
+    -------
+    str
+        The path to the manifest (e.g. output.manifest.json for output/)
+    """
+    return os.path.normpath(output_folder) + '.manifest.json'
+
+def file_hash(file_path, chunk_size=1 << 20):
+    """
+    Computes the hash of the content of a file
+
+    Parameters
+    ----------
+    file_path : str
+        The path to the file
+    chunk_size : int (default: 1 MiB)
+        The size of the chunks read from the file
+
+    Returns
+    -------
+    str
+        The sha1 hex digest of the file
+    """
+    h = hashlib.sha1()
+
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+
+    return h.hexdigest()
+
+class Manifest:
+    """
+    Defines the manifest of a conversion run
+    """
+    # failure categories which only depend on the content of the file (see metrics.failure_category),
+    # the other failures (e.g. io_error, timeout, memory) are retried by the next runs
+    cached_categories = ('unknown_chord', 'misformed_xml', 'no_harmony', 'parts_length', 'parse_error', 'missing_time_signature')
+
+    def __init__(self, path, version):
+        """
+        Initializes the manifest, loading the previous one if it exists
+
+        Parameters
+        ----------
+        path : str
+            The path to the manifest json file
+        version : str
+            The current converter version, entries with another version are outdated
+        """
+        self.path = path
+        self.version = version
+        self.entries = {}
+        self.signatures = {} # content hash -> version, melody part and signature
+
+        if os.path.isfile(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                content = json.load(f)
+
+            # manifests without signatures only have the entries
+            if set(content) == {'entries', 'signatures'}:
+                self.entries = content['entries']
+                self.signatures = content['signatures']
+            else:
+                self.entries = content
+
+    def lookup(self, in_file_path, content_hash, settings):
+        """
+        Returns the entry of an input file if it is still up to date
+
+        Parameters
+        ----------
+        in_file_path : str
+            The path to the input file
+        content_hash : str
+            The current hash of the input file
+        settings : dict
+            The conversion settings (output folders and options), they must be json serializable
+
+        Returns
+        -------
+        dict
+            The entry (hash, version, settings, outputs, success, error, chord), None if the
+            file changed, the converter or the settings changed, the outputs are missing or
+            the conversion failed for a reason which does not depend on the file
+        """
+        entry = self.entries.get(in_file_path)
+
+        if entry is None or entry['hash'] != content_hash or entry['version'] != self.version:
+            return None
+
+        # compare the settings as they are stored (e.g. tuples become lists)
+        if entry.get('settings') != json.loads(json.dumps(settings)):
+            return None
+
+        # a successful conversion must still have its outputs on disk
+        if entry['success'] and not all(os.path.isfile(output) for output in entry['outputs']):
+            return None
+
+        if not entry['success'] and entry.get('category') not in self.cached_categories:
+            return None
+
+        return entry
+
+    def record(self, in_file_path, content_hash, settings, outcome):
+        """
+        Records the outcome of the conversion of an input file
+
+        Parameters
+        ----------
+        in_file_path : str
+            The path to the input file
+        content_hash : str
+            The hash of the input file
+        settings : dict
+            The conversion settings (output folders and options)
+        outcome : dict
+            The outcome of the conversion (outputs, success, error, category, chord and song metadata)
+        """
+        self.entries[in_file_path] = {
+            'hash': content_hash,
+            'version': self.version,
+            'settings': settings,
+            'outputs': outcome['outputs'],
+            'success': outcome['success'],
+            'error': outcome['error'],
+            'category': outcome['category'],
+            'chord': outcome['chord'],
+            'metadata': outcome.get('metadata')
+        }
+
+    def lookup_signature(self, content_hash, melody_part):
+        """
+        Returns the duplicate detection signature of a file content, if it was already computed
+
+        Parameters
+        ----------
+        content_hash : str
+            The hash of the input file
+        melody_part : str
+            The rule choosing the melody part the signature was computed with
+
+        Returns
+        -------
+        dict
+            The entry (version, melody part, signature as a list, None if the song could not be fingerprinted),
+            None if the signature is unknown or outdated
+        """
+        entry = self.signatures.get(content_hash)
+
+        if entry is None or entry['version'] != self.version or entry['melody_part'] != melody_part:
+            return None
+
+        return entry
+
+    def record_signature(self, content_hash, melody_part, signature):
+        """
+        Records the duplicate detection signature of a file content
+
+        Parameters
+        ----------
+        content_hash : str
+            The hash of the input file
+        melody_part : str
+            The rule choosing the melody part the signature was computed with
+        signature : np.ndarray
+            The signature (see dedup.fingerprint), None if the song could not be fingerprinted
+        """
+        self.signatures[content_hash] = {
+            'version': self.version,
+            'melody_part': melody_part,
+            'signature': None if signature is None else [int(value) for value in signature]
+        }
+
+    def prune_signatures(self, content_hashes):
+        """
+        Removes the signatures of the contents which are no longer in the input folder
+
+        Parameters
+        ----------
+        content_hashes : iterable
+            The hashes of the current input files
+        """
+        content_hashes = set(content_hashes)
+        self.signatures = {h: entry for h, entry in self.signatures.items() if h in content_hashes}
+
+    def save(self):
+        """
+        Writes the manifest to disk, the previous one is replaced atomically
+        """
+        tmp_path = self.path + '.tmp'
+
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'entries': self.entries, 'signatures': self.signatures}, f, indent=1, sort_keys=True)
+
+        os.replace(tmp_path, self.path)
+
+class Quarantine:
+    """
+    Defines the quarantine of the input files which timed out, crashed or ran out of memory,
+    they are skipped by the next runs while their content does not change
+    """
+    # failure categories of the quarantined files (see metrics.failure_category)
+    categories = ('timeout', 'crashed', 'memory')
+
+    def __init__(self, path):
+        """
+        Initializes the quarantine, loading the previous one if it exists
+
+        Parameters
+        ----------
+        path : str
+            The path to the quarantine json file
+        """
+        self.path = path
+        self.entries = {}
+
+        if os.path.isfile(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+
+    def lookup(self, in_file_path):
+        """
+        Returns the entry of an input file if it is quarantined and did not change
+
+        Parameters
+        ----------
+        in_file_path : str
+            The path to the input file
+
+        Returns
+        -------
+        dict
+            The entry (hash, category, error), None if the file is not quarantined
+        """
+        entry = self.entries.get(in_file_path)
+
+        if entry is None or not os.path.isfile(in_file_path) or entry['hash'] != file_hash(in_file_path):
+            return None
+
+        return entry
+
+    def add(self, in_file_path, outcome):
+        """
+        Quarantines an input file if its conversion failed with one of the quarantine categories
+
+        Parameters
+        ----------
+        in_file_path : str
+            The path to the input file
+        outcome : dict
+            The outcome of the conversion (error and category)
+
+        Returns
+        -------
+        boolean
+            True if the file was quarantined
+        """
+        if outcome['success'] or outcome.get('category') not in self.categories:
+            return False
+
+        self.entries[in_file_path] = {
+            'hash': file_hash(in_file_path),
+            'category': outcome['category'],
+            'error': outcome['error']
+        }
+
+        return True
+
+    def save(self):
+        """
+        Writes the quarantine to disk, the previous one is replaced atomically
+        """
+        tmp_path = self.path + '.tmp'
+
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, indent=1, sort_keys=True)
+
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,213 @@
+"""
+Per-file metrics of a conversion run, written as JSON Lines, and the run report.
+
+Every converted file gets a record with its wall time, parsing time, number of
+notes and chords, size of the written outputs, peak memory of the converting
+process and, for failures, a failure category. The report gives the throughput
+of the run (files/s, notes/s), the slowest files and the files which needed
+the most memory.
+
+The peak memory of a process (ru_maxrss) only grows: a pool or pipeline worker
+keeps the peak of the largest file it converted. Every record has both this
+peak ('peak_rss') and how much the file raised it ('peak_rss_growth'), which is
+0 for a file fitting under the peak of the previous files of its worker. Only
+the isolated conversion, one process per file, gives the peak of every file.
+"""
+
+import json
+import os
+import xml.sax
+import xml.etree.ElementTree as ET
+import zipfile
+from score_to_midi import UnknownChordError
+
+try:
+    import resource
+except ImportError: # not available on Windows
+    resource = None
+
+# failure categories of the NameError messages raised by the converter, by message prefix
+error_categories = [
+    ('XML misformed', 'misformed_xml'),
+    ('MXL misformed', 'misformed_mxl'),
+    ('A chord tag should be placed', 'misformed_xml'),
+    ('Beat-type or beats not set', 'missing_time_signature'),
+    ('No harmony', 'no_harmony'),
+    ('All parts have not the same length', 'parts_length'),
+]
+
+def get_summary_path(metrics_path):
+    """
+    Returns the path of the run report stored next to a metrics file
+
+    Parameters
+    ----------
+    metrics_path : str
+        The path to the .jsonl metrics file
+
+    Returns
+    -------
+    str
+        The path to the report (e.g. metrics.summary.json for metrics.jsonl)
+    """
+    return os.path.splitext(metrics_path)[0] + '.summary.json'
+
+def failure_category(error):
+    """
+    Returns the category of a conversion error
+
+    Parameters
+    ----------
+    error : Exception
+        The error raised by the conversion
+
+    Returns
+    -------
+    str
+        The category, e.g. 'unknown_chord', 'no_harmony', 'parse_error', 'memory', 'io_error' or 'other'
+        ('timeout' and 'crashed' are set by the isolated conversion, see batch_convert.py)
+    """
+    if isinstance(error, UnknownChordError):
+        return 'unknown_chord'
+
+    if isinstance(error, (xml.sax.SAXParseException, ET.ParseError)):
+        return 'parse_error'
+
+    if isinstance(error, (zipfile.BadZipFile, KeyError)):
+        return 'misformed_mxl'
+
+    if isinstance(error, MemoryError):
+        return 'memory'
+
+    if isinstance(error, OSError):
+        return 'io_error'
+
+    if isinstance(error, NameError):
+        for prefix, category in error_categories:
+            if str(error).startswith(prefix):
+                return category
+
+    return 'other'
+
+def peak_rss():
+    """
+    Returns the peak resident memory of the current process since it started
+
+    Returns
+    -------
+    int
+        The peak memory in bytes, None if it can not be measured on this platform
+    """
+    if resource is None:
+        return None
+
+    # kilobytes on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def output_size(paths):
+    return sum(os.path.getsize(path) for path in paths if os.path.exists(path))
+
+class MetricsLog:
+    """
+    Defines the metrics of a conversion run, one JSON record per line
+    """
+    def __init__(self, path):
+        """
+        Initializes the log, any previous log at this path is replaced
+
+        Parameters
+        ----------
+        path : str
+            The path to the .jsonl file
+        """
+        self.path = path
+        self.records = []
+        self.file = open(path, 'w', encoding='utf-8')
+
+    def record(self, outcome):
+        """
+        Records the metrics of a conversion
+
+        Parameters
+        ----------
+        outcome : dict
+            The outcome of the conversion (see batch_convert.convert_file)
+        """
+        record = {'file': outcome['file'], 'success': outcome['success'], 'cached': outcome['cached'],
+            'category': outcome.get('category'), 'error': outcome['error']}
+        record.update(outcome.get('metrics', {}))
+
+        self.records.append(record)
+        self.file.write(json.dumps(record) + '\n')
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def summarize(records, elapsed, n_slowest=10):
+    """
+    Builds the report of a conversion run
+
+    Parameters
+    ----------
+    records : list
+        The metrics records (see MetricsLog.record)
+    elapsed : float
+        The wall time of the run in seconds
+    n_slowest : int (default: 10)
+        The number of slowest files listed
+
+    Returns
+    -------
+    dict
+        The counts, throughput, failure categories and slowest files of the run
+    """
+    converted = [r for r in records if not r['cached']]
+    n_notes = sum(r.get('n_notes', 0) for r in converted)
+    categories = {}
+
+    for r in converted:
+        if not r['success']:
+            categories[r['category']] = categories.get(r['category'], 0) + 1
+
+    slowest = sorted(converted, key=lambda r: r.get('wall_time', 0), reverse=True)[:n_slowest]
+    peaks = [r['peak_rss'] for r in converted if r.get('peak_rss') is not None]
+    growths = [r for r in converted if r.get('peak_rss_growth')]
+    most_memory = sorted(growths, key=lambda r: r['peak_rss_growth'], reverse=True)[:n_slowest]
+
+    return {
+        'files': len(records),
+        'converted': len(converted),
+        'cached': len(records) - len(converted),
+        'failed': sum(not r['success'] for r in converted),
+        'elapsed': elapsed,
+        'files_per_second': len(converted) / elapsed if elapsed > 0 else None,
+        'notes_per_second': n_notes / elapsed if elapsed > 0 else None,
+        'n_notes': n_notes,
+        'output_size': sum(r.get('output_size', 0) for r in converted),
+        'peak_rss': max(peaks, default=None),
+        'failure_categories': categories,
+        'slowest': [{'file': r['file'], 'wall_time': r.get('wall_time'), 'parse_time': r.get('parse_time'),
+            'n_notes': r.get('n_notes'), 'success': r['success']} for r in slowest],
+        'most_memory': [{'file': r['file'], 'peak_rss_growth': r['peak_rss_growth'], 'n_notes': r.get('n_notes'),
+            'success': r['success']} for r in most_memory],
+    }
+
+def print_summary(summary):
+    print(f'\nConverted: {summary["converted"]} files in {summary["elapsed"]:.2f} s')
+    if summary['files_per_second'] is not None:
+        print(f'Throughput: {summary["files_per_second"]:.2f} files/s, {summary["notes_per_second"]:.0f} notes/s')
+    print('Failure categories:')
+    print(json.dumps(summary['failure_categories'], indent=4, sort_keys=True))
+    print('Slowest files:')
+    for r in summary['slowest']:
+        print(f'{r["wall_time"] * 1000:10.2f} ms  {os.path.basename(r["file"])}' + ('' if r['success'] else ' (failed)'))
+    if summary.get('most_memory'):
+        print('Most memory (growth of the peak memory of the worker):')
+        for r in summary['most_memory']:
+            print(f'{r["peak_rss_growth"] / (1 << 20):10.2f} MiB  {os.path.basename(r["file"])}' + ('' if r['success'] else ' (failed)'))
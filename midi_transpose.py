@@ -0,0 +1,222 @@
+"""
+Byte-level transposition of Standard MIDI Files.
+
+The track chunks are walked once to find the key byte of every note on, note
+off and polyphonic key pressure event, then only these bytes are rewritten in
+a copy of the file: velocities, programs, tempo and all the other events are
+kept as they are. The key positions of a file are reused for all its shifts.
+The drum channel is never transposed.
+"""
+
+import numpy as np
+
+# tracks of the files written by the converter, the first track is the timing track
+melody_track = 1
+harmony_track = 2
+
+drum_channel = 9
+
+def read_variable_int(data, i):
+    """
+    Reads a midi variable length quantity
+
+    Parameters
+    ----------
+    data : bytes
+        The content of the midi file
+    i : int
+        The position of the first byte
+
+    Returns
+    -------
+    int
+        The value
+    int
+        The position after the last byte
+    """
+    value = 0
+
+    while True:
+        byte = data[i]
+        i += 1
+        value = (value << 7) | (byte & 0x7f)
+        if byte < 0x80:
+            return value, i
+
+def track_key_positions(data, start, end):
+    """
+    Returns the positions of the key bytes of a track chunk
+
+    Parameters
+    ----------
+    data : bytes
+        The content of the midi file
+    start : int
+        The position of the first event of the track
+    end : int
+        The position after the last event of the track
+
+    Returns
+    -------
+    list
+        The positions of the key bytes of the note on, note off and key pressure events
+    """
+    positions = []
+    status = 0
+    i = start
+
+    while i < end:
+        _, i = read_variable_int(data, i) # delta time
+        byte = data[i]
+
+        if byte == 0xff: # meta event: type, length, data
+            length, i = read_variable_int(data, i + 2)
+            i += length
+            status = 0
+        elif byte == 0xf0 or byte == 0xf7: # sysex event: length, data
+            length, i = read_variable_int(data, i + 1)
+            i += length
+            status = 0
+        else:
+            if byte & 0x80:
+                status = byte
+                i += 1
+            elif status == 0:
+                raise NameError('MIDI misformed, data byte without status')
+
+            kind = status & 0xf0
+            if kind in (0x80, 0x90, 0xa0) and status & 0x0f != drum_channel:
+                positions.append(i)
+
+            i += 1 if kind in (0xc0, 0xd0) else 2
+
+    return positions
+
+def key_positions(data, tracks=None):
+    """
+    Returns the positions of the key bytes of the notes of a midi file
+
+    Parameters
+    ----------
+    data : bytes
+        The content of the midi file
+    tracks : list (default: None)
+        The indexes of the tracks to transpose (e.g. [harmony_track]), None for all the tracks
+
+    Returns
+    -------
+    np.ndarray
+        The positions of the key bytes
+    """
+    if data[:4] != b'MThd':
+        raise NameError('MIDI misformed, the MThd chunk is missing')
+
+    positions = []
+    track = 0
+    i = 8 + int.from_bytes(data[4:8], 'big')
+
+    while i + 8 <= len(data):
+        name = data[i:i + 4]
+        end = i + 8 + int.from_bytes(data[i + 4:i + 8], 'big')
+        if end > len(data):
+            raise NameError('MIDI misformed, a chunk is truncated')
+
+        # other chunk types are skipped, as required by the format
+        if name == b'MTrk':
+            if tracks is None or track in tracks:
+                positions.extend(track_key_positions(data, i + 8, end))
+            track += 1
+
+        i = end
+
+    return np.array(positions, dtype=np.int64)
+
+def pitch_range(data, positions):
+    """
+    Returns the lowest and highest keys of a midi file
+
+    Parameters
+    ----------
+    data : bytes
+        The content of the midi file
+    positions : np.ndarray
+        The positions of the key bytes (see key_positions)
+
+    Returns
+    -------
+    tuple
+        The (lowest, highest) keys, None if there is no note
+    """
+    if len(positions) == 0:
+        return None
+
+    keys = np.frombuffer(data, dtype=np.uint8)[positions]
+
+    return int(keys.min()), int(keys.max())
+
+def transpose_midi(data, half_steps, tracks=None, positions=None):
+    """
+    Transposes the notes of a midi file
+
+    Parameters
+    ----------
+    data : bytes
+        The content of the midi file
+    half_steps : int
+        The transposition
+    tracks : list (default: None)
+        The indexes of the tracks to transpose, None for all the tracks
+    positions : np.ndarray (default: None)
+        The positions of the key bytes if already known (see key_positions), tracks is then ignored
+
+    Returns
+    -------
+    bytes
+        The content of the transposed midi file
+    """
+    if positions is None:
+        positions = key_positions(data, tracks)
+
+    out = np.frombuffer(data, dtype=np.uint8).copy()
+    keys = out[positions].astype(np.int64) + half_steps
+
+    if len(keys) and (keys.min() < 0 or keys.max() > 127):
+        raise NameError('Note pitch out of the midi range (0-127)')
+
+    out[positions] = keys
+
+    return out.tobytes()
+
+def transpose_variants(data, shifts, tracks=None):
+    """
+    Transposes a midi file by several shifts, from a single walk of its tracks
+
+    Parameters
+    ----------
+    data : bytes
+        The content of the midi file
+    shifts : list
+        The transpositions in half steps (e.g. range(-5, 7) for all the 12 keys)
+    tracks : list (default: None)
+        The indexes of the tracks to transpose, None for all the tracks
+
+    Returns
+    -------
+    dict
+        The content of the transposed file by shift, for the shifts keeping all the keys in the midi range
+    list
+        The shifts moving keys out of the midi range (0-127)
+    """
+    positions = key_positions(data, tracks)
+    keys = pitch_range(data, positions)
+
+    variants = {}
+    out_of_range = []
+
+    for half_steps in shifts:
+        if keys is not None and (keys[0] + half_steps < 0 or keys[1] + half_steps > 127):
+            out_of_range.append(half_steps)
+        else:
+            variants[half_steps] = transpose_midi(data, half_steps, positions=positions)
+
+    return variants, out_of_range
@@ -0,0 +1,157 @@
+"""
+Direct Standard MIDI File writer for the melody and harmony tracks.
+
+The notes of every track are encoded to bytes in one sorted, vectorized pass,
+without building pretty_midi or mido objects. The output is byte for byte the
+file written by pretty_midi.PrettyMIDI.write for the settings of the converter:
+a type 1 file at 220 ticks per quarter note, a timing track (120 bpm, 4/4)
+and one acoustic grand piano track per list of notes, all notes at velocity 127.
+"""
+
+import struct
+import numpy as np
+
+resolution = 220 # ticks per quarter note
+bpm = 120
+velocity = 127
+program = 0 # acoustic grand piano
+
+# seconds per tick, computed as pretty_midi does so that the times round to the same ticks
+tick_scale = 60.0 / (bpm * resolution)
+
+# channels of the tracks, the drum channel is skipped
+channels = [c for c in range(16) if c != 9]
+
+def chunk(name, data):
+    return name + struct.pack('>L', len(data)) + data
+
+def timing_track():
+    """
+    Encodes the timing track: tempo and 4/4 time signature at tick 0
+
+    Returns
+    -------
+    bytes
+        The MTrk chunk
+    """
+    tempo = int(6e7 / bpm)
+    data = (b'\x00\xff\x51\x03' + tempo.to_bytes(3, 'big') +
+        b'\x00\xff\x58\x04\x04\x02\x18\x08' +
+        b'\x01\xff\x2f\x00')
+
+    return chunk(b'MTrk', data)
+
+def time_to_tick(times):
+    """
+    Converts times in seconds to absolute ticks, negative times are moved to tick 0
+
+    Parameters
+    ----------
+    times : np.ndarray
+        The times in seconds
+
+    Returns
+    -------
+    np.ndarray
+        The ticks
+    """
+    return np.where(times > 0, np.round(times / tick_scale), 0).astype(np.int64)
+
+def encode_variable_int(values):
+    """
+    Encodes delta times as midi variable length quantities (at most 4 bytes)
+
+    Parameters
+    ----------
+    values : np.ndarray
+        The non negative delta times in ticks
+
+    Returns
+    -------
+    np.ndarray
+        The (n, 4) uint8 bytes, right aligned
+    np.ndarray
+        The (n, 4) mask of the bytes used by every value
+    """
+    if len(values) and values.max() >= 1 << 28:
+        raise NameError('Delta time too large for a midi file')
+
+    shifts = np.array([21, 14, 7, 0])
+    groups = (values[:, None] >> shifts) & 0x7f
+    n_bytes = 1 + (values >= 1 << 7) + (values >= 1 << 14) + (values >= 1 << 21)
+
+    data = (groups | np.array([0x80, 0x80, 0x80, 0])).astype(np.uint8)
+    mask = np.arange(4)[None, :] >= 4 - n_bytes[:, None]
+
+    return data, mask
+
+def encode_track(notes, channel, half_steps=0):
+    """
+    Encodes a piano track: program change then the note on and note off
+    (note on with velocity 0) events, with running status
+
+    Parameters
+    ----------
+    notes : np.ndarray
+        The (n, 3) array of [start, end, pitch] notes, times in seconds
+    channel : int
+        The midi channel
+    half_steps : int (default: 0)
+        The transposition applied to every note
+
+    Returns
+    -------
+    bytes
+        The MTrk chunk
+    """
+    notes = np.asarray(notes, dtype=np.float64).reshape(-1, 3)
+    pitches = notes[:, 2].astype(np.int64) + half_steps
+    if len(pitches) and (pitches.min() < 0 or pitches.max() > 127):
+        raise NameError('Note pitch out of the midi range (0-127)')
+
+    n = len(notes)
+    ticks = np.concatenate([time_to_tick(notes[:, 0]), time_to_tick(notes[:, 1])])
+    events_pitch = np.concatenate([pitches, pitches])
+    events_velocity = np.concatenate([np.full(n, velocity), np.zeros(n, dtype=np.int64)])
+
+    # same order as pretty_midi: by tick, then pitch, then velocity (note off first)
+    order = np.lexsort((events_velocity, events_pitch, ticks))
+    ticks = ticks[order]
+
+    delta, delta_mask = encode_variable_int(np.diff(ticks, prepend=0))
+
+    # the status byte is written once, the following note on events use the running status
+    events = np.zeros((2 * n, 7), dtype=np.uint8)
+    mask = np.ones((2 * n, 7), dtype=bool)
+    events[:, :4] = delta
+    mask[:, :4] = delta_mask
+    events[:, 4] = 0x90 | channel
+    mask[1:, 4] = False
+    events[:, 5] = events_pitch[order]
+    events[:, 6] = events_velocity[order]
+
+    # end of track one tick after the last event
+    data = bytes([0, 0xc0 | channel, program]) + events[mask].tobytes() + b'\x01\xff\x2f\x00'
+
+    return chunk(b'MTrk', data)
+
+def encode_midi(tracks, half_steps=0):
+    """
+    Encodes notes to a midi file, with one piano track per list of notes
+
+    Parameters
+    ----------
+    tracks : list
+        The tracks, each one being a (n, 3) array of [start, end, pitch] notes
+    half_steps : int (default: 0)
+        The transposition applied to every note
+
+    Returns
+    -------
+    bytes
+        The content of the midi file
+    """
+    header = chunk(b'MThd', struct.pack('>hhh', 1, len(tracks) + 1, resolution))
+    encoded = [encode_track(notes, channels[c % len(channels)], half_steps) for c, notes in enumerate(tracks)]
+
+    return header + timing_track() + b''.join(encoded)
@@ -0,0 +1,147 @@
+"""
+Quantized piano rolls of the melody and harmony tracks, built directly from the notes.
+
+The rolls are boolean (128, n_frames) arrays, as pretty_midi's get_piano_roll,
+with a resolution expressed in frames per quarter note. They are stored
+bit-packed along the time axis in compressed .npz files.
+"""
+
+import io
+import numpy as np
+
+def note_frames(notes, resolution, bpm=120):
+    """
+    Quantizes the start and end times of notes to frames
+
+    Parameters
+    ----------
+    notes : np.ndarray
+        The (n, 3) array of [start, end, pitch] notes, times in seconds
+    resolution : int
+        The number of frames per quarter note
+    bpm : int (default: 120)
+        The tempo used to convert seconds to quarter notes
+
+    Returns
+    -------
+    np.ndarray
+        The start frames
+    np.ndarray
+        The end frames (excluded), a note lasts at least one frame
+    """
+    frames_per_second = resolution * bpm / 60.0
+    starts = np.round(notes[:, 0] * frames_per_second).astype(np.int64)
+    ends = np.round(notes[:, 1] * frames_per_second).astype(np.int64)
+
+    return starts, np.maximum(ends, starts + 1)
+
+def piano_roll(notes, resolution, bpm=120, n_frames=None):
+    """
+    Builds the piano roll of a track with scatter operations (no loop over the notes)
+
+    Parameters
+    ----------
+    notes : np.ndarray
+        The (n, 3) array of [start, end, pitch] notes, times in seconds
+    resolution : int
+        The number of frames per quarter note
+    bpm : int (default: 120)
+        The tempo used to convert seconds to quarter notes
+    n_frames : int (default: None)
+        The length of the roll, if None it ends with the last note
+
+    Returns
+    -------
+    np.ndarray
+        The (128, n_frames) boolean piano roll
+    """
+    notes = np.asarray(notes, dtype=np.float64).reshape(-1, 3)
+    starts, ends = note_frames(notes, resolution, bpm)
+    pitches = notes[:, 2].astype(np.int64)
+
+    if n_frames is None:
+        n_frames = int(ends.max()) if len(ends) else 0
+    ends = np.minimum(ends, n_frames)
+    keep = starts < n_frames
+
+    # +1 at the start of each note and -1 at its end, the cumulative sum gives the active notes
+    onsets = np.zeros((128, n_frames + 1), dtype=np.int32)
+    np.add.at(onsets, (pitches[keep], starts[keep]), 1)
+    np.add.at(onsets, (pitches[keep], ends[keep]), -1)
+
+    return np.cumsum(onsets, axis=1)[:, :n_frames] > 0
+
+def tracks_to_piano_rolls(tracks, resolution, bpm=120):
+    """
+    Builds the piano rolls of the tracks of a song, all with the same length
+
+    Parameters
+    ----------
+    tracks : list
+        The tracks, each one being a (n, 3) array of [start, end, pitch] notes
+    resolution : int
+        The number of frames per quarter note
+    bpm : int (default: 120)
+        The tempo used to convert seconds to quarter notes
+
+    Returns
+    -------
+    list
+        The (128, n_frames) boolean piano rolls
+    """
+    ends = [note_frames(notes, resolution, bpm)[1].max() for notes in tracks if len(notes)]
+    n_frames = int(max(ends, default=0))
+
+    return [piano_roll(notes, resolution, bpm, n_frames) for notes in tracks]
+
+def encode_piano_rolls(melody_roll, harmony_roll, resolution):
+    """
+    Encodes the piano rolls of a song, bit-packed, as the content of a compressed .npz file
+
+    Parameters
+    ----------
+    melody_roll : np.ndarray
+        The (128, n_frames) melody piano roll
+    harmony_roll : np.ndarray
+        The (128, n_frames) harmony piano roll
+    resolution : int
+        The number of frames per quarter note
+
+    Returns
+    -------
+    bytes
+        The content of the .npz file
+    """
+    f = io.BytesIO()
+    np.savez_compressed(f,
+        melody=np.packbits(melody_roll, axis=1),
+        harmony=np.packbits(harmony_roll, axis=1),
+        n_frames=melody_roll.shape[1],
+        resolution=resolution)
+
+    return f.getvalue()
+
+def load_piano_rolls(path):
+    """
+    Loads the piano rolls of a song written by the conversion (see encode_piano_rolls)
+
+    Parameters
+    ----------
+    path : str
+        The path to the .npz file
+
+    Returns
+    -------
+    np.ndarray
+        The (128, n_frames) boolean melody piano roll
+    np.ndarray
+        The (128, n_frames) boolean harmony piano roll
+    int
+        The number of frames per quarter note
+    """
+    with np.load(path) as data:
+        n_frames = int(data['n_frames'])
+        melody_roll = np.unpackbits(data['melody'], axis=1, count=n_frames).astype(bool)
+        harmony_roll = np.unpackbits(data['harmony'], axis=1, count=n_frames).astype(bool)
+
+        return melody_roll, harmony_roll, int(data['resolution'])
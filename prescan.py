@@ -0,0 +1,255 @@
+"""
+Fast pre-scan of the chord kinds of MusicXML scores, before their conversion.
+
+Only the raw document (decompressed for .mxl) is searched, as bytes, nothing is
+parsed. The converter only rejects a harmony with a kind missing from
+score_to_midi.mapping_harmony_steps when its chord ends with a duration: an unknown
+chord followed by another chord at the same time, or at the end of its part, is
+dropped. The scan models this: after an unknown kind, the durations of the notes,
+backups and forwards up to the next chord are summed as the converter does, and
+a score is rejected with the UnknownChordError of its conversion on the first
+unknown chord with a duration. The unknown kinds of a whole corpus are counted in
+a fraction of the time of a conversion run.
+
+The scan and the conversion agree as long as the score can be read as bytes:
+a kind written with character references or CDATA is not decoded by the scan,
+a score whose encoding can not be searched as bytes (e.g. UTF-16) is found
+without harmony, and the durations are summed without the clamping of long rests
+to the bar length nor the changes of divisions. The scan only rejects a score on
+an unknown kind, a score found without harmony is still converted, and a score
+failing for another reason (e.g. misformed XML) may be rejected with the unknown
+kind instead of its own error.
+"""
+
+import re
+import time
+from score_to_midi import mapping_harmony_steps, read_score, UnknownChordError
+
+comment_pattern = re.compile(rb'<!--.*?-->', re.S)
+kind_pattern = re.compile(rb'<kind(?:\s[^>]*)?>([^<]*)</kind>')
+# elements moving the time counter of the converter, see scoreToMidiHandler
+timing_pattern = re.compile(rb'<note(?:\s[^>]*)?>|</note>|<chord\s*/?>|<duration(?:\s[^>]*)?>([^<]*)</duration>|</backup>|</forward>')
+hidden_pattern = re.compile(rb'print-object\s*=\s*["\']no["\']')
+
+def harmony_chords(data):
+    """
+    Returns the chords of a MusicXML document, as the converter reads them:
+    harmonies without root step or kind are ignored
+
+    Parameters
+    ----------
+    data : bytes
+        The MusicXML document, without comments
+
+    Returns
+    -------
+    list
+        The chords as (kind, start, end), start and end being the offsets of the <harmony> element
+    """
+    chords = []
+    start = data.find(b'<harmony')
+
+    while start != -1:
+        end = data.find(b'</harmony>', start)
+        if end == -1:
+            break
+
+        block = data[start:end]
+        kind = kind_pattern.search(block)
+        if kind is not None and b'<root-step' in block and kind.group(1).strip():
+            chords.append((kind.group(1).strip().decode('utf-8', 'replace'), start, end))
+
+        start = data.find(b'<harmony', end)
+
+    return chords
+
+def strip_comments(data):
+    """
+    Removes the comments of a MusicXML document, whose elements are not read by the converter
+    """
+    if b'<!--' in data:
+        return comment_pattern.sub(b'', data)
+
+    return data
+
+def harmony_kinds(data):
+    """
+    Returns the kinds of the chords of a MusicXML document, as the converter reads them:
+    harmonies without root step or kind are ignored
+
+    Parameters
+    ----------
+    data : bytes
+        The MusicXML document
+
+    Returns
+    -------
+    list
+        The kinds, in the order of the document
+    """
+    if b'<kind' not in data:
+        return []
+
+    return [kind for kind, _, _ in harmony_chords(strip_comments(data))]
+
+def has_duration(data, start, end):
+    """
+    Checks if the time counter of the converter moves forward between two offsets of a document,
+    i.e. if a chord starting at start and ending at end has a duration
+
+    Parameters
+    ----------
+    data : bytes
+        The MusicXML document, without comments
+    start : int
+        The offset of the start of the chord
+    end : int
+        The offset of the end of the chord (next chord or end of the part)
+
+    Returns
+    -------
+    boolean
+        True if the time at end is after the time at start
+    """
+    # the duration of a chord note is removed from the last duration read, maybe before start
+    duration = 0
+    previous = data.rfind(b'<duration', 0, start)
+    if previous != -1:
+        match = timing_pattern.match(data, previous)
+        if match is not None:
+            duration = int(match.group(1))
+
+    time = 0
+    played = True
+
+    for match in timing_pattern.finditer(data, start, end):
+        token = match.group(0)
+
+        if token == b'</note>':
+            if played:
+                time += duration
+        elif token == b'</backup>':
+            time -= duration
+        elif token == b'</forward>':
+            time += duration
+        elif token.startswith(b'<duration'):
+            duration = int(match.group(1))
+        elif token.startswith(b'<chord'):
+            time -= duration
+        else:
+            played = hidden_pattern.search(token) is None
+
+    return time > 0
+
+def unknown_chords(data):
+    """
+    Returns the unknown kinds of the chords of a MusicXML document which fail its conversion,
+    i.e. the chords with a duration (see has_duration)
+
+    Parameters
+    ----------
+    data : bytes
+        The MusicXML document
+
+    Returns
+    -------
+    tuple
+        The number of chords, and the unknown kinds with a duration, in the order of the document
+    """
+    if b'<kind' not in data:
+        return 0, []
+
+    data = strip_comments(data)
+    chords = harmony_chords(data)
+    unknown = []
+
+    for i, (kind, _, end) in enumerate(chords):
+        if kind in mapping_harmony_steps:
+            continue
+
+        # the chord ends at the next chord of its part, or at the end of the part
+        part_end = data.find(b'</part>', end)
+        if part_end == -1:
+            part_end = len(data)
+        chord_end = min(chords[i + 1][1], part_end) if i + 1 < len(chords) else part_end
+
+        if has_duration(data, end, chord_end):
+            unknown.append(kind)
+
+    return len(chords), unknown
+
+def scan_score(score_path, data=None):
+    """
+    Scans the chord kinds of a score
+
+    Parameters
+    ----------
+    score_path : str
+        The path to the .xml or .mxl file
+    data : bytes (default: None)
+        if set, the MusicXML document already read
+
+    Returns
+    -------
+    dict
+        The scan: file, status ('convertible', 'unknown_chord', 'no_harmony' or 'unreadable'),
+        number of chords, unknown kinds with their number of chords with a duration, first unknown kind
+        with a duration (the one reported by the conversion), error and scan time
+    """
+    start = time.perf_counter()
+    scan = {'file': score_path, 'status': 'convertible', 'n_chords': 0, 'unknown': {}, 'chord': None, 'error': None}
+
+    try:
+        n_chords, unknown = unknown_chords(read_score(score_path) if data is None else data)
+    except Exception as e:
+        scan.update(status='unreadable', error=str(e) or type(e).__name__)
+        n_chords, unknown = 0, []
+
+    for kind in unknown:
+        scan['unknown'][kind] = scan['unknown'].get(kind, 0) + 1
+        if scan['chord'] is None:
+            scan['chord'] = kind
+
+    scan['n_chords'] = n_chords
+
+    if scan['chord'] is not None:
+        scan.update(status='unknown_chord', error=str(UnknownChordError(scan['chord'])))
+    elif scan['status'] == 'convertible' and not n_chords:
+        scan['status'] = 'no_harmony'
+
+    scan['scan_time'] = time.perf_counter() - start
+
+    return scan
+
+def summarize_scans(scans):
+    """
+    Builds the report of the scan of a corpus
+
+    Parameters
+    ----------
+    scans : list
+        The scans of the scores (see scan_score)
+
+    Returns
+    -------
+    dict
+        The number of scores by status, and for every unknown kind the number of scores and chords using it
+        and the first score using it
+    """
+    statuses = {}
+    unknown = {}
+
+    for scan in scans:
+        statuses[scan['status']] = statuses.get(scan['status'], 0) + 1
+
+        for kind, count in scan['unknown'].items():
+            entry = unknown.setdefault(kind, {'files': 0, 'chords': 0, 'example': scan['file']})
+            entry['files'] += 1
+            entry['chords'] += count
+
+    return {
+        'files': len(scans),
+        'statuses': statuses,
+        'scan_time': sum(scan['scan_time'] for scan in scans),
+        'unknown_kinds': dict(sorted(unknown.items(), key=lambda item: (-item[1]['files'], item[0])))
+    }
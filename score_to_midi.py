@@ -7,11 +7,19 @@ Originally based on: https://github.com/qsdfo/musicxml_parser
 import numpy as np
 import xml.sax
 import re
+import io
 import os
-import tempfile
+import json
+import hashlib
+import zipfile
+import contextlib
 import logging
-import pretty_midi
-from total_length_handler import TotalLengthHandler
+import time
+import html.entities
+import xml.etree.ElementTree as ET
+from key_detection import pitch_class_histogram, estimate_key, get_half_steps
+from piano_roll import tracks_to_piano_rolls, encode_piano_rolls
+from midi_writer import encode_midi
 
 # mapping table for note to midi conversion
 mapping_step_midi = {
@@ -115,28 +123,85 @@ mapping_harmony_steps = {
 	# "viennese-trichord": [0, 1, null, 6, 7]
 }
 
+# version of the conversion, to be increased whenever the produced midi files change
+# (the chord table is versioned separately by get_converter_version)
+converter_version = 1
+
+def get_converter_version():
+	"""
+	Returns the version of the converter, made of converter_version and
+	a hash of the note and chord mapping tables
+
+	Returns
+	-------
+	str
+		The converter version
+	"""
+	tables = json.dumps([mapping_step_midi, mapping_harmony_steps], sort_keys=True)
+	tables_hash = hashlib.sha1(tables.encode('utf-8')).hexdigest()[:12]
+
+	return f'{converter_version}-{tables_hash}'
+
+def root_name(step, alter):
+	"""
+	Returns the name of a chord root
+
+	Parameters
+	----------
+	step : str
+		The root step (e.g. 'F')
+	alter : int
+		The alteration in half steps
+
+	Returns
+	-------
+	str
+		The name of the root, e.g. 'F#' or 'Bb'
+	"""
+	alter = int(alter)
+	return step + ('#' * alter if alter > 0 else 'b' * -alter)
+
+# rules to choose the melody part of multi-part scores:
+# 'first' the first part, 'harmony' the first part with chords, 'highest' the part with the highest mean pitch
+melody_part_rules = ('first', 'harmony', 'highest')
+
+class UnknownChordError(NameError):
+	"""
+	Raised when a chord kind is not present in mapping_harmony_steps
+	"""
+	def __init__(self, kind):
+		super().__init__(f'Chord type not present in dictionary: {kind}')
+		self.kind = kind
+
 class scoreToMidiHandler(xml.sax.ContentHandler):
 	"""
 	Defines the xml.sax handler that converts parsed MusicXML file
 	to midi
 	"""
-	def __init__(self, total_length, out_path, remove_silence = True):
+	def __init__(self, remove_silence = True, melody_part = 'harmony'):
 		"""
 		Initalizes the handler class
 
 		Parameters
 		----------
-		total_length : int
-			the total length in number of quarter note of the parsed file
-			(this information can be accessed by first parsing the file with the TotalLengthHandler)
-		out_path : str
-			path to the output midi file
 		remove_silence : boolean (default: True)
 			if true, remove silence at the beginning of the midi file
+		melody_part : str (default: 'harmony')
+			the rule to choose the melody part of multi-part scores, see melody_part_rules,
+			the harmony comes from the melody part or, if it has no chords, from the first part with chords
 		"""
+		if melody_part not in melody_part_rules:
+			raise NameError(f'Melody part rule not available: {melody_part}')
+
 		self.current_element = u""
 		self.content = u""
 		self.remove_silence = remove_silence
+		self.melody_part = melody_part
+
+		# Parts of the score, the tracks are chosen among them at the end of the score
+		self.parts = []
+		self.part_id = u''
+		self.render_notes = True # false for the parts which can not be chosen as melody
 
 		# Measure informations
 		self.time = 0 # time counter
@@ -144,6 +209,13 @@ class scoreToMidiHandler(xml.sax.ContentHandler):
 		self.beat = -1
 		self.beat_type = -1
 		self.bar_length = -1
+		self.beat_set = False
+		self.beat_type_set = False
+
+		# Length informations (in quarter notes)
+		self.part_length = 0 # length of the current part
+		self.part_length_list = [] # length of every parsed part
+		self.total_length = 0 # length of the score, set at the end of the parsing
 
 		# Current note information
 		# Pitch
@@ -179,9 +251,11 @@ class scoreToMidiHandler(xml.sax.ContentHandler):
 		# Midi out
 		self.note_list = []
 		self.harmony_note_list = []
+		self.chord_list = [] # chord symbols of the harmony track, as [start, end, root, kind]
+		self.time_signature = None # (beats, beat type) of the first measure
 		self.bpm = 120
-		self.total_length = total_length
-		self.out_path = out_path
+		self.offset = 0 # initial silence removed from the notes, set at the end of the score
+		self.key = None # (tonic, mode) estimated at the end of the score
 
 		# Tied notes (not phrasing)
 		self.tie_type = None
@@ -212,10 +286,11 @@ class scoreToMidiHandler(xml.sax.ContentHandler):
 				for i in mapping_harmony_steps[self.harmony_prev_kind]:
 					current_chord_pitch = base_pitch + i
 					self.harmony_note_list.append([self.harmony_start_time, harmony_end_time, current_chord_pitch])
+				self.chord_list.append([self.harmony_start_time, harmony_end_time, root_name(self.harmony_prev_root_step, self.harmony_prev_alter), self.harmony_prev_kind])
 				
 				logging.debug(f"[HARMONY] Finishing: {self.harmony_prev_root_step} ({self.harmony_prev_alter}) {self.harmony_prev_kind} - start time: {self.harmony_start_time} - end time: {harmony_end_time} ({self.time}) - base pitch: {base_pitch} - alter: {self.harmony_prev_alter}")
 			else:
-				raise NameError(f'Chord type not present in dictionary: {self.harmony_prev_kind}')
+				raise UnknownChordError(self.harmony_prev_kind)
 		else:
 			logging.debug(f'[HARMONY] Duration not valid - start time: {self.harmony_start_time} - end time: {harmony_end_time}')
 
@@ -237,9 +312,21 @@ class scoreToMidiHandler(xml.sax.ContentHandler):
 			# Set to zeros time information
 			self.time = 0
 			self.division_score = -1
-			# Initialize the midi
+			self.part_length = 0
+			self.beat_set = False
+			self.beat_type_set = False
+			# Initialize the buffers of the part
 			# TODO: Check if this instrument has already been seen ?
+			self.part_id = attributes.get(u'id', u'')
 			self.note_list = []
+			self.harmony_note_list = []
+			self.chord_list = []
+			self.harmony_start_time = -1
+			self.harmony_prev_root_step = u''
+			self.harmony_prev_kind = u''
+			self.harmony_prev_alter = 0
+			# the notes of the parts which can not be chosen are not rendered
+			self.render_notes = self.can_be_melody()
 
 		if tag == u'harmony':
 			self.harmony = True
@@ -310,7 +397,8 @@ class scoreToMidiHandler(xml.sax.ContentHandler):
 				if not self.pitch_set:
 					logging.debug("[WARNING] XML misformed, a Pitch tag is missing")
 					raise NameError('XML misformed, a Pitch tag is missing')
-				 
+
+			if not_a_rest and note_played and self.render_notes:
 				# start, end, duration, pitch
 				start_time_midi = time_midi
 				duration_midi = ( 60.0 / self.bpm ) * self.duration / self.division_score
@@ -375,45 +463,123 @@ class scoreToMidiHandler(xml.sax.ContentHandler):
 		if tag == u'part-name':
 			self.content = u""
 
-		if tag == u'part':    
-			# compute last chord
-			self.compute_chords(time_midi)
-
-			if self.remove_silence:
-				# compute initial offset to remove inital silence
-				offset = min(self.note_list[0][0], self.harmony_note_list[0][0])
-				logging.debug(f'[END] Removing silence - offset: {offset}')
+		if tag == u'measure':
+			if self.beat_set and self.beat_type_set:
+				# Be careful, float must be used
+				self.part_length += float(self.beat * 4.0 / self.beat_type)
+				if self.time_signature is None:
+					self.time_signature = (self.beat, self.beat_type)
 			else:
-				offset = 0
+				raise NameError('Beat-type or beats not set for the first measure of a part')
 
-			# add melody track     
-			out_midi = pretty_midi.PrettyMIDI()
-			piano_program = pretty_midi.instrument_name_to_program('Acoustic grand piano')
-			piano = pretty_midi.Instrument(program=piano_program)
-			
-			for note in self.note_list:
-				pretty_midi_note = pretty_midi.Note(velocity=127, pitch=note[2], start=note[0] - offset, end=note[1] - offset)
-				piano.notes.append(pretty_midi_note)
+		if tag == u'part':
+			# compute last chord of the part
+			if self.harmony_start_time != -1:
+				self.compute_chords(time_midi)
 
-			out_midi.instruments.append(piano)
+			self.parts.append({'id': self.part_id, 'notes': self.note_list, 'harmony': self.harmony_note_list,
+				'chords': self.chord_list})
+			logging.debug(f'[END] Part {self.part_id}: {len(self.note_list)} notes, {len(self.chord_list)} chords')
 
-			# add harmony track
-			if len(self.harmony_note_list) == 0:
-				raise NameError('No harmony was detected in this file')
-			else:
-				piano = pretty_midi.Instrument(program=piano_program)
-				
-				for note in self.harmony_note_list:
-					pretty_midi_note = pretty_midi.Note(velocity=127, pitch=note[2], start=note[0] - offset, end=note[1] - offset)
-					piano.notes.append(pretty_midi_note)
+			self.part_length_list.append(self.part_length)
+
+		if tag == u'score-partwise':
+			# Check if all the parts have the same length
+			if len(set(self.part_length_list)) != 1:
+				raise NameError('All parts have not the same length')
 
-				out_midi.instruments.append(piano)
-				# write midi out
-				out_midi.write(self.out_path)
+			# Add a 1 at the end to allow the last note to stop
+			self.total_length = int(self.part_length_list[0] + 1)
 
-				logging.debug(f'[END] Wrote out .mid at: {self.out_path}')
+			self.select_parts()
 
 		return
+
+	def can_be_melody(self):
+		"""
+		Checks if the current part can still be chosen as melody part, given the parts already parsed
+
+		Returns
+		-------
+		boolean
+			False if the notes of the part are not needed
+		"""
+		if self.melody_part == 'first':
+			return len(self.parts) == 0
+
+		if self.melody_part == 'harmony':
+			return not any(part['harmony'] for part in self.parts)
+
+		return True
+
+	def select_parts(self):
+		"""
+		Chooses the melody and harmony parts, then sets the tracks, the initial offset and the key
+		"""
+		melody_part = self.parts[0]
+
+		if self.melody_part == 'harmony':
+			melody_part = next((part for part in self.parts if part['harmony']), melody_part)
+		elif self.melody_part == 'highest':
+			candidates = [part for part in self.parts if part['notes']]
+			if candidates:
+				melody_part = max(candidates, key=lambda part: np.mean([note[2] for note in part['notes']]))
+
+		harmony_part = melody_part
+		if not melody_part['harmony']:
+			harmony_part = next((part for part in self.parts if part['harmony']), None)
+
+		if harmony_part is None:
+			raise NameError('No harmony was detected in this file')
+
+		logging.debug(f'[END] Melody part: {melody_part["id"]} - harmony part: {harmony_part["id"]}')
+
+		self.note_list = melody_part['notes']
+		self.harmony_note_list = harmony_part['harmony']
+		self.chord_list = harmony_part['chords']
+
+		if self.remove_silence:
+			# compute initial offset to remove inital silence
+			self.offset = min(track[0][0] for track in [self.note_list, self.harmony_note_list] if track)
+			logging.debug(f'[END] Removing silence - offset: {self.offset}')
+		else:
+			self.offset = 0
+
+		# estimate the key on both tracks
+		histogram = pitch_class_histogram(self.note_list + self.harmony_note_list)
+		tonic, mode, _ = estimate_key(histogram)
+		self.key = (tonic, mode)
+		logging.debug(f'[END] Estimated key: {tonic} {mode}')
+
+	def get_tracks(self):
+		"""
+		Returns the melody and harmony tracks of the parsed score,
+		with the initial silence removed
+
+		Returns
+		-------
+		list
+			The melody and harmony tracks, each one being a (n, 3) array of [start, end, pitch] notes
+		"""
+		tracks = []
+
+		for note_list in [self.note_list, self.harmony_note_list]:
+			notes = np.array(note_list, dtype=np.float64).reshape(-1, 3)
+			notes[:, :2] -= self.offset
+			tracks.append(notes)
+
+		return tracks
+
+	def get_chords(self):
+		"""
+		Returns the chord symbols of the parsed score, with the initial silence removed
+
+		Returns
+		-------
+		list
+			The chords as (start, end, root, kind), e.g. (0.0, 2.0, 'F#', 'minor')
+		"""
+		return [(start - self.offset, end - self.offset, root, kind) for start, end, root, kind in self.chord_list]
 		
 	def characters(self, content):
 		"""
@@ -435,9 +601,11 @@ class scoreToMidiHandler(xml.sax.ContentHandler):
 
 			if self.current_element == u"beats":
 				self.beat = int(content)
+				self.beat_set = True
 
 			if self.current_element == u"beat-type":
 				self.beat_type = int(content)
+				self.beat_type_set = True
 				assert (not self.beat == -1), "beat and beat type wrong"
 				assert (not self.division_score == -1), "division non defined"
 				self.bar_length = int(self.division_score * self.beat * 4 / self.beat_type)
@@ -487,54 +655,422 @@ class scoreToMidiHandler(xml.sax.ContentHandler):
 
 		return
 
-def pre_process_file(file_path):
+def build_midi(tracks, half_steps = 0):
+	"""
+	Builds a pretty_midi object from notes, with one piano track per list of notes
+	(write_midi gives the same file without building it, see midi_writer.py)
+
+	Parameters
+	----------
+	tracks : list
+		The tracks, each one being a (n, 3) array of [start, end, pitch] notes
+	half_steps : int (default: 0)
+		The transposition applied to every note
+
+	Returns
+	-------
+	pretty_midi.PrettyMIDI
+		The midi object
+	"""
+	import pretty_midi # imported here, the converter itself does not need it
+
+	out_midi = pretty_midi.PrettyMIDI()
+	piano_program = pretty_midi.instrument_name_to_program('Acoustic grand piano')
+
+	for track in tracks:
+		piano = pretty_midi.Instrument(program=piano_program)
+
+		for note in track:
+			pretty_midi_note = pretty_midi.Note(velocity=127, pitch=int(note[2]) + half_steps, start=float(note[0]), end=float(note[1]))
+			piano.notes.append(pretty_midi_note)
+
+		out_midi.instruments.append(piano)
+
+	return out_midi
+
+def write_file(out_path, data):
+	"""
+	Writes the content of an out file, next to the out path then renamed,
+	so that an interrupted conversion never leaves a partial file
+
+	Parameters
+	----------
+	out_path : str
+		The path to the out file
+	data : bytes
+		The content of the file
+	"""
+	tmp_path = out_path + '.tmp'
+	with open(tmp_path, 'wb') as f:
+		f.write(data)
+
+	os.replace(tmp_path, out_path)
+
+def write_midi(tracks, out_path, half_steps = 0):
+	"""
+	Writes notes to a midi file, with one piano track per list of notes,
+	the file is encoded directly (see midi_writer.py) in a single atomic write
+
+	Parameters
+	----------
+	tracks : list
+		The tracks, each one being a (n, 3) array of [start, end, pitch] notes
+	out_path : str
+		The path to the out midi file
+	half_steps : int (default: 0)
+		The transposition applied to every note
+	"""
+	write_file(out_path, encode_midi(tracks, half_steps))
+
+def in_pitch_range(tracks, half_steps, pitch_range):
 	"""
-	Pre process MusicXML file removig DOCTYPE that would make the xml parser crash
+	Checks if all the notes of the tracks stay in a pitch range once transposed
+
+	Parameters
+	----------
+	tracks : list
+		The tracks, each one being a (n, 3) array of [start, end, pitch] notes
+	half_steps : int
+		The transposition applied to every note
+	pitch_range : tuple
+		The lowest and highest allowed midi pitches (included)
+
+	Returns
+	-------
+	boolean
+		True if all the transposed notes are in the range
+	"""
+	for notes in tracks:
+		if len(notes) and (notes[:, 2].min() + half_steps < pitch_range[0] or notes[:, 2].max() + half_steps > pitch_range[1]):
+			return False
+
+	return True
+
+class NoEntityResolver(xml.sax.handler.EntityResolver):
+	"""
+	Defines an entity resolver that never loads external entities,
+	the DTD referenced by the DOCTYPE is resolved to an empty document
+	"""
+	def resolveEntity(self, publicId, systemId):
+		source = xml.sax.xmlreader.InputSource(systemId)
+		source.setByteStream(io.BytesIO(b''))
+		return source
+
+def make_parser(handler):
+	"""
+	Creates a SAX parser that reads MusicXML files directly, ignoring
+	the DOCTYPE and any external entity it references
+
+	Parameters
+	----------
+	handler : xml.sax.ContentHandler
+		The handler receiving the parsing callbacks
+
+	Returns
+	-------
+	xml.sax.xmlreader.XMLReader
+		The parser
+	"""
+	parser = xml.sax.make_parser()
+	parser.setFeature(xml.sax.handler.feature_namespaces, 0)
+	# never fetch the DTD nor external entities
+	parser.setFeature(xml.sax.handler.feature_external_ges, 0)
+	parser.setFeature(xml.sax.handler.feature_external_pes, 0)
+	parser.setEntityResolver(NoEntityResolver())
+	parser.setContentHandler(handler)
+
+	return parser
 	
+def parse_sax(handler, f):
+	"""
+	Parses a MusicXML stream with the xml.sax parser (reference engine)
+
+	Parameters
+	----------
+	handler : scoreToMidiHandler
+		The handler receiving the parsing callbacks
+	f : file object
+		The binary stream of the MusicXML document
+	"""
+	parser = make_parser(handler)
+	parser.parse(f)
+
+# tags used by scoreToMidiHandler, the other ones are not forwarded by parse_iterparse
+# (they must be kept in sync with startElement, endElement and characters)
+handler_start_tags = {'part', 'harmony', 'note', 'rest', 'chord', 'tie', 'staccato'}
+handler_end_tags = {'pitch', 'harmony', 'note', 'backup', 'forward', 'part-name', 'measure', 'part', 'score-partwise'}
+handler_text_tags = {'divisions', 'beats', 'beat-type', 'root-step', 'kind', 'root-alter', 'duration',
+	'step', 'octave', 'alter', 'voice', 'part-name'}
+handler_tags = handler_start_tags | handler_end_tags | handler_text_tags
+
+def parse_iterparse(handler, f):
+	"""
+	Parses a MusicXML stream with the incremental xml.etree parser, only the tags
+	used by the handler are forwarded to it and every measure is freed once parsed
+
+	Parameters
+	----------
+	handler : scoreToMidiHandler
+		The handler receiving the parsing callbacks
+	f : file object
+		The binary stream of the MusicXML document
+	"""
+	current_part = None
+
+	# the DOCTYPE is ignored, xml.etree never loads external entities, so the named
+	# entities declared by the MusicXML DTD (e.g. &eacute;) are defined here
+	parser = ET.XMLParser()
+	parser.entity.update(html.entities.entitydefs)
+
+	for event, elem in ET.iterparse(f, events=('start', 'end'), parser=parser):
+		tag = elem.tag
+		if tag not in handler_tags:
+			continue
+
+		if event == 'start':
+			if tag == 'part':
+				current_part = elem
+			handler.startElement(tag, elem.attrib)
+		else:
+			# the whole text of the element is known at its end
+			if elem.text is not None and tag in handler_text_tags:
+				handler.characters(elem.text)
+			handler.endElement(tag)
+
+			if tag == 'measure' and current_part is not None:
+				elem.clear()
+				current_part.remove(elem)
+
+# available parsing engines
+engines = {
+	'sax': parse_sax,
+	'iterparse': parse_iterparse
+}
+
+def mxl_root_file(zip_file):
+	"""
+	Finds the name of the MusicXML root file inside a compressed .mxl archive
+	using the META-INF/container.xml manifest
+
 	Parameters
 	----------
-	file_path : str
-		The path to the MusicXML file
+	zip_file : zipfile.ZipFile
+		The opened .mxl archive
 
 	Returns
 	-------
 	str
-		The modified file path
+		The name of the root file member
 	"""
+	try:
+		container = ET.fromstring(zip_file.read('META-INF/container.xml'))
+	except KeyError:
+		raise NameError('MXL misformed, META-INF/container.xml is missing')
 
-	temp_file = tempfile.NamedTemporaryFile('w', suffix='.xml', prefix='tmp', delete=False, encoding='utf-8')
-	
-	# Remove the doctype line
-	with open(file_path, 'r', encoding='utf-8') as fread:
-		file_content = fread.read()
+	rootfile = container.find('.//{*}rootfile')
+	if rootfile is None or not rootfile.get('full-path'):
+		raise NameError('MXL misformed, no rootfile in META-INF/container.xml')
 
-		doctype_start = file_content.find('<!DOCTYPE')
-		doctype_end = doctype_start + file_content[doctype_start:].find('>') + 1
-		doctype_string = file_content[doctype_start:doctype_end]
+	return rootfile.get('full-path')
 
-		file_content = file_content.replace(doctype_string, '')
-		temp_file.write(file_content)
+@contextlib.contextmanager
+def open_score(score_path):
+	"""
+	Opens a MusicXML score as a binary stream, .mxl archives are
+	read directly from their root file member without extracting it
 
-	temp_file_path = temp_file.name
-	temp_file.close()
-	
-	# Return the new path
-	return temp_file_path
-	
-def score_to_midi(score_path, out_path, verbose = True, remove_silence = True):
+	Parameters
+	----------
+	score_path : str
+		The path to the .xml or .mxl file
+
+	Yields
+	------
+	file object
+		The binary stream of the MusicXML document
+	"""
+	if score_path.lower().endswith('.mxl'):
+		with zipfile.ZipFile(score_path, 'r') as zip_file:
+			with zip_file.open(mxl_root_file(zip_file)) as f:
+				yield f
+	else:
+		with open(score_path, 'rb') as f:
+			yield f
+
+def read_score(score_path):
+	"""
+	Reads the MusicXML document of a score, from the .mxl archive if compressed
+
+	Parameters
+	----------
+	score_path : str
+		The path to the .xml or .mxl file
+
+	Returns
+	-------
+	bytes
+		The MusicXML document
+	"""
+	with open_score(score_path) as f:
+		return f.read()
+
+def parse_score(score_path, remove_silence = True, engine = 'sax', melody_part = 'harmony', data = None):
+	"""
+	Parses a MusicXML score into its melody and harmony tracks, nothing is written
+
+	Parameters
+	----------
+	score_path : str
+		The path to the MusicXML file (.xml or compressed .mxl)
+	remove_silence : boolean (default: True)
+		if true, remove silence at the beginning of the tracks
+	engine : str (default: 'sax')
+		the parsing engine, 'sax' (reference) or 'iterparse', see engines
+	melody_part : str (default: 'harmony')
+		the rule to choose the melody part of multi-part scores, see melody_part_rules
+	data : bytes (default: None)
+		if set, the MusicXML document already read (see read_score), score_path is not opened
+
+	Returns
+	-------
+	dict
+		The song: path, name, melody and harmony tracks as (n, 3) arrays of [start, end, pitch]
+		notes (times in seconds), key as (tonic, mode), time signature as (beats, beat type),
+		chord symbols (see scoreToMidiHandler.get_chords), length in quarter notes, bpm and parsing time in seconds
+	"""
+	if engine not in engines:
+		raise NameError(f'Parsing engine not available: {engine}')
+
+	# the length of the parts is checked in the same pass
+	# the file is streamed from disk (or from the .mxl archive) by the parser, the DOCTYPE is ignored
+	Handler_score = scoreToMidiHandler(remove_silence, melody_part)
+	parse_start = time.perf_counter()
+	if data is not None:
+		engines[engine](Handler_score, io.BytesIO(data))
+	else:
+		with open_score(score_path) as f:
+			engines[engine](Handler_score, f)
+	parse_time = time.perf_counter() - parse_start
+
+	melody, harmony = Handler_score.get_tracks()
+
+	return {
+		'path': score_path,
+		'name': os.path.splitext(os.path.basename(score_path))[0],
+		'melody': melody,
+		'harmony': harmony,
+		'key': Handler_score.key,
+		'time_signature': Handler_score.time_signature,
+		'chords': Handler_score.get_chords(),
+		'length': Handler_score.part_length_list[0],
+		'bpm': Handler_score.bpm,
+		'parse_time': parse_time
+	}
+
+def iter_scores(paths, remove_silence = True, engine = 'sax', skip_errors = False, melody_part = 'harmony'):
+	"""
+	Parses MusicXML scores one after the other, the songs are kept in memory
+	and no midi file is written (see write_songs to write them)
+
+	Parameters
+	----------
+	paths : iterable
+		The paths to the MusicXML files
+	remove_silence : boolean (default: True)
+		if true, remove silence at the beginning of the tracks
+	engine : str (default: 'sax')
+		the parsing engine, see engines
+	skip_errors : boolean (default: False)
+		if true, the scores that can not be converted are logged and skipped instead of raising
+	melody_part : str (default: 'harmony')
+		the rule to choose the melody part of multi-part scores, see melody_part_rules
+
+	Yields
+	------
+	dict
+		The song of every score (see parse_score)
+	"""
+	for score_path in paths:
+		try:
+			song = parse_score(score_path, remove_silence, engine, melody_part)
+		except Exception as e:
+			if not skip_errors:
+				raise
+			logging.info(f'[SKIP] {score_path}: {e}')
+			continue
+
+		yield song
+
+def write_songs(songs, out_folder, half_steps = 0):
+	"""
+	Midi sink of iter_scores, writes every song of a stream to a midi file
+
+	Parameters
+	----------
+	songs : iterable
+		The songs (see parse_score)
+	out_folder : str
+		The folder of the out midi files, named after the scores
+	half_steps : int or 'key' (default: 0)
+		the transposition in half steps, 'key' transposes each song to C major / A minor
+
+	Yields
+	------
+	dict
+		The songs, with the path of their midi file set as 'midi_path'
+	"""
+	for song in songs:
+		steps = get_half_steps(*song['key']) if half_steps == 'key' else half_steps
+		song['midi_path'] = os.path.join(out_folder, song['name'] + '.mid')
+		write_midi([song['melody'], song['harmony']], song['midi_path'], steps)
+
+		yield song
+
+def score_to_midi(score_path, out_path, verbose = True, remove_silence = True, transposed_out_path = None,
+	augmented_out_paths = None, pitch_range = (0, 127), piano_roll_path = None, piano_roll_resolution = 4, engine = 'sax',
+	melody_part = 'harmony', data = None, write = True):
 	"""
 	Main method to convert a MusicXML score to midi
 	
 	Parameters
 	----------
 	score_path : str
-		The path to the MusicXML file
+		The path to the MusicXML file (.xml or compressed .mxl)
 	out_path : str
-		The path to the out midi file
+		The path to the out midi file, if None only the tracks are returned
 	verbose : boolean (default: True)
 		if true, shows log
 	remove_silence : boolean (default: True)
 		if true, remove silence at the beginning of the midi file
+	transposed_out_path : str (default: None)
+		if set, the path to the out midi file transposed to C major / A minor,
+		written in the same pass using the key estimated from the parsed notes
+	augmented_out_paths : dict (default: None)
+		if set, the out midi files of transposed variants of the score, as {half steps: path},
+		all the variants are written from the notes of a single parsing
+	pitch_range : tuple (default: (0, 127))
+		the lowest and highest midi pitches allowed in the variants, the variants having notes
+		out of the range are skipped
+	piano_roll_path : str (default: None)
+		if set, the path to the .npz file of the melody and harmony piano rolls (see piano_roll.py)
+	piano_roll_resolution : int (default: 4)
+		the resolution of the piano rolls in frames per quarter note
+	engine : str (default: 'sax')
+		the parsing engine, 'sax' (reference) or 'iterparse', see engines
+	melody_part : str (default: 'harmony')
+		the rule to choose the melody part of multi-part scores, see melody_part_rules
+	data : bytes (default: None)
+		if set, the MusicXML document already read (see read_score), score_path is not opened
+	write : boolean (default: True)
+		if false, the out files are encoded but not written, they are returned as (path, content) in 'files'
+
+	Returns
+	-------
+	dict
+		The estimated key of the score as (tonic, mode), the melody and harmony tracks
+		as (n, 3) arrays of [start, end, pitch] notes, the paths of the out files,
+		the number of chords, the parsing time in seconds, the time signature, the chord symbols,
+		the length in quarter notes and, if not write, the encoded files
 	"""
 	logging_level = logging.DEBUG
 	if not verbose:
@@ -548,28 +1084,52 @@ def score_to_midi(score_path, out_path, verbose = True, remove_silence = True):
 
 	logging.debug(f'[START] Currently working on: {score_path}')
 
-	# remove DOCTYPE
-	tmp_file_path = pre_process_file(score_path)
+	# parse the file and get the melody and harmony tracks
+	song = parse_score(score_path, remove_silence, engine, melody_part, data)
 
-	# get the total length in quarter notes of the track
-	pre_parser = xml.sax.make_parser()
-	pre_parser.setFeature(xml.sax.handler.feature_namespaces, 0)
-	handler_length = TotalLengthHandler()
-	pre_parser.setContentHandler(handler_length)
-	pre_parser.parse(tmp_file_path)
-	total_length = int(handler_length.total_length)
+	# write midi out, melody and harmony tracks
+	tracks = [song['melody'], song['harmony']]
+	outputs = []
+	files = []
 
-	# Now parse the file and get the midi
-	parser = xml.sax.make_parser()
-	parser.setFeature(xml.sax.handler.feature_namespaces, 0)
-	Handler_score = scoreToMidiHandler(total_length, out_path, remove_silence)
-	parser.setContentHandler(Handler_score)
-	parser.parse(tmp_file_path)
-	
-	# remove temp preprocessed score file
-	os.remove(tmp_file_path)
-
-	return
+	def output(out_path, content):
+		if write:
+			write_file(out_path, content)
+		else:
+			files.append((out_path, content))
+		outputs.append(out_path)
+
+	if out_path is not None:
+		output(out_path, encode_midi(tracks))
+		logging.debug(f'[END] Wrote out .mid at: {out_path}')
+
+	if transposed_out_path is not None:
+		# write the C major / A minor version
+		half_steps = get_half_steps(*song['key'])
+		output(transposed_out_path, encode_midi(tracks, half_steps))
+		logging.debug(f'[END] Wrote out transposed .mid ({half_steps} half steps) at: {transposed_out_path}')
+
+	if augmented_out_paths is not None:
+		for half_steps, augmented_out_path in augmented_out_paths.items():
+			if not in_pitch_range(tracks, half_steps, pitch_range):
+				logging.debug(f'[END] Skipping variant ({half_steps} half steps), notes out of the pitch range {pitch_range}')
+				continue
+
+			output(augmented_out_path, encode_midi(tracks, half_steps))
+			logging.debug(f'[END] Wrote out variant ({half_steps} half steps) at: {augmented_out_path}')
+
+	if piano_roll_path is not None:
+		melody_roll, harmony_roll = tracks_to_piano_rolls(tracks, piano_roll_resolution, song['bpm'])
+		output(piano_roll_path, encode_piano_rolls(melody_roll, harmony_roll, piano_roll_resolution))
+		logging.debug(f'[END] Wrote out piano rolls at: {piano_roll_path}')
+
+	result = {'key': song['key'], 'tracks': tracks, 'outputs': outputs, 'n_chords': len(song['chords']),
+		'parse_time': song['parse_time'], 'time_signature': song['time_signature'], 'chords': song['chords'],
+		'length': song['length']}
+	if not write:
+		result['files'] = files
+
+	return result
 
 if __name__ == '__main__':
 	# debug only
@@ -0,0 +1,218 @@
+"""
+Compact binary dataset of converted songs, an alternative to one midi file per song.
+
+The melody and harmony notes of every song are appended to large shard files
+(shard_00000.bin, shard_00001.bin, ...) as fixed size records (start, end, pitch).
+An offset index (index.npy) gives, for each song id, its shard, the position of
+its first note and the number of melody and harmony notes, so that any song is
+loaded through numpy.memmap without reading the others. The names of the songs
+are stored in names.json, in the order of their ids.
+"""
+
+import json
+import os
+import numpy as np
+
+# a note, times in seconds
+note_dtype = np.dtype([('start', '<f8'), ('end', '<f8'), ('pitch', '<i2')])
+
+# an entry of the offset index, offset and sizes are in number of notes
+index_dtype = np.dtype([('shard', '<i4'), ('offset', '<i8'), ('n_melody', '<i4'), ('n_harmony', '<i4')])
+
+def get_shard_path(folder, shard):
+    return os.path.join(folder, f'shard_{shard:05d}.bin')
+
+def to_note_array(notes):
+    """
+    Converts notes to a record array of note_dtype
+
+    Parameters
+    ----------
+    notes : np.ndarray
+        The (n, 3) array of [start, end, pitch] notes
+
+    Returns
+    -------
+    np.ndarray
+        The notes as records
+    """
+    notes = np.asarray(notes, dtype=np.float64).reshape(-1, 3)
+    records = np.empty(len(notes), dtype=note_dtype)
+    records['start'] = notes[:, 0]
+    records['end'] = notes[:, 1]
+    records['pitch'] = notes[:, 2]
+
+    return records
+
+class ShardWriter:
+    """
+    Defines the writer of a sharded dataset, songs are appended one after the other
+    """
+    def __init__(self, folder, shard_size=1 << 28):
+        """
+        Initializes the writer, any dataset already in the folder is replaced
+
+        Parameters
+        ----------
+        folder : str
+            The folder of the dataset
+        shard_size : int (default: 256 MiB)
+            The size in bytes after which a new shard is started
+        """
+        self.folder = folder
+        self.shard_size = shard_size
+        self.shard = -1
+        self.shard_file = None
+        self.shard_notes = 0 # number of notes in the current shard
+        self.index = []
+        self.names = []
+
+        os.makedirs(folder, exist_ok=True)
+        self._next_shard()
+
+    def _next_shard(self):
+        if self.shard_file is not None:
+            self.shard_file.close()
+
+        self.shard += 1
+        self.shard_notes = 0
+        self.shard_file = open(get_shard_path(self.folder, self.shard), 'wb')
+
+    def append(self, name, melody, harmony):
+        """
+        Appends a song to the dataset
+
+        Parameters
+        ----------
+        name : str
+            The name of the song
+        melody : np.ndarray
+            The (n, 3) array of [start, end, pitch] melody notes
+        harmony : np.ndarray
+            The (n, 3) array of [start, end, pitch] harmony notes
+
+        Returns
+        -------
+        int
+            The id of the song
+        """
+        records = np.concatenate([to_note_array(melody), to_note_array(harmony)])
+
+        if self.shard_notes > 0 and (self.shard_notes + len(records)) * note_dtype.itemsize > self.shard_size:
+            self._next_shard()
+
+        self.shard_file.write(records.tobytes())
+        self.index.append((self.shard, self.shard_notes, len(melody), len(harmony)))
+        self.names.append(name)
+        self.shard_notes += len(records)
+
+        return len(self.index) - 1
+
+    def close(self):
+        """
+        Closes the current shard and writes the index
+        """
+        self.shard_file.close()
+
+        np.save(os.path.join(self.folder, 'index.npy'), np.array(self.index, dtype=index_dtype))
+        with open(os.path.join(self.folder, 'names.json'), 'w', encoding='utf-8') as f:
+            json.dump(self.names, f, indent=1)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class ShardReader:
+    """
+    Defines the reader of a sharded dataset, songs are loaded by id in O(1)
+    """
+    def __init__(self, folder):
+        """
+        Initializes the reader
+
+        Parameters
+        ----------
+        folder : str
+            The folder of the dataset
+        """
+        self.folder = folder
+        self.index = np.load(os.path.join(folder, 'index.npy'))
+        self.shards = {} # shard number -> memmap, opened on first access
+
+        with open(os.path.join(folder, 'names.json'), 'r', encoding='utf-8') as f:
+            self.names = json.load(f)
+
+    def __len__(self):
+        return len(self.index)
+
+    def _get_shard(self, shard):
+        if shard not in self.shards:
+            self.shards[shard] = np.memmap(get_shard_path(self.folder, shard), dtype=note_dtype, mode='r')
+
+        return self.shards[shard]
+
+    def __getitem__(self, song_id):
+        """
+        Returns the tracks of a song
+
+        Parameters
+        ----------
+        song_id : int
+            The id of the song
+
+        Returns
+        -------
+        np.ndarray
+            The melody notes (records of note_dtype, mapped from the shard)
+        np.ndarray
+            The harmony notes (records of note_dtype, mapped from the shard)
+        """
+        shard, offset, n_melody, n_harmony = self.index[song_id].tolist()
+        notes = self._get_shard(shard)
+
+        return notes[offset:offset + n_melody], notes[offset + n_melody:offset + n_melody + n_harmony]
+
+def merge_datasets(folders, out_folder):
+    """
+    Merges sharded datasets into one, the shard files are moved and renumbered,
+    the song ids follow the order of the folders
+
+    Parameters
+    ----------
+    folders : list
+        The folders of the datasets to merge
+    out_folder : str
+        The folder of the merged dataset
+
+    Returns
+    -------
+    int
+        The number of songs of the merged dataset
+    """
+    os.makedirs(out_folder, exist_ok=True)
+    index = []
+    names = []
+    n_shards = 0
+
+    for folder in folders:
+        reader = ShardReader(folder)
+        folder_index = reader.index.copy()
+        folder_index['shard'] += n_shards
+
+        shard = 0
+        while os.path.isfile(get_shard_path(folder, shard)):
+            os.replace(get_shard_path(folder, shard), get_shard_path(out_folder, n_shards + shard))
+            shard += 1
+
+        index.append(folder_index)
+        names.extend(reader.names)
+        n_shards += shard
+
+    index = np.concatenate(index) if index else np.empty(0, dtype=index_dtype)
+    np.save(os.path.join(out_folder, 'index.npy'), index)
+    with open(os.path.join(out_folder, 'names.json'), 'w', encoding='utf-8') as f:
+        json.dump(names, f, indent=1)
+
+    return len(index)
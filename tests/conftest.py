@@ -0,0 +1,28 @@
+"""
+Shared fixtures of the tests, the modules of the repository are imported from its root folder.
+"""
+
+import os
+import shutil
+import sys
+import pytest
+
+root_folder = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root_folder)
+
+examples_folder = os.path.join(root_folder, 'examples')
+
+@pytest.fixture
+def corpus(tmp_path):
+    """
+    Returns a function copying example scores to an input folder, as (example name, copy name) pairs
+    """
+    folder = tmp_path / 'input'
+    folder.mkdir()
+
+    def copy(*names):
+        for name, copy_name in names:
+            shutil.copy(os.path.join(examples_folder, name), folder / copy_name)
+        return str(folder)
+
+    return copy
@@ -0,0 +1,49 @@
+import os
+from corpus_index import CorpusIndex, metadata_columns
+from batch_convert import convert_xml_to_mid, merge_shards
+from discovery import shard_path
+from shards import ShardReader
+
+def metadata(tonic='C', mode='major'):
+    values = {column: 0 for column in metadata_columns}
+    values.update(tonic=tonic, mode=mode, beats=4, beat_type=4, chord_kinds=['major'])
+    return values
+
+def test_merge_offsets_the_song_ids(tmp_path):
+    paths = [str(tmp_path / name) for name in ['first.sqlite', 'second.sqlite', 'merged.sqlite']]
+
+    with CorpusIndex(paths[0]) as index:
+        index.add('a.xml', [], metadata(), 0)
+        index.add('b.xml', [], metadata(mode='minor'), 1)
+    with CorpusIndex(paths[1]) as index:
+        index.add('c.xml', [], metadata(), 0)
+        index.add('d.xml', ['d.mid'], metadata(), None)
+
+    with CorpusIndex(paths[2]) as index:
+        index.merge(paths[0], 0)
+        index.merge(paths[1], 2)
+
+        assert {song['file']: song['song_id'] for song in index.select()} == {'a.xml': 0, 'b.xml': 1, 'c.xml': 2, 'd.xml': None}
+        assert index.query(mode='major') == [0, 2, 'd.mid']
+        assert index.chord_kind_counts() == {'major': 4}
+
+def test_merged_shards_index_points_to_the_merged_dataset(tmp_path, corpus):
+    input_folder = corpus(*[('test.xml', f'song_{i}.xml') for i in range(8)])
+    shards_folder = str(tmp_path / 'shards')
+    index_path = str(tmp_path / 'index.sqlite')
+
+    for i in range(2):
+        convert_xml_to_mid(input_folder, None, shards_folder=shards_folder, index_path=index_path, shard=(i, 2))
+
+    # both shards have songs, otherwise the offsets are not checked
+    assert all(len(ShardReader(shard_path(shards_folder, (i, 2)))) for i in range(2))
+
+    assert merge_shards(2, None, shards_folder, index_path=index_path) == []
+
+    reader = ShardReader(shards_folder)
+    with CorpusIndex(index_path) as index:
+        songs = index.select()
+
+    assert len(songs) == len(reader) == 8
+    for song in songs:
+        assert reader.names[song['song_id']] == os.path.splitext(os.path.basename(song['file']))[0]
@@ -0,0 +1,41 @@
+import json
+import os
+from conftest import examples_folder
+from dedup import LSHIndex, fingerprint, similarity
+from score_to_midi import parse_score
+
+def tracks(name):
+    song = parse_score(os.path.join(examples_folder, name))
+    return song['melody'], song['harmony']
+
+def test_transposed_copy_is_a_duplicate():
+    melody, harmony = tracks('test.xml')
+    transposed = [melody.copy(), harmony.copy()]
+    for track in transposed:
+        track[:, 2] += 5
+
+    index = LSHIndex(0.8)
+    index.add('test.xml', fingerprint(melody, harmony))
+    index.add('transposed.xml', fingerprint(*transposed))
+    index.add('debussy.xml', fingerprint(*tracks('debussy.xml')))
+
+    assert index.clusters() == [['test.xml', 'transposed.xml']]
+
+def test_different_songs_are_not_duplicates():
+    index = LSHIndex(0.8)
+    for name in ['test.xml', 'debussy.xml', 'armstrong.xml', 'South American Way.xml']:
+        index.add(name, fingerprint(*tracks(name)))
+
+    assert index.clusters() == []
+
+def test_signatures_loaded_from_json():
+    # the manifest stores the signatures as lists of ints
+    signature = fingerprint(*tracks('test.xml'))
+    loaded = json.loads(json.dumps([int(value) for value in signature]))
+
+    index = LSHIndex(0.8)
+    index.add('a.xml', signature)
+    index.add('b.xml', loaded)
+
+    assert similarity(signature, loaded) == 1.0
+    assert index.clusters() == [['a.xml', 'b.xml']]
@@ -0,0 +1,41 @@
+import os
+import pytest
+from discovery import iter_files, parse_shard, shard_of, shard_path
+
+def make_corpus(folder):
+    names = [f'song_{i}.xml' for i in range(20)] + ['notes.txt', os.path.join('sub', 'deep.mxl')]
+    os.makedirs(os.path.join(folder, 'sub'))
+    for name in names:
+        with open(os.path.join(folder, name), 'w') as f:
+            f.write(name)
+
+def test_shard_of_is_stable():
+    assert 0 <= shard_of('song.xml', 4) < 4
+    assert shard_of(os.path.join('sub', 'song.xml'), 7) == shard_of(os.path.join('sub', 'song.xml'), 7)
+    # the separator of the platform does not change the shard
+    assert shard_of(os.path.join('sub', 'song.xml'), 7) == shard_of('sub/song.xml', 7)
+    assert shard_of('song.xml', 1) == 0
+
+def test_shards_split_the_corpus(tmp_path):
+    make_corpus(str(tmp_path))
+    everything = set(iter_files(str(tmp_path), ('.xml', '.mxl'), recursive=True))
+    shards = [set(iter_files(str(tmp_path), ('.xml', '.mxl'), recursive=True, shard=(i, 3))) for i in range(3)]
+
+    assert len(everything) == 21
+    assert set.union(*shards) == everything
+    assert sum(len(shard) for shard in shards) == len(everything)
+
+def test_sub_folders_are_only_read_if_recursive(tmp_path):
+    make_corpus(str(tmp_path))
+
+    assert len(list(iter_files(str(tmp_path), ('.xml', '.mxl')))) == 20
+    assert os.path.join(str(tmp_path), 'sub', 'deep.mxl') in iter_files(str(tmp_path), ('.mxl',), recursive=True)
+
+def test_parse_shard():
+    assert parse_shard('1/4') == (1, 4)
+    for text in ['4/4', '-1/4', '1', 'a/b']:
+        with pytest.raises(NameError):
+            parse_shard(text)
+
+def test_shard_path():
+    assert shard_path(os.path.join('runs', 'metrics.jsonl'), (0, 4)) == os.path.join('runs', 'metrics.shard-0-of-4.jsonl')
@@ -0,0 +1,85 @@
+import json
+from manifest import Manifest, Quarantine, file_hash
+
+settings = {'output_folder': 'out', 'augment_steps': [1, 2]}
+
+def outcome(success=True, category=None, outputs=(), chord=None):
+    return {'outputs': list(outputs), 'success': success, 'error': None if success else 'error', 'category': category,
+        'chord': chord}
+
+def test_successful_entry_is_reused_while_its_outputs_exist(tmp_path):
+    out_file = tmp_path / 'song.mid'
+    out_file.write_bytes(b'MThd')
+    manifest = Manifest(str(tmp_path / 'manifest.json'), '1-abc')
+    manifest.record('song.xml', 'h1', settings, outcome(outputs=[str(out_file)]))
+
+    assert manifest.lookup('song.xml', 'h1', settings) is not None
+
+    out_file.unlink()
+    assert manifest.lookup('song.xml', 'h1', settings) is None
+
+def test_entry_is_outdated_by_content_version_and_settings(tmp_path):
+    manifest = Manifest(str(tmp_path / 'manifest.json'), '1-abc')
+    manifest.record('song.xml', 'h1', settings, outcome(False, 'unknown_chord', chord='weird'))
+
+    assert manifest.lookup('song.xml', 'h1', settings)['chord'] == 'weird'
+    assert manifest.lookup('song.xml', 'h2', settings) is None
+    assert manifest.lookup('song.xml', 'h1', dict(settings, melody_part='first')) is None
+    assert Manifest(manifest.path, '2-abc').lookup('song.xml', 'h1', settings) is None
+
+def test_only_failures_caused_by_the_content_are_cached(tmp_path):
+    manifest = Manifest(str(tmp_path / 'manifest.json'), '1-abc')
+
+    for category in Manifest.cached_categories:
+        manifest.record('song.xml', 'h1', settings, outcome(False, category))
+        assert manifest.lookup('song.xml', 'h1', settings) is not None, category
+
+    for category in ['io_error', 'memory', 'timeout', 'crashed', 'other']:
+        manifest.record('song.xml', 'h1', settings, outcome(False, category))
+        assert manifest.lookup('song.xml', 'h1', settings) is None, category
+
+def test_save_and_load(tmp_path):
+    path = str(tmp_path / 'manifest.json')
+    manifest = Manifest(path, '1-abc')
+    manifest.record('song.xml', 'h1', settings, outcome(False, 'no_harmony'))
+    manifest.record_signature('h1', 'harmony', None)
+    manifest.record_signature('h2', 'harmony', [1, 2, 3])
+    manifest.save()
+
+    loaded = Manifest(path, '1-abc')
+    # the settings are compared as stored in json (the tuples become lists)
+    assert loaded.lookup('song.xml', 'h1', dict(settings, augment_steps=(1, 2)))['category'] == 'no_harmony'
+    assert loaded.lookup_signature('h2', 'harmony')['signature'] == [1, 2, 3]
+    assert loaded.lookup_signature('h2', 'first') is None
+
+    loaded.prune_signatures(['h2'])
+    assert loaded.lookup_signature('h1', 'harmony') is None
+    assert loaded.lookup_signature('h2', 'harmony') is not None
+
+def test_load_manifest_without_signatures(tmp_path):
+    path = tmp_path / 'manifest.json'
+    manifest = Manifest(str(path), '1-abc')
+    manifest.record('song.xml', 'h1', settings, outcome(False, 'parse_error'))
+    path.write_text(json.dumps(manifest.entries))
+
+    loaded = Manifest(str(path), '1-abc')
+    assert loaded.lookup('song.xml', 'h1', settings) is not None
+    assert loaded.signatures == {}
+
+def test_quarantine(tmp_path):
+    score = tmp_path / 'song.xml'
+    score.write_bytes(b'<score-partwise/>')
+    path = str(tmp_path / 'quarantine.json')
+    quarantine = Quarantine(path)
+
+    assert not quarantine.add(str(score), outcome(False, 'unknown_chord'))
+    assert not quarantine.add(str(score), outcome())
+    assert quarantine.add(str(score), outcome(False, 'timeout'))
+    quarantine.save()
+
+    loaded = Quarantine(path)
+    assert loaded.lookup(str(score)) == {'hash': file_hash(str(score)), 'category': 'timeout', 'error': 'error'}
+
+    # a changed file is converted again
+    score.write_bytes(b'<score-partwise version="3.1"/>')
+    assert loaded.lookup(str(score)) is None
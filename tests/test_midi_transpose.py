@@ -0,0 +1,68 @@
+import os
+import numpy as np
+import pytest
+from conftest import examples_folder
+from midi_transpose import key_positions, transpose_midi, transpose_variants
+
+def chunk(name, content):
+    return name + len(content).to_bytes(4, 'big') + content
+
+first_track = bytes([
+    0x00, 0xff, 0x51, 0x03, 0x07, 0xa1, 0x20, # tempo
+    0x00, 0xf0, 0x03, 0x43, 0x12, 0xf7, # sysex
+    0x00, 0x90, 0x3c, 0x64, # note on
+    0x00, 0x3e, 0x64, # note on, running status
+    0x60, 0x80, 0x3c, 0x00, # note off
+    0x00, 0x3e, 0x00, # note off, running status
+    0x00, 0x99, 0x24, 0x64, # note on, drum channel
+    0x00, 0xc0, 0x05, # program change, one data byte
+    0x00, 0xff, 0x2f, 0x00, # end of track
+])
+second_track = bytes([
+    0x00, 0x91, 0x40, 0x64,
+    0x10, 0x40, 0x00, # note on with velocity 0, running status
+    0x00, 0xff, 0x2f, 0x00,
+])
+midi = (chunk(b'MThd', bytes([0, 1, 0, 2, 0x01, 0xe0])) + chunk(b'MTrk', first_track)
+    + chunk(b'XFIH', b'\x3c\x3c') + chunk(b'MTrk', second_track))
+
+def keys(data, positions):
+    return np.frombuffer(data, dtype=np.uint8)[positions].tolist()
+
+def test_key_positions_with_running_status():
+    assert keys(midi, key_positions(midi)) == [0x3c, 0x3e, 0x3c, 0x3e, 0x40, 0x40]
+    assert keys(midi, key_positions(midi, [1])) == [0x40, 0x40]
+
+def test_only_the_keys_are_transposed():
+    transposed = transpose_midi(midi, 2)
+    positions = key_positions(midi)
+
+    assert keys(transposed, positions) == [0x3e, 0x40, 0x3e, 0x40, 0x42, 0x42]
+    others = np.ones(len(midi), dtype=bool)
+    others[positions] = False
+    assert np.array_equal(np.frombuffer(transposed, dtype=np.uint8)[others], np.frombuffer(midi, dtype=np.uint8)[others])
+
+def test_out_of_range_shifts():
+    with pytest.raises(NameError):
+        transpose_midi(midi, 100)
+
+    variants, rejected = transpose_variants(midi, [-1, 64])
+    assert list(variants) == [-1]
+    assert rejected == [64]
+
+def test_data_byte_without_status():
+    track = bytes([0x00, 0xff, 0x2f, 0x00, 0x00, 0x3c, 0x64])
+    with pytest.raises(NameError):
+        key_positions(chunk(b'MThd', bytes([0, 0, 0, 1, 0x01, 0xe0])) + chunk(b'MTrk', track))
+
+def test_transposed_example_is_read_by_pretty_midi(tmp_path):
+    pretty_midi = pytest.importorskip('pretty_midi')
+    with open(os.path.join(examples_folder, 'test.mid'), 'rb') as f:
+        data = f.read()
+    (tmp_path / 'transposed.mid').write_bytes(transpose_midi(data, -3))
+
+    original = pretty_midi.PrettyMIDI(os.path.join(examples_folder, 'test.mid'))
+    transposed = pretty_midi.PrettyMIDI(str(tmp_path / 'transposed.mid'))
+
+    for instrument, transposed_instrument in zip(original.instruments, transposed.instruments):
+        assert [note.pitch - 3 for note in instrument.notes] == [note.pitch for note in transposed_instrument.notes]
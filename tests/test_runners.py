@@ -0,0 +1,115 @@
+import multiprocessing
+import os
+import threading
+import time
+import pytest
+import batch_convert
+from batch_convert import convert_files, convert_files_pipelined, convert_files_isolated, convert_xml_to_mid
+
+fork_only = pytest.mark.skipif(multiprocessing.get_start_method() != 'fork',
+    reason='the patched conversion is only inherited by forked processes')
+
+def scores(corpus, n=6):
+    folder = corpus(*[('test.xml', f'song_{i}.xml') for i in range(n - 1)], ('elise.xml', 'misformed.xml'))
+    return sorted(os.path.join(folder, name) for name in os.listdir(folder))
+
+def summary(outcomes):
+    return sorted((os.path.basename(o['file']), o['success'], o['category'], [os.path.basename(p) for p in o['outputs']])
+        for o in outcomes)
+
+def output_folder(tmp_path, name='out'):
+    # the output folders are created by the caller of the runners
+    folder = tmp_path / name
+    folder.mkdir()
+    return str(folder)
+
+def run_with_timeout(function, timeout=60):
+    # a deadlocked runner fails the test instead of blocking the suite
+    result = []
+    thread = threading.Thread(target=lambda: result.append(list(function())), daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), 'the conversion did not end'
+    return result[0]
+
+def test_pipelined_gives_the_same_outcomes(tmp_path, corpus):
+    files = scores(corpus)
+    expected = summary(convert_files(files, output_folder=output_folder(tmp_path, 'reference')))
+
+    outcomes = run_with_timeout(lambda: convert_files_pipelined(files, 2, 1, 4, output_folder=output_folder(tmp_path)))
+
+    assert summary(outcomes) == expected
+    assert [o['file'] for o in outcomes] == files
+    assert sorted(os.listdir(tmp_path / 'out')) == sorted(os.listdir(tmp_path / 'reference'))
+
+def test_pipelined_with_less_prefetch_than_a_chunk_per_worker(tmp_path, corpus):
+    files = scores(corpus)
+
+    out = output_folder(tmp_path)
+
+    outcomes = run_with_timeout(lambda: convert_files_pipelined(files, 2, 4, 3, output_folder=out))
+
+    assert [o['success'] for o in outcomes] == ['misformed' not in o['file'] for o in outcomes]
+    assert len(os.listdir(out)) == 5
+
+def test_isolated_gives_the_same_outcomes(tmp_path, corpus):
+    files = scores(corpus)
+    expected = summary(convert_files(files, output_folder=output_folder(tmp_path, 'reference')))
+
+    assert summary(convert_files_isolated(files, 2, timeout=60, output_folder=output_folder(tmp_path))) == expected
+
+def hanging_conversion(in_file_path, output_folder=None, **options):
+    if 'song_0' in in_file_path:
+        with open(os.path.join(output_folder, 'song_0.mid.tmp'), 'wb') as f:
+            f.write(b'partial')
+        time.sleep(60)
+    if 'song_1' in in_file_path:
+        os._exit(3)
+
+    return {'file': in_file_path, 'outputs': [], 'success': True, 'error': None, 'category': None, 'chord': None,
+        'cached': False}
+
+@fork_only
+def test_isolated_timeout_and_crash(tmp_path, corpus, monkeypatch):
+    monkeypatch.setattr(batch_convert, 'convert_file', hanging_conversion)
+    files = scores(corpus, 3)
+    out = output_folder(tmp_path)
+
+    outcomes = {os.path.basename(o['file']): o for o in convert_files_isolated(files, 3, timeout=2, output_folder=out)}
+
+    assert outcomes['song_0.xml']['category'] == 'timeout'
+    assert outcomes['song_1.xml']['category'] == 'crashed'
+    assert outcomes['misformed.xml']['success']
+    # the partial file of the killed conversion is removed
+    assert os.listdir(out) == []
+
+def test_transient_failures_are_retried(tmp_path, corpus, monkeypatch):
+    input_folder = corpus(('test.xml', 'song.xml'), ('elise.xml', 'misformed.xml'))
+    out = output_folder(tmp_path)
+
+    def unreadable(*args, **kwargs):
+        raise OSError('Input/output error')
+
+    monkeypatch.setattr(batch_convert, 'score_to_midi', unreadable)
+    first = convert_xml_to_mid(input_folder, out, incremental=True)
+    assert {o['category'] for o in first} == {'io_error'}
+
+    monkeypatch.undo()
+    second = {os.path.basename(o['file']): o for o in convert_xml_to_mid(input_folder, out, incremental=True)}
+    assert not second['song.xml']['cached'] and second['song.xml']['success']
+    assert not second['misformed.xml']['cached'] and second['misformed.xml']['category'] == 'misformed_xml'
+
+    # the failure caused by the content of the file is not retried
+    third = {os.path.basename(o['file']): o for o in convert_xml_to_mid(input_folder, out, incremental=True)}
+    assert third['song.xml']['cached'] and third['misformed.xml']['cached']
+
+def test_mxl_with_the_name_of_an_xml_score_is_reported(tmp_path, corpus):
+    input_folder = corpus(('test.xml', 'song.xml'), ('debussy.xml', 'other.xml'))
+    os.rename(os.path.join(input_folder, 'other.xml'), os.path.join(input_folder, 'song.mxl'))
+    out = output_folder(tmp_path)
+
+    outcomes = {os.path.basename(o['file']): o for o in convert_xml_to_mid(input_folder, out)}
+
+    assert outcomes['song.xml']['success']
+    assert outcomes['song.mxl']['category'] == 'name_collision'
+    assert os.listdir(out) == ['song.mid']
@@ -0,0 +1,48 @@
+import numpy as np
+from shards import ShardWriter, ShardReader, merge_datasets, get_shard_path, note_dtype
+
+def song(n, pitch):
+    return np.array([[i, i + 1, pitch + i] for i in range(n)], dtype=np.float64).reshape(-1, 3)
+
+def assert_notes(records, notes):
+    assert np.array_equal(np.stack([records['start'], records['end'], records['pitch']], axis=1), notes)
+
+def write_dataset(folder, songs, shard_size=1 << 28):
+    with ShardWriter(str(folder), shard_size) as writer:
+        return [writer.append(name, melody, harmony) for name, melody, harmony in songs]
+
+def test_songs_are_read_back_by_id(tmp_path):
+    songs = [('a', song(3, 60), song(2, 48)), ('b', song(0, 0), song(4, 50)), ('c', song(5, 70), song(0, 0))]
+    # at most 4 notes per shard, every song starts a new shard
+    ids = write_dataset(tmp_path, songs, shard_size=4 * note_dtype.itemsize)
+
+    reader = ShardReader(str(tmp_path))
+    assert ids == [0, 1, 2]
+    assert len(reader) == 3
+    assert reader.names == ['a', 'b', 'c']
+    assert reader.index['shard'].tolist() == [0, 1, 2]
+
+    for song_id, (_, melody, harmony) in enumerate(songs):
+        reader_melody, reader_harmony = reader[song_id]
+        assert_notes(reader_melody, melody)
+        assert_notes(reader_harmony, harmony)
+
+def test_merge_datasets(tmp_path):
+    first = [('a', song(3, 60), song(2, 48)), ('b', song(2, 62), song(1, 50))]
+    second = [('c', song(1, 64), song(3, 52))]
+    write_dataset(tmp_path / 'first', first, shard_size=5 * note_dtype.itemsize)
+    write_dataset(tmp_path / 'second', second)
+
+    n_songs = merge_datasets([str(tmp_path / 'first'), str(tmp_path / 'second')], str(tmp_path / 'merged'))
+
+    reader = ShardReader(str(tmp_path / 'merged'))
+    assert n_songs == len(reader) == 3
+    assert reader.names == ['a', 'b', 'c']
+    # the shards of the second dataset follow the ones of the first dataset
+    assert reader.index['shard'].tolist() == [0, 1, 2]
+    assert not (tmp_path / 'first' / get_shard_path('', 0)).exists()
+
+    for song_id, (_, melody, harmony) in enumerate(first + second):
+        reader_melody, reader_harmony = reader[song_id]
+        assert_notes(reader_melody, melody)
+        assert_notes(reader_harmony, harmony)
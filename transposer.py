@@ -4,75 +4,185 @@ Converts all the midi in a folder to C major or A minor
 Original by: https://gist.github.com/aldous-rey/68c6c43450517aa47474
 """
 
-import glob
 import os
-import music21
+import itertools
+import numpy as np
 import pretty_midi
 from tqdm import tqdm
+from key_detection import pitch_class_histogram, estimate_keys, get_half_steps
+from midi_transpose import transpose_midi, transpose_variants
+from discovery import iter_files
+from score_to_midi import write_file
 
-# conversions dict
-majors = dict([
-    ("G#", 4),("A", 3),("A#", 2),("B", 1),("C", 0),("C#", -1),("D", -2),("D#", -3),("E", -4),("F", -5),("F#", 6),("G", 5),
-    ("A-", 4),("A", 3),("B-", 2),("B", 1),("C", 0),("D-", -1),("D", -2),("E-", -3),("E", -4),("F", -5),("G-", 6),("G", 5)  
-])
-minors = dict([
-    ("G#", 1),("A", 0),("A#", -1),("B", -2),("C", -3),("C#", -4),("D", -5),("D#", 6),("E", 5),("F", 4),("F#", 3),("G", 2),
-    ("A-", 1),("A", 0),("B-", -1),("B", -2),("C", -3),("D-", -4),("D", -5),("E-", 6),("E", 5),("F", 4),("G-", 3),("G", 2)
-])
-
-def transpose_file(midi_file_in, midi_file_out, half_steps):
-    out = {}
-
-    # read input
-    midi_data = pretty_midi.PrettyMIDI(midi_file_in)
-
-    for c, instrument in enumerate(midi_data.instruments):
-        out[c] = []
-        for note in instrument.notes:
-            note_pitch = note.pitch + half_steps
-            note_start = note.start
-            note_end = note.end
-
-            temp_note = [note_start, note_end, note_pitch]
-            out[c].append(temp_note)
-    
-    # write out
-    out_midi = pretty_midi.PrettyMIDI()
-    piano_program = pretty_midi.instrument_name_to_program('Acoustic grand piano')
-    
-    for c in out.keys():
-        piano = pretty_midi.Instrument(program=piano_program)
-        current_midi_track = out[c]
-        
-        for note in current_midi_track:
-            pretty_midi_note = pretty_midi.Note(velocity=127, pitch=note[2], start=note[0], end=note[1])
-            piano.notes.append(pretty_midi_note)
-
-        out_midi.instruments.append(piano)
-    
-    out_midi.write(midi_file_out)
-
-def convert_folder(in_folder, out_folder):
-    files_list = glob.glob(os.path.join(in_folder, '*.mid'))
-
-    for file in tqdm(files_list[:15], desc='Transposing to C major / A minor'):
-        score = music21.converter.parse(file)
-
-        try:
-            key = score.analyze('key')
-            if key.mode == "major":
-                half_steps = majors[key.tonic.name]
-            elif key.mode == "minor":
-                half_steps = minors[key.tonic.name]
-
-            out_file_path = os.path.join(out_folder, os.path.basename(file))
-            transpose_file(file, out_file_path, half_steps) # an alternative would be to use music21.transpose but unfortunately it is bugged
-
-            new_score = music21.converter.parse(out_file_path)
-            key = new_score.analyze('key')
-            assert (key.tonic.name == 'C' or key.tonic.name == 'A') and (key.mode == 'major' or key.mode == 'minor'), f'Conversion failed: {key.tonic.name} {key.mode}'
-        except Exception as e:
-            print(e)
+def transpose_file(midi_file_in, midi_file_out, half_steps, tracks=None):
+    """
+    Transposes the notes of a midi file, only their key bytes are rewritten (see midi_transpose.py)
+
+    Parameters
+    ----------
+    midi_file_in : str
+        The path to the midi file
+    midi_file_out : str
+        The path to the transposed midi file
+    half_steps : int
+        The transposition
+    tracks : list (default: None)
+        The indexes of the tracks to transpose (e.g. [midi_transpose.harmony_track]), None for all the tracks
+    """
+    with open(midi_file_in, 'rb') as f:
+        data = f.read()
+
+    write_file(midi_file_out, transpose_midi(data, half_steps, tracks))
+
+def transpose_files(files_list, out_folder, shifts=range(-5, 7), tracks=None):
+    """
+    Writes every midi file transposed by several shifts (name_+2.mid, name_-3.mid, ...)
+
+    Parameters
+    ----------
+    files_list : iterable
+        The paths to the midi files
+    out_folder : str
+        The folder of the transposed files
+    shifts : list (default: range(-5, 7), all the 12 keys)
+        The transpositions in half steps
+    tracks : list (default: None)
+        The indexes of the tracks to transpose, None for all the tracks
+
+    Returns
+    -------
+    dict
+        The shifts moving keys out of the midi range (not written), by file, for the files having some
+    """
+    out_of_range = {}
+
+    for file in tqdm(files_list, desc='Transposing to all the shifts'):
+        with open(file, 'rb') as f:
+            variants, rejected = transpose_variants(f.read(), shifts, tracks)
+
+        name = os.path.splitext(os.path.basename(file))[0]
+        for half_steps, data in variants.items():
+            write_file(os.path.join(out_folder, f'{name}_{half_steps:+d}.mid'), data)
+
+        if rejected:
+            out_of_range[file] = rejected
+
+    return out_of_range
+
+def read_notes(midi_file):
+    """
+    Reads the notes of all the tracks of a midi file
+
+    Parameters
+    ----------
+    midi_file : str
+        The path to the midi file
+
+    Returns
+    -------
+    list
+        The tracks, each one being a (n, 3) array of [start, end, pitch] notes
+    """
+    midi_data = pretty_midi.PrettyMIDI(midi_file)
+
+    return [np.array([[note.start, note.end, note.pitch] for note in instrument.notes], dtype=np.float64).reshape(-1, 3)
+        for instrument in midi_data.instruments]
+
+# number of files whose keys are estimated with a single matrix product by convert_folder
+key_batch_size = 1024
+
+def read_histogram(midi_file):
+    """
+    Reads the pitch class histogram of all the tracks of a midi file
+
+    Parameters
+    ----------
+    midi_file : str
+        The path to the midi file
+
+    Returns
+    -------
+    np.ndarray
+        The histogram of the 12 pitch classes
+    """
+    return pitch_class_histogram(np.concatenate(read_notes(midi_file) + [np.empty((0, 3))]))
+
+def analyze_keys(files_list):
+    """
+    Estimates the keys of midi files with a single matrix product (see key_detection.estimate_keys)
+
+    Parameters
+    ----------
+    files_list : list
+        The paths to the midi files
+
+    Returns
+    -------
+    list
+        The keys as (tonic, mode, correlation coefficient), None for the files without notes
+    np.ndarray
+        The (n, 12) pitch class histograms of the files
+    """
+    histograms = np.zeros((len(files_list), 12))
+
+    for i, file in enumerate(tqdm(files_list, desc='Reading pitch class histograms')):
+        histograms[i] = read_histogram(file)
+
+    return estimate_keys(histograms), histograms
+
+def check_transposed(midi_files):
+    """
+    Checks that transposed midi files are in C major or A minor, their keys being estimated
+    again on the written files with a single matrix product (see key_detection.estimate_keys)
+
+    Parameters
+    ----------
+    midi_files : list
+        The paths to the transposed midi files
+
+    Returns
+    -------
+    list
+        The files which are not in C major or A minor, as (file, key), the key being None for the files without notes
+    """
+    if not midi_files:
+        return []
+
+    keys = estimate_keys(np.array([read_histogram(file) for file in midi_files]))
+
+    return [(file, key) for file, key in zip(midi_files, keys) if key is None or key[:2] not in [('C', 'major'), ('A', 'minor')]]
+
+def convert_folder(in_folder, out_folder, files_list=None, recursive=False, shard=None, tracks=None):
+    files = iter_files(in_folder, ('.mid',), recursive, shard) if files_list is None else iter(files_list)
+
+    # the files are streamed, their keys are estimated by batches of key_batch_size files
+    with tqdm(total=None if files_list is None else len(files_list), desc='Transposing to C major / A minor') as progress_bar:
+        for batch in iter(lambda: list(itertools.islice(files, key_batch_size)), []):
+            keys = estimate_keys(np.array([read_histogram(file) for file in batch]))
+
+            written = []
+
+            for file, key in zip(batch, keys):
+                progress_bar.update()
+                try:
+                    if key is None:
+                        raise NameError(f'Key can not be estimated, no notes in {file}')
+
+                    tonic, mode, _ = key
+                    half_steps = get_half_steps(tonic, mode)
+
+                    out_file_path = os.path.join(out_folder, os.path.relpath(file, in_folder) if recursive else os.path.basename(file))
+                    if recursive:
+                        os.makedirs(os.path.dirname(out_file_path), exist_ok=True)
+                    transpose_file(file, out_file_path, half_steps, tracks) # an alternative would be to use music21.transpose but unfortunately it is bugged
+                    written.append(out_file_path)
+                except Exception as e:
+                    print(e)
+
+            # the key of the whole file is only moved to C major / A minor if all the tracks are transposed
+            if tracks is None:
+                for out_file_path, key in check_transposed(written):
+                    print(f'Conversion failed: {out_file_path} is in {key[0]} {key[1]}' if key else f'Conversion failed: no notes in {out_file_path}')
 
 if __name__ == '__main__':
     output_folder = '../dataset/wikifonia/output/'
@@ -0,0 +1,440 @@
+"""
+Checks the conversion of the example scores.
+
+- parity: the parsing engines (see score_to_midi.engines) must produce identical
+  keys and note lists, or raise the same error
+- keys: the batched key estimation (see key_detection.estimate_keys) must agree
+  with music21's analyze('key') on the converted midi files (skipped without music21)
+- prescan: the chord kinds pre-scan (see prescan.py) must reject exactly the scores
+  whose conversion fails with an unknown chord, with the same kind
+- golden: the conversion must give exactly the stored notes, chords and key, and
+  the midi files (converted, transposed, and transposed by transposer.transpose_file)
+  must have the stored hashes, see --save-golden after an intended change
+- timings: the conversion and transposition must not be slower than the stored
+  baseline of this machine (skipped without baseline, see --save-timings)
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import numpy as np
+from score_to_midi import score_to_midi, engines, UnknownChordError
+from prescan import scan_score
+from key_detection import pitch_class_names
+from key_detection import get_half_steps
+from transposer import analyze_keys, transpose_file
+from benchmark import time_best, compare
+
+examples_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'examples')
+golden_path = os.path.join(examples_folder, 'golden.json')
+
+# timings are specific to a machine, the baseline is not versioned
+timings_path = os.path.join(examples_folder, 'timings.json')
+
+# unknown chord kind followed by another chord at the same time: the chord has no duration,
+# it is dropped by the conversion and must not be rejected by the scan
+zero_duration_chord_score = b'''<?xml version="1.0" encoding="UTF-8"?>
+<score-partwise><part-list><score-part id="P1"><part-name>Melody</part-name></score-part></part-list>
+<part id="P1"><measure number="1">
+<attributes><divisions>1</divisions><time><beats>4</beats><beat-type>4</beat-type></time></attributes>
+<harmony><root><root-step>D</root-step></root><kind>weird</kind></harmony>
+<harmony><root><root-step>C</root-step></root><kind>major</kind></harmony>
+<note><pitch><step>C</step><octave>4</octave></pitch><duration>4</duration></note>
+</measure></part></score-partwise>
+'''
+
+# unknown chord kind over a chord note and a backup: the chord ends with a duration,
+# the scan and the conversion must both reject the score
+unknown_chord_score = b'''<?xml version="1.0" encoding="UTF-8"?>
+<score-partwise><part-list><score-part id="P1"><part-name>Melody</part-name></score-part></part-list>
+<part id="P1"><measure number="1">
+<attributes><divisions>1</divisions><time><beats>4</beats><beat-type>4</beat-type></time></attributes>
+<harmony><root><root-step>C</root-step></root><kind>major</kind></harmony>
+<note><pitch><step>C</step><octave>4</octave></pitch><duration>2</duration></note>
+<harmony><root><root-step>D</root-step></root><kind>weird</kind></harmony>
+<note><pitch><step>D</step><octave>4</octave></pitch><duration>1</duration></note>
+<note><chord/><pitch><step>F</step><octave>4</octave></pitch><duration>1</duration></note>
+<backup><duration>1</duration></backup>
+<note><pitch><step>A</step><octave>3</octave></pitch><duration>2</duration><voice>2</voice></note>
+<harmony><root><root-step>G</root-step></root><kind>major</kind></harmony>
+<note><pitch><step>G</step><octave>4</octave></pitch><duration>1</duration></note>
+</measure></part></score-partwise>
+'''
+
+# named entity of the MusicXML DTD, which is never loaded: the engines must not fail on it
+named_entity_score = b'''<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE score-partwise PUBLIC "-//Recordare//DTD MusicXML 3.1 Partwise//EN" "http://www.musicxml.org/dtds/partwise.dtd">
+<score-partwise><part-list><score-part id="P1"><part-name>Caf&eacute;</part-name></score-part></part-list>
+<part id="P1"><measure number="1">
+<attributes><divisions>1</divisions><time><beats>4</beats><beat-type>4</beat-type></time></attributes>
+<harmony><root><root-step>C</root-step></root><kind>major</kind></harmony>
+<note><pitch><step>E</step><octave>4</octave></pitch><duration>4</duration></note>
+</measure></part></score-partwise>
+'''
+
+def convert_with_engine(score_path, engine):
+    """
+    Converts a score without writing any file
+
+    Parameters
+    ----------
+    score_path : str
+        The path to the MusicXML file
+    engine : str
+        The parsing engine
+
+    Returns
+    -------
+    dict
+        The key and the melody and harmony tracks, or the error raised by the conversion
+    """
+    try:
+        result = score_to_midi(score_path, None, verbose=False, engine=engine)
+    except Exception as e:
+        return {'error': f'{type(e).__name__}: {e}'}
+
+    return {'key': result['key'], 'tracks': result['tracks']}
+
+def same_conversion(a, b):
+    if 'error' in a or 'error' in b:
+        return a.get('error') == b.get('error')
+
+    return a['key'] == b['key'] and all(np.array_equal(x, y) for x, y in zip(a['tracks'], b['tracks']))
+
+def check_parity(files, reference='sax'):
+    """
+    Checks that every parsing engine gives the same conversion as the reference one,
+    on the files and on named_entity_score
+
+    Parameters
+    ----------
+    files : list
+        The paths to the MusicXML files
+    reference : str (default: 'sax')
+        The reference engine
+
+    Returns
+    -------
+    bool
+        True if all the engines agree on all the files
+    """
+    ok = True
+
+    with tempfile.TemporaryDirectory() as folder:
+        named_entity_path = os.path.join(folder, 'named_entity.xml')
+        with open(named_entity_path, 'wb') as out_file:
+            out_file.write(named_entity_score)
+
+        for f in list(files) + [named_entity_path]:
+            expected = convert_with_engine(f, reference)
+
+            for engine in engines:
+                if engine == reference:
+                    continue
+
+                same = same_conversion(expected, convert_with_engine(f, engine))
+                ok = ok and same
+                print(f'[{"OK" if same else "FAILED"}] parity {reference}/{engine}: {os.path.basename(f)}')
+
+    return ok
+
+def check_keys(files):
+    """
+    Checks that the batched key estimation agrees with music21 on the converted scores
+
+    Parameters
+    ----------
+    files : list
+        The paths to the MusicXML files
+
+    Returns
+    -------
+    bool
+        True if the keys agree on all the files which can be converted
+    """
+    try:
+        import music21
+    except ImportError:
+        print('[SKIPPED] keys: music21 is not installed')
+        return True
+
+    ok = True
+
+    with tempfile.TemporaryDirectory() as out_folder:
+        midi_files = []
+        for f in files:
+            midi_file = os.path.join(out_folder, os.path.splitext(os.path.basename(f))[0] + '.mid')
+            try:
+                score_to_midi(f, midi_file, verbose=False)
+            except Exception:
+                continue
+            midi_files.append(midi_file)
+
+        keys, _ = analyze_keys(midi_files)
+
+        for midi_file, key in zip(midi_files, keys):
+            expected = music21.converter.parse(midi_file).analyze('key')
+            expected_tonic = pitch_class_names[expected.tonic.pitchClass]
+
+            same = key is not None and (key[0], key[1]) == (expected_tonic, expected.mode)
+            ok = ok and same
+            print(f'[{"OK" if same else "FAILED"}] keys {key[:2] if key else None}/{(expected_tonic, expected.mode)}: {os.path.basename(midi_file)}')
+
+    return ok
+
+def check_prescan(files):
+    """
+    Checks that the pre-scan rejects exactly the scores failing with an unknown chord,
+    on the files, on zero_duration_chord_score and on unknown_chord_score
+
+    Parameters
+    ----------
+    files : list
+        The paths to the MusicXML files
+
+    Returns
+    -------
+    bool
+        True if the pre-scan agrees with the conversion on all the files
+    """
+    ok = True
+
+    with tempfile.TemporaryDirectory() as folder:
+        synthetic_paths = []
+        for name, score in [('zero_duration_chord.xml', zero_duration_chord_score), ('unknown_chord.xml', unknown_chord_score)]:
+            synthetic_paths.append(os.path.join(folder, name))
+            with open(synthetic_paths[-1], 'wb') as out_file:
+                out_file.write(score)
+
+        for f in list(files) + synthetic_paths:
+            ok = check_prescan_file(f) and ok
+
+    return ok
+
+def check_prescan_file(score_path):
+    """
+    Checks that the pre-scan of a score gives the unknown chord of its conversion, if any
+
+    Parameters
+    ----------
+    score_path : str
+        The path to the MusicXML file
+
+    Returns
+    -------
+    bool
+        True if the pre-scan agrees with the conversion
+    """
+    try:
+        score_to_midi(score_path, None, verbose=False)
+        expected = None
+    except UnknownChordError as e:
+        expected = e.kind
+    except Exception:
+        expected = None
+
+    scan = scan_score(score_path)
+    same = scan['chord'] == expected
+    print(f'[{"OK" if same else "FAILED"}] prescan {scan["status"]}: {os.path.basename(score_path)}')
+
+    return same
+
+def file_digest(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+def golden_conversion(score_path, out_folder):
+    """
+    Converts a score to the data compared to the golden data
+
+    Parameters
+    ----------
+    score_path : str
+        The path to the MusicXML file
+    out_folder : str
+        The folder of the temporary midi files
+
+    Returns
+    -------
+    dict
+        The key, time signature, length, melody and harmony notes, chords and the sha1 of the midi files,
+        or the error raised by the conversion
+    """
+    name = os.path.splitext(os.path.basename(score_path))[0]
+    out_path = os.path.join(out_folder, name + '.mid')
+    transposed_out_path = os.path.join(out_folder, name + '_transposed.mid')
+    transposer_out_path = os.path.join(out_folder, name + '_transposer.mid')
+
+    try:
+        result = score_to_midi(score_path, out_path, verbose=False, transposed_out_path=transposed_out_path)
+    except Exception as e:
+        return {'error': f'{type(e).__name__}: {e}'}
+
+    transpose_file(out_path, transposer_out_path, get_half_steps(*result['key']))
+
+    # through json, as stored (tuples become lists, floats are kept exactly)
+    return json.loads(json.dumps({
+        'key': result['key'],
+        'time_signature': result['time_signature'],
+        'length': result['length'],
+        'melody': result['tracks'][0].tolist(),
+        'harmony': result['tracks'][1].tolist(),
+        'chords': result['chords'],
+        'midi': file_digest(out_path),
+        'transposed': file_digest(transposed_out_path),
+        'transposer': file_digest(transposer_out_path)
+    }))
+
+def check_golden(files, path=golden_path, save=False):
+    """
+    Checks the conversion of the scores against the golden data
+
+    Parameters
+    ----------
+    files : list
+        The paths to the MusicXML files
+    path : str (default: golden_path)
+        The path to the golden data
+    save : boolean (default: False)
+        if true, the golden data are replaced by the current conversions
+
+    Returns
+    -------
+    bool
+        True if all the conversions are identical to the golden data
+    """
+    with tempfile.TemporaryDirectory() as out_folder:
+        conversions = {os.path.basename(f): golden_conversion(f, out_folder) for f in files}
+
+    if save:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(conversions, f, indent=1, sort_keys=True)
+        print(f'[SAVED] golden: {path}')
+        return True
+
+    if not os.path.isfile(path):
+        print(f'[FAILED] golden: {path} not found, create it with --save-golden')
+        return False
+
+    with open(path, 'r', encoding='utf-8') as f:
+        golden = json.load(f)
+
+    ok = True
+
+    for name, conversion in conversions.items():
+        expected = golden.get(name)
+        different = sorted(k for k in set(conversion) | set(expected or {}) if expected is None or conversion.get(k) != expected.get(k))
+
+        ok = ok and not different
+        print(f'[{"OK" if not different else "FAILED"}] golden: {name}' + (f' ({", ".join(different)})' if different else ''))
+
+    return ok
+
+def time_examples(files, repeat):
+    """
+    Times the conversion and the transposition of every score
+
+    Parameters
+    ----------
+    files : list
+        The paths to the MusicXML files
+    repeat : int
+        The number of runs (best is kept)
+
+    Returns
+    -------
+    dict
+        The best 'convert' and 'transpose_file' times in seconds, by score name
+    """
+    timings = {}
+
+    with tempfile.TemporaryDirectory() as out_folder:
+        out_path = os.path.join(out_folder, 'example.mid')
+        transposed_out_path = os.path.join(out_folder, 'example_transposed.mid')
+
+        for f in files:
+            try:
+                score_to_midi(f, out_path, verbose=False)
+            except Exception:
+                continue # the failure is checked by the golden data
+
+            name = os.path.basename(f)
+            timings[name] = {}
+            timings[name]['convert'], _ = time_best(lambda: score_to_midi(f, out_path, verbose=False), repeat)
+            timings[name]['transpose_file'], _ = time_best(lambda: transpose_file(out_path, transposed_out_path, 2), repeat)
+
+    return timings
+
+def check_timings(files, path=timings_path, save=False, repeat=20, threshold=0.5):
+    """
+    Checks that the scores are not converted nor transposed slower than the baseline
+
+    Parameters
+    ----------
+    files : list
+        The paths to the MusicXML files
+    path : str (default: timings_path)
+        The path to the baseline
+    save : boolean (default: False)
+        if true, the baseline is replaced by the current timings
+    repeat : int (default: 20)
+        The number of runs (best is kept)
+    threshold : float (default: 0.5)
+        The relative slowdown above which a timing fails
+
+    Returns
+    -------
+    bool
+        True if no timing is slower than the baseline
+    """
+    if not save and not os.path.isfile(path):
+        print(f'[SKIPPED] timings: no baseline for this machine, create it with --save-timings')
+        return True
+
+    timings = time_examples(files, repeat)
+
+    if save:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(timings, f, indent=4, sort_keys=True)
+        print(f'[SAVED] timings: {path}')
+        return True
+
+    with open(path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+
+    regressions = {(name, stage): (old_value, value) for name, stage, old_value, value in compare(timings, baseline, threshold)}
+
+    for name, stages in timings.items():
+        for stage, value in stages.items():
+            old_value = baseline.get(name, {}).get(stage)
+            failed = (name, stage) in regressions
+            reference = f'{old_value * 1000:.2f} ms -> ' if old_value is not None else ''
+            print(f'[{"FAILED" if failed else "OK"}] timings {stage} {reference}{value * 1000:.2f} ms: {name}')
+
+    return not regressions
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Check the conversion of the example scores')
+    parser.add_argument('--folder', default=examples_folder, help='folder containing the .xml scores')
+    parser.add_argument('--golden', default=golden_path, help='path to the golden data')
+    parser.add_argument('--save-golden', action='store_true', help='replace the golden data by the current conversions')
+    parser.add_argument('--timings', default=timings_path, help='path to the timing baseline of this machine')
+    parser.add_argument('--save-timings', action='store_true', help='replace the timing baseline by the current timings')
+    parser.add_argument('--repeat', type=int, default=20, help='number of timed runs per score (best is kept)')
+    parser.add_argument('--threshold', type=float, default=0.5, help='relative slowdown failing a timing')
+    args = parser.parse_args()
+
+    files = sorted(glob.glob(os.path.join(args.folder, '*.xml')))
+
+    ok = check_parity(files)
+    ok = check_keys(files) and ok
+    ok = check_prescan(files) and ok
+    ok = check_golden(files, args.golden, args.save_golden) and ok
+    ok = check_timings(files, args.timings, args.save_timings, args.repeat, args.threshold) and ok
+
+    if not ok:
+        sys.exit(1)